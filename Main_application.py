@@ -1,78 +1,358 @@
 import ttkbootstrap as tb
 from ttkbootstrap.constants import *
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import psycopg2
 
+import diagnostics
+from bulk_import import import_file
+from circulation import CirculationError, book_availability, member_status
+from db import SORT_COLUMNS, get_connection, close_pool, sorted_query, ChangeListener
+from export import export_query
+from lookups import NAME_COLUMNS, name_cache, prefix_cache, search_names
+from offline import MirrorSync, get_mirror, search_local_names
+from reports import REPORTS, REPORT_MAX_AGE_MINUTES, REPORT_ROWS, last_refreshed, refresh_reports, report_rows
+from repositories import RECENT_LOAN_DAYS, REPOSITORIES
+from search import SEARCH_LIMIT
+
+# --- اجرای کوئری‌ها در پس‌زمینه ---
+# تعداد thread ها باید از POOL_MAX_SIZE کمتر باشد تا pool خالی نشود
+DB_WORKERS = 4
+POLL_INTERVAL_MS = 20
+
+# --- صفحه‌بندی جدول ---
+# فقط پنجره‌ای از ردیف‌ها در Treeview نگه داشته می‌شود و با اسکرول صفحه‌های بعدی/قبلی خوانده می‌شوند
+PAGE_SIZE = 200
+PREFETCH_ROWS = 100
+MAX_LOADED_ROWS = 1000
+
+# --- جستجو هنگام تایپ ---
+SEARCH_DEBOUNCE_MS = 300
+MIN_LIVE_SEARCH_LENGTH = 2
+
+# --- تغییرات بقیه کلاینت‌ها ---
+CHANGES_POLL_MS = 200
+
+# --- نسخه محلی (offline.py) ---
+MIRROR_STATUS_MS = 1000
+
+# --- انتخاب کلید خارجی در فرم‌ها ---
+PICKER_DEBOUNCE_MS = 150
+
+# --- صفحه Diagnostics ---
+DIAGNOSTICS_REFRESH_MS = 1000
+DIAGNOSTICS_TOP_N = 20
+
+# --- میز امانت (بارکدخوان) ---
+# کارت عضو با پیشوند P خوانده می‌شود؛ بارکد کتاب عدد خالی یا با پیشوند B است
+PERSON_PREFIX = "P"
+BOOK_PREFIX = "B"
+
+# --- صفحه Reports ---
+# تا وقتی صفحه باز است هر چند وقت یک بار گزارش‌های قدیمی‌تر از REPORT_MAX_AGE_MINUTES تازه می‌شوند
+REPORTS_CHECK_MS = 60_000
+
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+
+class QueryJob:
+    """یک کار دیتابیسی که روی thread جدا اجرا می‌شود و قابل لغو است"""
+
+    def __init__(self, work, caller=None, mirror=None):
+        self.work = work
+        # نام صفحه/متد برای گزارش کوئری‌ها در صفحه Diagnostics
+        self.caller = caller
+        # اگر داده شود work با اتصال SQLite نسخه محلی اجرا می‌شود
+        self.mirror = mirror
+        self.future = None
+        self.cancelled = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        if self.cancelled:
+            return None
+        if self.mirror is not None:
+            # کوئری‌های نسخه محلی کوتاه هستند؛ لغو فقط نتیجه را دور می‌اندازد
+            with self.mirror.connect() as conn:
+                return self.work(conn)
+        with get_connection() as conn:
+            with self._lock:
+                if self.cancelled:
+                    return None
+                self._conn = conn
+            diagnostics.set_caller(self.caller)
+            try:
+                return self.work(conn)
+            finally:
+                diagnostics.set_caller(None)
+                # قبل از برگرداندن اتصال به pool، دیگر نباید cancel روی آن صدا زده شود
+                with self._lock:
+                    self._conn = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self.future is not None:
+                self.future.cancel()
+            if self._conn is not None:
+                try:
+                    self._conn.cancel()
+                except psycopg2.Error:
+                    pass
+
+
+def shutdown_executor():
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ForeignKeyPicker(tb.Combobox):
+    """Combobox برای کلید خارجی: نام تایپ می‌شود، پیشنهادها از جستجوی پیشوندی می‌آیند و get() همان id است
+
+    گزینه‌ها به شکل «نام (#id)» هستند؛ با کلید Down لیست پیشنهادها باز می‌شود. تایپ مستقیم id هم کار می‌کند.
+    """
+
+    _PICKED_ID = re.compile(r"\(#(\d+)\)$")
+
+    def __init__(self, parent, page, table):
+        super().__init__(parent)
+        self.page = page
+        self.table = table
+        self._lookup_after = None
+        self.bind("<KeyRelease>", self.on_typed)
+
+    def get(self):
+        text = super().get().strip()
+        match = self._PICKED_ID.search(text)
+        return match.group(1) if match else text
+
+    def set_item(self, item_id):
+        name = name_cache.get(self.table, int(item_id))
+        self.set(f"{name} (#{item_id})" if name is not None else str(item_id))
+
+    def on_typed(self, event):
+        if event.keysym in ("Up", "Down", "Return", "Escape", "Tab"):
+            return
+        if self._lookup_after is not None:
+            self.after_cancel(self._lookup_after)
+        self._lookup_after = self.after(PICKER_DEBOUNCE_MS, self.lookup)
+
+    def lookup(self):
+        self._lookup_after = None
+        text = super().get().strip()
+        if not text or self._PICKED_ID.search(text):
+            return
+        search = search_local_names if self.page.local_mirror() else search_names
+        self.page.run_in_background(lambda conn: search(conn, self.table, text), self.show_choices,
+                                    key=f"picker-{self.table}")
+
+    def show_choices(self, results):
+        self.configure(values=[f"{name} (#{item_id})" for item_id, name in results])
+
+
+# --- اجرای کوئری در پس‌زمینه ---
+class DBFrame(tb.Frame):
+    """پایه صفحه‌هایی که کوئری‌هایشان را روی thread دیتابیس اجرا می‌کنند؛ زیرکلاس busy_bar را می‌سازد"""
+
+    # صفحه‌ای که وقتی سرور در دسترس نیست یا کند است می‌تواند از نسخه محلی بخواند
+    offline_capable = False
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self._jobs = {}
+        self._busy = 0
+
+    def run_in_background(self, work, on_done, key=None, on_error=None):
+        """اجرای work(conn) روی thread دیتابیس و فرستادن نتیجه به on_done در thread رابط کاربری
 
-# --- اتصال به دیتابیس ---
-def connect_db():
-    try:
-        conn = psycopg2.connect(
-            dbname="DB NAME",
-            user="USERNAME",
-            password="PASSWORD",
-            host="HOST",
-            port="PORT"
-        )
-        return conn
-    except Exception as e:
-        messagebox.showerror("Database Error", str(e))
+        اگر key داده شود، درخواست قبلی با همان key (اگر هنوز تمام نشده) لغو می‌شود.
+        خطا به on_error داده می‌شود؛ بدون on_error با messagebox نمایش داده می‌شود.
+        """
+        self.cancel_job(key)
+        job = QueryJob(work, f"{type(self).__name__}.{sys._getframe(1).f_code.co_name}", self.local_mirror())
+        if key is not None:
+            self._jobs[key] = job
+        job.future = _executor.submit(job.run)
+        self._set_busy(1)
+        self.after(POLL_INTERVAL_MS, self._poll_job, job, key, on_done, on_error)
+
+    def cancel_job(self, key):
+        if key is not None and key in self._jobs:
+            self._jobs.pop(key).cancel()
+
+    def local_mirror(self):
+        """Mirror نسخه محلی اگر این صفحه الان باید از آن بخواند، وگرنه None"""
+        mirror = get_mirror()
+        if self.offline_capable and mirror is not None and mirror.active:
+            return mirror
         return None
 
+    def _poll_job(self, job, key, on_done, on_error):
+        if not job.future.done():
+            self.after(POLL_INTERVAL_MS, self._poll_job, job, key, on_done, on_error)
+            return
+        self._set_busy(-1)
+        if key is not None and self._jobs.get(key) is job:
+            del self._jobs[key]
+        if job.cancelled:
+            return
+        try:
+            result = job.future.result()
+        except Exception as e:
+            if isinstance(e, psycopg2.OperationalError):
+                # شاید ارتباط با سرور قطع شده؛ همگام‌سازی نسخه محلی زودتر وضعیت را بررسی می‌کند
+                self.winfo_toplevel().check_link()
+            if on_error is not None:
+                on_error(e)
+            else:
+                messagebox.showerror("Error", str(e))
+            return
+        on_done(result)
+
+    def _set_busy(self, delta):
+        self._busy += delta
+        if delta > 0 and self._busy == 1:
+            self.busy_bar.start(10)
+        elif self._busy == 0:
+            self.busy_bar.stop()
+
 
 # --- کلاس پایه CRUDFrame ---
-class CRUDFrame(tb.Frame):
-    def __init__(self, parent, title, columns, table_name):
+class CRUDFrame(DBFrame):
+    # نوع داده برای ورود گروهی از فایل (کلیدهای bulk_import.ENTITIES)؛ None یعنی صفحه Import ندارد
+    import_entity = None
+    # فیلدهای فرم که می‌توانند خالی بمانند (مقدار خالی NULL ذخیره می‌شود)
+    optional_fields = ()
+    offline_capable = True
+
+    def __init__(self, parent, title, columns, repository, name_headings=None):
         super().__init__(parent)
         self.title = title
+        # عنوان ستون‌ها به ترتیب repository.db_columns
         self.columns = columns
-        self.table_name = table_name
+        # همه خواندن و نوشتن‌های صفحه از طریق repositories.Repository جدول انجام می‌شود
+        self.repository = repository
+        self.table_name = repository.table
+        self.db_columns = repository.db_columns
+        # نام ستون هر مقدار ردیف در کوئری صفحه (برای مرتب‌سازی و فیلتر)
+        self.row_columns = repository.row_columns
+        # کلیدهای خارجی که به جای id نام رکورد را نشان می‌دهند: ستون -> (جدول، عنوان ستون نام)
+        name_headings = name_headings or {}
+        self.lookups = {column: (table, name_headings.get(column, table))
+                        for column, table in repository.lookups.items()}
         self.selected_item = None
+        self.sort_column = None
+        self.sort_descending = False
+        self.filters = {}
+        # ردیف‌های بارگذاری‌شده (repository.row_type با نوع‌های اصلی) با کلید id؛ Treeview فقط متن ستون‌های
+        # نمایش را دارد و فرم ویرایش، انتخاب و کلید صفحه‌بندی keyset از همین‌جا خوانده می‌شوند
+        self._rows = {}
+        self._filter_after = None
+        self._search_source = None
+        self._page_source = repository.source()
+        self._has_more_before = False
+        self._has_more_after = False
+        self._total_estimate = None
+        self._search_after = None
+        self._search_keyword = None
+        self._search_rows = None
+        self.loaded = False
         self.create_widgets()
-        self.refresh_table()
 
     def create_widgets(self):
         # عنوان صفحه
-        tb.Label(self, text=self.title, font=("Arial", 14, "bold")).pack(anchor="w", padx=10, pady=10)
+        self.title_label = tb.Label(self, text=self.title, font=("Arial", 14, "bold"))
+        self.title_label.pack(anchor="w", padx=10, pady=10)
 
         # فریم دکمه‌ها
-        btn_frame = tb.Frame(self)
+        btn_frame = self.btn_frame = tb.Frame(self)
         btn_frame.pack(fill=X, padx=10, pady=5)
 
         tb.Button(btn_frame, text="Add", bootstyle=SUCCESS, command=self.open_add_form).pack(side=LEFT, padx=5)
         tb.Button(btn_frame, text="Edit", bootstyle=INFO, command=self.open_edit_form).pack(side=LEFT, padx=5)
         tb.Button(btn_frame, text="Delete", bootstyle=DANGER, command=self.delete_item).pack(side=LEFT, padx=5)
+        tb.Button(btn_frame, text="Bulk Edit", bootstyle=INFO, command=self.open_bulk_edit).pack(side=LEFT, padx=5)
         tb.Button(btn_frame, text="Refresh", bootstyle=WARNING, command=self.refresh_table).pack(side=LEFT, padx=5)
+        if self.import_entity:
+            tb.Button(btn_frame, text="Import", bootstyle=SECONDARY, command=self.import_items).pack(side=LEFT, padx=5)
+        tb.Button(btn_frame, text="Export", bootstyle=SECONDARY, command=self.export_items).pack(side=LEFT, padx=5)
+
+        # نشانگر مشغول بودن (وقتی کوئری در پس‌زمینه در حال اجراست)
+        self.busy_bar = tb.Progressbar(btn_frame, mode="indeterminate", bootstyle="info-striped", length=120)
+        self.busy_bar.pack(side=RIGHT, padx=5)
+        self.status_label = tb.Label(btn_frame, text="")
+        self.status_label.pack(side=RIGHT, padx=5)
 
         # فرم ورودی
         self.form_frame = tb.Frame(self)
         self.form_frame.pack(fill=X, padx=10, pady=5)
         self.form_fields = {}
+        # کلیدهای خارجی به جای Entry با ForeignKeyPicker انتخاب می‌شوند
+        picker_tables = {self.columns[self.db_columns.index(column)]: table
+                         for column, (table, _) in self.lookups.items()}
 
         for i, col in enumerate(self.columns[1:]):  # ID رو نمی‌گذاریم توی فرم
             tb.Label(self.form_frame, text=f"{col}:", width=15).grid(row=i, column=0, sticky=W, padx=5, pady=2)
-            entry = tb.Entry(self.form_frame)
+            if col in picker_tables:
+                entry = ForeignKeyPicker(self.form_frame, self, picker_tables[col])
+            else:
+                entry = tb.Entry(self.form_frame)
             entry.grid(row=i, column=1, sticky=EW, padx=5, pady=2)
             self.form_fields[col] = entry
 
         tb.Button(self.form_frame, text="Submit", bootstyle=SUCCESS, command=self.submit_form).grid(
             row=len(self.columns), columnspan=2, pady=5)
 
+        # ستون‌های نمایش داده‌شده؛ ستون id کلید خارجی پنهان می‌ماند (برای فرم ویرایش) و نام آن جایش می‌آید
+        name_columns = tuple(heading for _, heading in self.lookups.values())
+        replaced = {self.columns[self.db_columns.index(column)]: heading
+                    for column, (_, heading) in self.lookups.items()}
+        display_columns = [replaced.get(col, col) for col in self.columns]
+        # عنوان ستون -> نام ستون در کوئری صفحه
+        self._heading_columns = dict(zip(self.columns + name_columns, self.row_columns))
+        # ستون‌هایی از ردیف که در Treeview نوشته می‌شوند
+        self._display_columns = tuple(self._heading_columns[heading] for heading in display_columns)
+
+        # فیلتر هر ستون (در دیتابیس با WHERE اعمال می‌شود)
+        self.filter_fields = {}
+        filter_frame = tb.Frame(self)
+        filter_frame.pack(fill=X, padx=10, pady=5)
+        tb.Label(filter_frame, text="Filter:", width=8).grid(row=1, column=0, sticky=W, padx=5)
+        for i, heading in enumerate(display_columns, start=1):
+            tb.Label(filter_frame, text=heading).grid(row=0, column=i, sticky=W, padx=2)
+            entry = tb.Entry(filter_frame, width=14)
+            entry.grid(row=1, column=i, sticky=EW, padx=2)
+            entry.bind("<KeyRelease>", self.on_filter_typed)
+            entry.bind("<Return>", lambda event: self.apply_filters())
+            self.filter_fields[self._heading_columns[heading]] = entry
+        tb.Button(filter_frame, text="✖", width=3, bootstyle=SECONDARY, command=self.clear_filters).grid(
+            row=1, column=len(display_columns) + 1, padx=2)
+
         # جدول داده
         table_frame = tb.Frame(self)
         table_frame.pack(fill=BOTH, expand=True, padx=10, pady=5)
 
-        self.tree = ttk.Treeview(table_frame, columns=self.columns, show="headings")
-        for col in self.columns:
-            self.tree.heading(col, text=col)
-            self.tree.column(col, width=100, anchor=W)
+        self.tree = ttk.Treeview(table_frame, columns=display_columns, show="headings")
+        # فقط ستون‌هایی که ایندکس مرتب‌سازی دارند با کلیک مرتب می‌شوند
+        sortable = ("id",) + SORT_COLUMNS.get(self.table_name, ())
+        for heading, column in zip(display_columns, self._display_columns):
+            self.tree.heading(heading, text=heading)
+            self.tree.column(heading, width=100, anchor=W)
+            if column in sortable:
+                self.tree.heading(heading, command=lambda column=column: self.sort_by(column))
         self.tree.pack(side=LEFT, fill=BOTH, expand=True)
 
-        vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
+        self.vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
         hsb = ttk.Scrollbar(table_frame, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-        vsb.pack(side=RIGHT, fill=Y)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll, xscrollcommand=hsb.set)
+        self.vsb.pack(side=RIGHT, fill=Y)
         hsb.pack(side=BOTTOM, fill=X)
 
         # جستجو
@@ -84,48 +364,298 @@ class CRUDFrame(tb.Frame):
         self.search_entry.pack(side=LEFT, fill=X, expand=True, padx=5)
         tb.Button(search_frame, text="🔍", width=3, bootstyle=INFO, command=self.on_search).pack(side=LEFT, padx=2)
         tb.Button(search_frame, text="✖", width=3, bootstyle=SECONDARY, command=self.clear_search).pack(side=LEFT, padx=2)
+        self.search_entry.bind("<KeyRelease>", self.on_search_typed)
+        self.search_entry.bind("<Return>", lambda event: self.on_search())
 
+        # با Ctrl/Shift چند ردیف انتخاب می‌شود؛ Delete و Bulk Edit روی همه آن‌ها اجرا می‌شوند
         self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.tree.bind("<Delete>", lambda event: self.delete_item())
+
+    def run_write(self, action):
+        """اجرای action(conn) (یک نوشتن از repository که ردیف کامل را برمی‌گرداند) در پس‌زمینه و
+        به‌روزرسانی فقط همان ردیف در جدول"""
+        def done(row):
+            if row is not None:
+                self.patch_row(row)
+                self.names_changed([row.id])
+            self.clear_form()
 
-    def load_from_db(self, query=None, params=None):
-        self.tree.delete(*self.tree.get_children())
-        conn = connect_db()
-        if not conn:
+        self.run_in_background(action, done)
+
+    @property
+    def repository(self):
+        """repository جدول؛ وقتی صفحه از نسخه محلی می‌خواند MirrorRepository همان جدول"""
+        mirror = self.local_mirror()
+        return mirror.repository(self._repository.table) if mirror else self._repository
+
+    @repository.setter
+    def repository(self, repository):
+        self._repository = repository
+
+    # --- نام کلیدهای خارجی ---
+    def remember_names(self, rows):
+        # نام‌هایی که با JOIN آمده‌اند در cache ذخیره می‌شوند تا ویرایش‌های بعدی کوئری اضافه نزنند
+        for offset, (column, (table, _)) in enumerate(self.lookups.items()):
+            index = self.db_columns.index(column)
+            for row in rows:
+                name = row[len(self.db_columns) + offset]
+                if name is not None:
+                    name_cache.put(table, row[index], name)
+
+    def names_changed(self, ids):
+        # نام این رکوردها ممکن است در صفحه‌های دیگر (مثلا Book-Authors) نمایش داده شود
+        if self.table_name in NAME_COLUMNS:
+            self.winfo_toplevel().names_changed(self.table_name, ids)
+
+    def refresh_names(self, table, ids):
+        """خواندن دوباره ردیف‌هایی از این صفحه که نام یکی از ids جدول table را نشان می‌دهند"""
+        columns = [column for column, (lookup_table, _) in self.lookups.items() if lookup_table == table]
+        if not columns:
             return
-        cur = conn.cursor()
-        try:
-            if query:
-                cur.execute(query, params or ())
-            else:
-                cur.execute(f"SELECT * FROM {self.table_name}")
-            rows = cur.fetchall()
+        ids = set(ids)
+        row_ids = [row.id for row in self._rows.values() if any(getattr(row, column) in ids for column in columns)]
+        if row_ids:
+            self.apply_changes(row_ids, ())
+
+    # --- ردیف‌های بارگذاری‌شده ---
+    def display_values(self, row):
+        return tuple("" if value is None else str(value)
+                     for value in (getattr(row, column) for column in self._display_columns))
+
+    def insert_rows(self, rows, index="end"):
+        """افزودن ردیف‌ها به cache و Treeview (iid همان id است)؛ با index=0 هر ردیف بالای قبلی می‌رود"""
+        for row in rows:
+            self._rows[row.id] = row
+            self.tree.insert("", index, iid=row.id, values=self.display_values(row))
+
+    def forget_rows(self, iids):
+        self.tree.delete(*iids)
+        for iid in iids:
+            self._rows.pop(int(iid), None)
+
+    # --- به‌روزرسانی تک ردیف به جای بارگذاری دوباره کل جدول ---
+    def patch_row(self, row):
+        """اعمال یک ردیف درج‌شده یا ویرایش‌شده روی cache و Treeview"""
+        iid = str(row.id)
+        self._search_rows = None
+        if row.id in self._rows:
+            self._rows[row.id] = row
+            self.tree.item(iid, values=self.display_values(row))
+            if iid in self.tree.selection():
+                self.selected_item = row
+        elif (self._search_keyword is None and not self._has_more_after and self.sort_column is None
+              and not self.filters):
+            # ردیف جدید فقط وقتی نشان داده می‌شود که پنجره فعلی (به ترتیب id) به انتهای جدول رسیده باشد
+            children = self.tree.get_children()
+            if not children or int(children[-1]) < row.id:
+                self.insert_rows([row])
+                if self._total_estimate is not None:
+                    self._total_estimate += 1
+            elif not self._has_more_before and row.id < int(children[0]):
+                # ردیف‌هایی که بدون سرور اضافه شده‌اند تا همگام‌سازی id منفی دارند و اول جدول می‌آیند
+                self.insert_rows([row], index=0)
+                if self._total_estimate is not None:
+                    self._total_estimate += 1
+        self.update_status()
+
+    def apply_changes(self, upserted_ids, deleted_ids):
+        """اعمال تغییرات رسیده از NOTIFY (کلاینت‌های دیگر یا صفحه‌های دیگر همین کلاینت) روی ردیف‌های این صفحه"""
+        for item_id in deleted_ids:
+            self.remove_row(item_id)
+        if not upserted_ids:
+            return
+        source = self._page_source
+
+        def done(rows):
             for row in rows:
-                self.tree.insert("", "end", values=row)
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+                self.patch_row(row)
+            # ردیفی که برنگشته دیگر با فیلتر، جستجو یا بازه این صفحه جور نیست (یا حذف شده)
+            for item_id in set(upserted_ids) - {row.id for row in rows}:
+                self.remove_row(item_id)
+
+        self.run_in_background(lambda conn: self.repository.get_many(conn, upserted_ids, source), done)
+
+    def remove_row(self, item_id):
+        self._search_rows = None
+        if item_id in self._rows:
+            self.forget_rows([str(item_id)])
+            if self._total_estimate:
+                self._total_estimate -= 1
+        self.update_status()
 
-    def refresh_table(self, query=None, params=None):
-        self.load_from_db(query, params)
+    def load_from_db(self, search=None):
+        """بارگذاری صفحه اول جدول یا نتیجه جستجو (query, params) با فیلترها و مرتب‌سازی فعلی
+
+        نتیجه جستجو (که خودش ORDER BY و LIMIT دارد) صفحه‌بندی نمی‌شود.
+        """
+        repository = self.repository
+        if search is not None:
+            self._search_source = search
+        else:
+            self._search_source = None
+            self._search_keyword = None
+            self._search_rows = None
+        source = self._page_source = repository.source(self.filters, search)
+        sort = {"sort_column": self.sort_column, "descending": self.sort_descending}
+        filtered = bool(self.filters)
+
+        def work(conn):
+            if search is not None:
+                return None, repository.rows(conn, source, **sort), True
+            total = repository.estimate(conn, source if filtered else None)
+            return total, repository.page(conn, PAGE_SIZE, source, **sort), False
+
+        # جستجو یا رفرش جدید، درخواست‌های قبلی را لغو می‌کند
+        self.cancel_job("page")
+        self.run_in_background(work, self.show_first_page, key="load")
+
+    def show_first_page(self, result):
+        self._total_estimate, rows, ranked = result
+        self.tree.delete(*self.tree.get_children())
+        self._rows = {}
+        self._has_more_before = False
+        self._has_more_after = not ranked and len(rows) == PAGE_SIZE
+        # نتیجه کامل جستجو (کمتر از SEARCH_LIMIT) برای محدود کردن سمت کلاینت نگه داشته می‌شود
+        self._search_rows = rows if ranked and len(rows) < SEARCH_LIMIT else None
+        self.remember_names(rows)
+        self.insert_rows(rows)
+        self.tree.yview_moveto(0)
+        self.update_status()
+        self.event_generate("<<TableLoaded>>")
+
+    def reload(self):
+        """خواندن دوباره جدول یا نتیجه جستجوی فعلی (مثلا بعد از تغییر مرتب‌سازی یا فیلترها)"""
+        self.load_from_db(self._search_source)
+
+    # --- مرتب‌سازی و فیلتر ستون‌ها (در دیتابیس) ---
+    def sort_by(self, column):
+        """کلیک روی عنوان ستون: صعودی، نزولی، و بعد دوباره ترتیب پیش‌فرض id"""
+        if self.sort_column != column:
+            self.sort_column, self.sort_descending = column, False
+        elif not self.sort_descending:
+            self.sort_descending = True
+        else:
+            self.sort_column, self.sort_descending = None, False
+        for heading, heading_column in self._heading_columns.items():
+            arrow = ""
+            if heading_column == self.sort_column:
+                arrow = " ▼" if self.sort_descending else " ▲"
+            self.tree.heading(heading, text=heading + arrow)
+        self.reload()
+
+    def on_filter_typed(self, event):
+        if self._filter_after is not None:
+            self.after_cancel(self._filter_after)
+        self._filter_after = self.after(SEARCH_DEBOUNCE_MS, self.apply_filters)
+
+    def apply_filters(self):
+        if self._filter_after is not None:
+            self.after_cancel(self._filter_after)
+            self._filter_after = None
+        filters = {column: entry.get().strip() for column, entry in self.filter_fields.items()
+                   if entry.get().strip()}
+        if filters == self.filters:
+            return
+        self.filters = filters
+        self.reload()
+
+    def clear_filters(self):
+        for entry in self.filter_fields.values():
+            entry.delete(0, tk.END)
+        self.apply_filters()
+
+    def on_show(self):
+        # داده‌ها فقط بار اولی که صفحه نمایش داده می‌شود خوانده می‌شوند
+        if not self.loaded:
+            self.loaded = True
+            self.refresh_table()
+
+    # --- صفحه‌بندی keyset هنگام اسکرول ---
+    def on_tree_scroll(self, first, last):
+        self.vsb.set(first, last)
+        count = len(self.tree.get_children())
+        if not count:
+            return
+        margin = PREFETCH_ROWS / count
+        if self._has_more_after and float(last) >= 1 - margin:
+            self.fetch_page(forward=True)
+        elif self._has_more_before and float(first) <= margin:
+            self.fetch_page(forward=False)
+
+    def fetch_page(self, forward):
+        if "page" in self._jobs or "load" in self._jobs:
+            return
+        children = self.tree.get_children()
+        if not children:
+            return
+        source = self._page_source
+        edge = self._rows[int(children[-1] if forward else children[0])]
+        keyset = {"after_id" if forward else "before_id": edge.id, "sort_column": self.sort_column,
+                  "descending": self.sort_descending,
+                  "sort_value": getattr(edge, self.sort_column) if self.sort_column else None}
+        self.run_in_background(lambda conn: self.repository.page(conn, PAGE_SIZE, source, **keyset),
+                               lambda rows: self.show_page(rows, forward), key="page")
+
+    def show_page(self, rows, forward):
+        children = self.tree.get_children()
+        top = round(self.tree.yview()[0] * len(children)) if children else 0
+        self.remember_names(rows)
+        has_more = len(rows) == PAGE_SIZE
+        # ردیفی که کلاینت دیگری بعد از بارگذاری جابه‌جا کرده ممکن است دوباره در صفحه بعد بیاید
+        rows = [row for row in rows if row.id not in self._rows]
+        overflow = len(children) + len(rows) - MAX_LOADED_ROWS
+        if forward:
+            self._has_more_after = has_more
+            self.insert_rows(rows)
+            # ردیف‌های بالای پنجره را دور می‌ریزیم تا حافظه محدود بماند
+            if overflow > 0:
+                self.forget_rows(children[:overflow])
+                self._has_more_before = True
+                top -= overflow
+        else:
+            # ردیف‌ها برعکس ترتیب نمایش هستند؛ درج هر کدام در ابتدا ترتیب نمایش را حفظ می‌کند
+            self._has_more_before = has_more
+            self.insert_rows(rows, 0)
+            top += len(rows)
+            if overflow > 0:
+                self.forget_rows(children[len(children) - overflow:])
+                self._has_more_after = True
+        remaining = len(self.tree.get_children())
+        if remaining:
+            self.tree.yview_moveto(max(top, 0) / remaining)
+        self.update_status()
+
+    def update_status(self):
+        loaded = len(self.tree.get_children())
+        more = "+" if self._has_more_before or self._has_more_after else ""
+        if self._total_estimate is None:
+            self.status_label.configure(text=f"{loaded}{more} rows")
+        else:
+            self.status_label.configure(text=f"{loaded}{more} rows of ~{self._total_estimate}")
+
+    def refresh_table(self):
+        self.load_from_db()
 
     def on_select(self, event):
         selected = self.tree.selection()
         if selected:
-            self.selected_item = self.tree.item(selected[0])['values']
+            self.selected_item = self._rows.get(int(selected[0]))
         else:
             self.selected_item = None
 
+    def selected_rows(self):
+        return [self._rows[int(iid)] for iid in self.tree.selection() if int(iid) in self._rows]
+
     def submit_form(self):
         values = [entry.get() for entry in self.form_fields.values()]
-        if not all(values):
+        if not all(value for col, value in zip(self.form_fields, values) if col not in self.optional_fields):
             messagebox.showerror("Error", "All fields are required!")
             return
+        values = [value or None for value in values]
 
         try:
             if self.selected_item:
-                new_values = (self.selected_item[0], *values)
+                new_values = (self.selected_item.id, *values)
                 self.update_item(self.selected_item, new_values)
             else:
                 self.add_item(tuple(values))
@@ -133,37 +663,148 @@ class CRUDFrame(tb.Frame):
             messagebox.showerror("Error", f"Invalid input: {e}")
 
     def add_item(self, item_data):
-        raise NotImplementedError("Implement add_item")
+        self.run_write(lambda conn: self.repository.insert(conn, item_data))
 
     def update_item(self, old_data, new_data):
-        raise NotImplementedError("Implement update_item")
+        self.run_write(lambda conn: self.repository.update(conn, new_data[0], new_data[1:]))
 
+    # --- حذف و ویرایش گروهی ردیف‌های انتخاب‌شده (هر کدام با یک دستور SQL) ---
     def delete_item(self):
-        if not self.selected_item:
+        ids = [row.id for row in self.selected_rows()]
+        if not ids:
             messagebox.showwarning("Warning", "Please select an item to delete.")
             return
-        if messagebox.askyesno("Confirm", "Are you sure you want to delete this item?"):
-            conn = connect_db()
-            if not conn:
-                return
-            cur = conn.cursor()
-            try:
-                cur.execute(f"DELETE FROM {self.table_name} WHERE id = %s", (self.selected_item[0],))
-                conn.commit()
-                self.refresh_table()
-                self.selected_item = None
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
-            finally:
-                cur.close()
-                conn.close()
+        # اول تعداد ردیف‌هایی که با ON DELETE CASCADE از جدول‌های دیگر پاک می‌شوند نشان داده می‌شود
+        self.run_in_background(lambda conn: self.repository.delete_impact(conn, ids),
+                               lambda impact: self.confirm_delete(ids, impact))
+
+    def confirm_delete(self, ids, impact):
+        if len(ids) == 1:
+            message = "Are you sure you want to delete this item?"
+        else:
+            message = f"Are you sure you want to delete these {len(ids)} items?"
+        if impact:
+            details = "\n".join(f"  {count} rows from {table}" for table, count in impact.items())
+            message += f"\n\nThis will also delete:\n{details}"
+        if not messagebox.askyesno("Confirm", message):
+            return
+
+        def done(_):
+            for item_id in ids:
+                self.remove_row(item_id)
+            self.names_changed(ids)
+            self.selected_item = None
+
+        self.run_in_background(lambda conn: self.repository.delete(conn, ids), done)
+
+    def open_bulk_edit(self):
+        """پنجره گذاشتن یک مقدار در یک فیلد همه ردیف‌های انتخاب‌شده"""
+        rows = self.selected_rows()
+        if not rows:
+            messagebox.showwarning("Warning", "Please select the items to edit.")
+            return
+        ids = [row.id for row in rows]
+        dialog = tb.Toplevel(title=f"Edit {len(ids)} items")
+        dialog.transient(self.winfo_toplevel())
+
+        tb.Label(dialog, text="Field:", width=12).grid(row=0, column=0, sticky=W, padx=5, pady=5)
+        field = tb.Combobox(dialog, values=list(self.form_fields), state="readonly")
+        field.current(0)
+        field.grid(row=0, column=1, sticky=EW, padx=5, pady=5)
+        tb.Label(dialog, text="New value:", width=12).grid(row=1, column=0, sticky=W, padx=5, pady=5)
+        value = tb.Entry(dialog)
+        value.grid(row=1, column=1, sticky=EW, padx=5, pady=5)
+        value.focus_set()
+
+        def apply():
+            if self.bulk_edit(ids, field.get(), value.get().strip(), dialog):
+                dialog.destroy()
+
+        tb.Button(dialog, text=f"Apply to {len(ids)} items", bootstyle=SUCCESS, command=apply).grid(
+            row=2, columnspan=2, pady=5)
+        value.bind("<Return>", lambda event: apply())
+
+    def bulk_edit(self, ids, heading, value, dialog=None):
+        """گذاشتن value در فیلد heading همه ids با یک UPDATE؛ False اگر مقدار قابل قبول نباشد"""
+        if not value and heading not in self.optional_fields:
+            messagebox.showerror("Error", f"{heading} is required!", parent=dialog)
+            return False
+        column = self.db_columns[self.columns.index(heading)]
+
+        def done(rows):
+            for row in rows:
+                self.patch_row(row)
+            self.names_changed(ids)
+
+        self.run_in_background(lambda conn: self.repository.update_column(conn, ids, column, value or None), done)
+        return True
+
+    def import_items(self):
+        if self.local_mirror():
+            messagebox.showwarning("Import", "Import needs the database server (working from the local copy).")
+            return
+        path = filedialog.askopenfilename(
+            title=f"Import {self.import_entity}",
+            filetypes=[("CSV / JSON", "*.csv *.json *.jsonl"), ("All files", "*.*")])
+        if not path:
+            return
+
+        def done(result):
+            imported, rejected = result
+            message = f"Imported {imported} rows."
+            if rejected:
+                details = "\n".join(f"Row {line_no}: {error}" for line_no, error in rejected[:10])
+                more = f"\n... and {len(rejected) - 10} more" if len(rejected) > 10 else ""
+                message += f"\n\nRejected {len(rejected)} rows:\n{details}{more}"
+            messagebox.showinfo("Import", message)
+            self.refresh_table()
+
+        self.run_in_background(lambda conn: import_file(conn, self.import_entity, path), done)
+
+    def export_items(self):
+        """خروجی گرفتن از جدول یا نتیجه جستجوی فعلی (کل ردیف‌ها، نه فقط ردیف‌های بارگذاری‌شده)"""
+        if self.local_mirror():
+            messagebox.showwarning("Export", "Export needs the database server (working from the local copy).")
+            return
+        path = filedialog.asksaveasfilename(
+            title=f"Export {self.table_name}", defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("Parquet", "*.parquet")])
+        if not path:
+            return
+        base_query, params = self._page_source
+        base_query = sorted_query(base_query, self.sort_column, self.sort_descending)
+        # thread دیتابیس فقط این عدد را عوض می‌کند و رابط کاربری آن را می‌خواند
+        progress = {"rows": 0}
+
+        def work(conn):
+            return export_query(conn, base_query, params, path,
+                                lambda rows: progress.__setitem__("rows", rows))
+
+        def done(rows):
+            self.update_status()
+            messagebox.showinfo("Export", f"Exported {rows} rows to {path}.")
+
+        self.run_in_background(work, done, key="export")
+        self.show_export_progress(progress)
+
+    def show_export_progress(self, progress):
+        if "export" not in self._jobs:
+            return
+        self.status_label.configure(text=f"Exporting... {progress['rows']} rows")
+        self.after(200, self.show_export_progress, progress)
 
     def open_add_form(self, edit_mode=False, item=None):
         self.clear_form()
+        if not edit_mode:
+            # بدون این کار Submit ردیف انتخاب‌شده را ویرایش می‌کرد
+            self.tree.selection_remove(self.tree.selection())
         if edit_mode and item:
             for (field, entry), value in zip(self.form_fields.items(), item[1:]):
+                if isinstance(entry, ForeignKeyPicker):
+                    entry.set_item(value)
+                    continue
                 entry.delete(0, tk.END)
-                entry.insert(0, str(value))
+                entry.insert(0, "" if value is None else str(value))
 
     def open_edit_form(self):
         if not self.selected_item:
@@ -175,549 +816,551 @@ class CRUDFrame(tb.Frame):
         for entry in self.form_fields.values():
             entry.delete(0, tk.END)
 
+    def on_search_typed(self, event):
+        # جستجو فقط وقتی اجرا می‌شود که تایپ برای SEARCH_DEBOUNCE_MS متوقف شده باشد
+        if self._search_after is not None:
+            self.after_cancel(self._search_after)
+            self._search_after = None
+        keyword = self.search_entry.get().strip()
+        if keyword and len(keyword) < MIN_LIVE_SEARCH_LENGTH and not keyword.isdigit():
+            return
+        self._search_after = self.after(SEARCH_DEBOUNCE_MS, self.on_search)
+
     def on_search(self):
-        keyword = self.search_entry.get()
-        if keyword:
-            self.perform_search(keyword)
-        else:
+        if self._search_after is not None:
+            self.after_cancel(self._search_after)
+            self._search_after = None
+        keyword = self.search_entry.get().strip()
+        if keyword == self._search_keyword:
+            return
+        previous = self._search_keyword
+        self._search_keyword = keyword or None
+        if not keyword:
             self.refresh_table()
+        elif self.can_narrow(previous, keyword):
+            self.narrow_search(keyword)
+        else:
+            self._search_rows = None
+            self.perform_search(keyword)
+
+    def can_narrow(self, previous, keyword):
+        """آیا نتیجه جستجوی قبلی برای کلمه جدید کافی است (بدون رفتن به دیتابیس)؟
+
+        فقط وقتی که کلمه جدید ادامه کلمه قبلی باشد و نتیجه قبلی کامل (کمتر از SEARCH_LIMIT) بوده باشد.
+        جستجوی عددی تطابق دقیق است و محدود کردنش معنی ندارد.
+        """
+        return (self._search_rows is not None and previous is not None and not keyword.isdigit()
+                and keyword.lower().startswith(previous.lower()))
+
+    def narrow_search(self, keyword):
+        words = keyword.lower().split()
+        rows = [row for row in self._search_rows
+                if all(word in " ".join(str(value) for value in row if value is not None).lower()
+                       for word in words)]
+        # اگر کوئری قبلی هنوز در حال اجراست نتیجه‌اش دیگر لازم نیست
+        self.cancel_job("load")
+        self.show_first_page((None, rows, True))
 
     def perform_search(self, keyword):
-        raise NotImplementedError("Implement perform_search")
+        self.load_from_db(self.repository.search_query(keyword))
 
     def clear_search(self):
+        if self._search_after is not None:
+            self.after_cancel(self._search_after)
+            self._search_after = None
         self.search_entry.delete(0, tk.END)
         self.refresh_table()
 
 
 class BooksPage(CRUDFrame):
+    import_entity = "books"
+
     def __init__(self, parent):
         super().__init__(parent, "Books Management",
-                        ("ID", "Name", "Publish Date", "Description", "Number of Books", "Language"), "books")
+                        ("ID", "Name", "Publish Date", "Description", "Number of Books", "Language"),
+                        REPOSITORIES["books"])
 
-    def add_item(self, item_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                INSERT INTO books (name, publish_date, description, number_of_books, language)
-                VALUES (%s, %s, %s, %s, %s) RETURNING id
-            """, item_data)
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
 
-    def update_item(self, old_data, new_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                UPDATE books SET name=%s, publish_date=%s, description=%s, number_of_books=%s, language=%s
-                WHERE id=%s
-            """, (*new_data[1:], new_data[0]))
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+class AuthorsPage(CRUDFrame):
+    import_entity = "authors"
 
-    def perform_search(self, keyword):
-        query = """
-        SELECT id, name, publish_date, description, number_of_books, language 
-        FROM books
-        WHERE name ILIKE %s OR description ILIKE %s OR language ILIKE %s
-        """
-        params = (f"%{keyword}%", f"%{keyword}%", f"%{keyword}%")
-        self.refresh_table(query, params)
+    def __init__(self, parent):
+        super().__init__(parent, "Authors Management",
+                        ("ID", "First Name", "Last Name", "Start of Activity", "Language"), REPOSITORIES["authors"])
 
 
-class AuthorsPage(CRUDFrame):
+class PublishersPage(CRUDFrame):
     def __init__(self, parent):
-        super().__init__(parent, "Authors Management",
-                        ("ID", "First Name", "Last Name", "Start of Activity", "Language"), "authors")
+        super().__init__(parent, "Publishers Management", ("ID", "Name", "Address"), REPOSITORIES["publishers"])
 
-    def add_item(self, item_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                INSERT INTO authors (first_name, last_name, start_of_activity, language)
-                VALUES (%s, %s, %s, %s) RETURNING id
-            """, item_data)
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
 
-    def update_item(self, old_data, new_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                UPDATE authors SET first_name=%s, last_name=%s, start_of_activity=%s, language=%s
-                WHERE id=%s
-            """, (*new_data[1:], new_data[0]))
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+class GenresPage(CRUDFrame):
+    def __init__(self, parent):
+        super().__init__(parent, "Genres Management", ("ID", "Name"), REPOSITORIES["genres"])
 
-    def perform_search(self, keyword):
-        query = """
-        SELECT id, first_name, last_name, start_of_activity, language 
-        FROM authors
-        WHERE first_name ILIKE %s OR last_name ILIKE %s OR language ILIKE %s
-        """
-        params = (f"%{keyword}%", f"%{keyword}%", f"%{keyword}%")
-        self.refresh_table(query, params)
 
+class PeoplePage(CRUDFrame):
+    import_entity = "people"
 
-class PublishersPage(CRUDFrame):
     def __init__(self, parent):
-        super().__init__(parent, "Publishers Management", ("ID", "Name", "Address"), "publishers")
+        super().__init__(parent, "People Management",
+                        ("ID", "First Name", "Last Name", "Email", "Phone", "Address"), REPOSITORIES["people"])
 
-    def add_item(self, item_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                INSERT INTO publishers (name, address)
-                VALUES (%s, %s) RETURNING id
-            """, item_data)
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
 
-    def update_item(self, old_data, new_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                UPDATE publishers SET name=%s, address=%s
-                WHERE id=%s
-            """, (*new_data[1:], new_data[0]))
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+class BookAuthorsPage(CRUDFrame):
+    def __init__(self, parent):
+        super().__init__(parent, "Book-Authors Relationships", ("ID", "Book ID", "Author ID"),
+                        REPOSITORIES["book_authors"], {"book_id": "Book", "author_id": "Author"})
 
-    def perform_search(self, keyword):
-        query = """
-        SELECT id, name, address FROM publishers
-        WHERE name ILIKE %s OR address ILIKE %s
-        """
-        params = (f"%{keyword}%", f"%{keyword}%")
-        self.refresh_table(query, params)
 
-class GenresPage(CRUDFrame):
+class BookGenresPage(CRUDFrame):
     def __init__(self, parent):
-        super().__init__(parent, "Genres Management", ("ID", "Name"), "genres")
+        super().__init__(parent, "Book-Genres Relationships", ("ID", "Book ID", "Genre ID"),
+                        REPOSITORIES["book_genres"], {"book_id": "Book", "genre_id": "Genre"})
 
-    def add_item(self, item_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                INSERT INTO genres (name)
-                VALUES (%s) RETURNING id
-            """, (item_data[0],))
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
 
-    def update_item(self, old_data, new_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                UPDATE genres SET name=%s WHERE id=%s
-            """, (new_data[1], new_data[0]))
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+class BookPublishersPage(CRUDFrame):
+    def __init__(self, parent):
+        super().__init__(parent, "Book-Publishers Relationships", ("ID", "Book ID", "Publisher ID"),
+                        REPOSITORIES["book_publishers"], {"book_id": "Book", "publisher_id": "Publisher"})
 
-    def perform_search(self, keyword):
-        query = "SELECT * FROM genres WHERE name ILIKE %s"
-        params = (f"%{keyword}%",)
-        self.refresh_table(query, params)
 
+class BorrowingsPage(CRUDFrame):
+    optional_fields = ("Return Date",)
+    # عنوان صفحه با و بدون Show older loans
+    history_title = "Borrowings Management"
+    recent_title = f"Borrowings Management (last {RECENT_LOAN_DAYS} days)"
 
-class PeoplePage(CRUDFrame):
     def __init__(self, parent):
-        super().__init__(parent, "People Management",
-                        ("ID", "First Name", "Last Name", "Is_Staff", "Address", "Is_active"), "people")
+        super().__init__(parent, self.recent_title,
+                        ("ID", "Book ID", "Person ID", "Borrow Date", "Return Date", "Status"),
+                        REPOSITORIES["borrowings"].recent(), {"book_id": "Book", "person_id": "Person"})
 
-    def add_item(self, item_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                INSERT INTO people (first_name, last_name, email, phone, address)
-                VALUES (%s, %s, %s, %s, %s) RETURNING id
-            """, item_data)
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
-
-    def update_item(self, old_data, new_data):
-        conn = connect_db()
-        if not conn:
+    def create_widgets(self):
+        super().create_widgets()
+        tb.Button(self.btn_frame, text="Return", bootstyle=PRIMARY, command=self.return_selected).pack(
+            side=LEFT, padx=5)
+        # پیش‌فرض فقط partition های امانت‌های RECENT_LOAN_DAYS روز اخیر خوانده می‌شوند
+        self.show_history = tk.BooleanVar(value=False)
+        tb.Checkbutton(self.btn_frame, text="Show older loans (including open ones)", variable=self.show_history,
+                       bootstyle="round-toggle", command=self.toggle_history).pack(side=LEFT, padx=10)
+
+    def toggle_history(self):
+        borrowings = REPOSITORIES["borrowings"]
+        self.repository = borrowings if self.show_history.get() else borrowings.recent()
+        self.title_label.configure(text=self.history_title if self.show_history.get() else self.recent_title)
+        self.reload()
+
+    def return_selected(self):
+        if not self.selected_item:
+            messagebox.showwarning("Warning", "Please select a borrowing to return.")
             return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                UPDATE people SET first_name=%s, last_name=%s, email=%s, phone=%s, address=%s
-                WHERE id=%s
-            """, (*new_data[1:], new_data[0]))
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+        borrowing_id = self.selected_item.id
+        self.run_write(lambda conn: self.repository.return_loan(conn, borrowing_id))
 
-    def perform_search(self, keyword):
-        query = """
-        SELECT id, first_name, last_name, email, phone, address 
-        FROM people
-        WHERE first_name ILIKE %s OR last_name ILIKE %s OR email ILIKE %s OR phone ILIKE %s
-        """
-        params = (f"%{keyword}%", f"%{keyword}%", f"%{keyword}%", f"%{keyword}%")
-        self.refresh_table(query, params)
 
+# --- صفحه میز امانت ---
+class CheckoutPage(DBFrame):
+    """امانت سریع با بارکدخوان: کارت عضو، سپس کتاب‌ها؛ Enter خالی کل کتاب‌ها را در یک تراکنش امانت می‌دهد"""
 
-class BookAuthorsPage(CRUDFrame):
     def __init__(self, parent):
-        super().__init__(parent, "Book-Authors Relationships", ("ID", "Book ID", "Author ID"), "book_authors")
+        super().__init__(parent)
+        self.person = None  # (id, نام)
+        self._scan_count = 0
+        self.create_widgets()
 
-    def add_item(self, item_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                INSERT INTO book_authors (book_id, author_id)
-                VALUES (%s, %s) RETURNING id
-            """, item_data)
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+    def create_widgets(self):
+        tb.Label(self, text="Checkout Desk", font=("Arial", 14, "bold")).pack(anchor="w", padx=10, pady=10)
+
+        scan_frame = tb.Frame(self)
+        scan_frame.pack(fill=X, padx=10, pady=5)
+        tb.Label(scan_frame, text="Scan:").pack(side=LEFT, padx=5)
+        self.scan_entry = tb.Entry(scan_frame, width=30)
+        self.scan_entry.pack(side=LEFT, padx=5)
+        self.scan_entry.bind("<Return>", self.on_scan)
+        self.person_label = tb.Label(scan_frame, text="No member scanned", font=("Arial", 11, "bold"))
+        self.person_label.pack(side=LEFT, padx=15)
+        self.busy_bar = tb.Progressbar(scan_frame, mode="indeterminate", bootstyle="info-striped", length=120)
+        self.busy_bar.pack(side=RIGHT, padx=5)
 
-    def update_item(self, old_data, new_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                UPDATE book_authors SET book_id=%s, author_id=%s
-                WHERE id=%s
-            """, (new_data[1], new_data[2], new_data[0]))
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+        btn_frame = tb.Frame(self)
+        btn_frame.pack(fill=X, padx=10, pady=5)
+        tb.Button(btn_frame, text="Check Out", bootstyle=SUCCESS, command=self.commit).pack(side=LEFT, padx=5)
+        tb.Button(btn_frame, text="Remove", bootstyle=DANGER, command=self.remove_selected).pack(side=LEFT, padx=5)
+        tb.Button(btn_frame, text="Clear", bootstyle=WARNING, command=self.clear).pack(side=LEFT, padx=5)
+        self.status_label = tb.Label(btn_frame, text=f"Scan a member card ({PERSON_PREFIX}<id>), then books.")
+        self.status_label.pack(side=RIGHT, padx=5)
 
-    def perform_search(self, keyword):
-        query = """
-        SELECT ba.id, b.name, a.first_name || ' ' || a.last_name AS author
-        FROM book_authors ba
-        JOIN books b ON ba.book_id = b.id
-        JOIN authors a ON ba.author_id = a.id
-        WHERE b.name ILIKE %s OR a.first_name ILIKE %s OR a.last_name ILIKE %s
-        """
-        params = (f"%{keyword}%", f"%{keyword}%", f"%{keyword}%")
-        self.refresh_table(query, params)
+        # کتاب‌های خوانده‌شده که هنوز امانت داده نشده‌اند
+        table_frame = tb.Frame(self)
+        table_frame.pack(fill=BOTH, expand=True, padx=10, pady=5)
+        columns = ("Book ID", "Title", "Status")
+        self.tree = ttk.Treeview(table_frame, columns=columns, show="headings")
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=400 if col == "Title" else 120, anchor=W)
+        vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side=LEFT, fill=BOTH, expand=True)
+        vsb.pack(side=RIGHT, fill=Y)
 
-class BookGenresPage(CRUDFrame):
-    def __init__(self, parent):
-        super().__init__(parent, "Book-Genres Relationships", ("ID", "Book ID", "Genre ID"), "book_genres")
+    def on_show(self):
+        self.scan_entry.focus_set()
+
+    def book_ids(self):
+        return [int(self.tree.set(iid, "Book ID")) for iid in self.tree.get_children()]
+
+    # --- خواندن بارکد ---
+    def on_scan(self, event=None):
+        code = self.scan_entry.get().strip().upper()
+        self.scan_entry.delete(0, tk.END)
+        if not code:
+            self.commit()
+        elif code.startswith(PERSON_PREFIX) and code[len(PERSON_PREFIX):].isdigit():
+            self.scan_person(int(code[len(PERSON_PREFIX):]))
+        elif code.isdigit():
+            self.scan_book(int(code))
+        elif code.startswith(BOOK_PREFIX) and code[len(BOOK_PREFIX):].isdigit():
+            self.scan_book(int(code[len(BOOK_PREFIX):]))
+        else:
+            self.show_status(f"Unrecognized barcode: {code}", error=True)
 
-    def add_item(self, item_data):
-        conn = connect_db()
-        if not conn:
+    def scan_person(self, person_id):
+        # کتاب‌های عضو قبلی پیش از عوض شدن عضو امانت داده می‌شوند (اگر امانت خطا بدهد عضو عوض نمی‌شود)
+        if self.person and self.tree.get_children():
+            self.commit(then=lambda: self.scan_person(person_id))
             return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                INSERT INTO book_genres (book_id, genre_id)
-                VALUES (%s, %s) RETURNING id
-            """, item_data)
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
 
-    def update_item(self, old_data, new_data):
-        conn = connect_db()
-        if not conn:
+        def done(row):
+            if row is None:
+                self.show_status(f"Person #{person_id} does not exist.", error=True)
+                return
+            name, active = row
+            if not active:
+                self.show_status(f"{name} (#{person_id}) is not an active member.", error=True)
+                return
+            self.person = (person_id, name)
+            self.person_label.configure(text=f"{name} (#{person_id})")
+            self.show_status("Scan books; press Enter on an empty scan to check out.")
+
+        self.run_in_background(lambda conn: member_status(conn, person_id), done)
+
+    def scan_book(self, book_id):
+        if self.person is None:
+            self.show_status(f"Scan a member card ({PERSON_PREFIX}<id>) first.", error=True)
             return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                UPDATE book_genres SET book_id=%s, genre_id=%s
-                WHERE id=%s
-            """, (new_data[1], new_data[2], new_data[0]))
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+        # ردیف همان لحظه اضافه می‌شود؛ نام و موجودی وقتی کوئری برگشت پر می‌شوند
+        self._scan_count += 1
+        iid = str(self._scan_count)
+        self.tree.insert("", "end", iid=iid, values=(book_id, name_cache.get("books", book_id) or "...", ""))
+        self.tree.see(iid)
+
+        def done(row):
+            if not self.tree.exists(iid):
+                return
+            if row is None:
+                self.tree.item(iid, values=(book_id, "(unknown book)", "Not found"))
+                self.show_status(f"Book #{book_id} does not exist.", error=True)
+                return
+            name, available = row
+            name_cache.put("books", book_id, name)
+            requested = self.book_ids().count(book_id)
+            status = "Ready" if (available or 0) >= requested else f"Unavailable ({available or 0} left)"
+            self.tree.item(iid, values=(book_id, name, status))
+            if status != "Ready":
+                self.show_status(f"Not enough copies of '{name}' (#{book_id}).", error=True)
+
+        self.run_in_background(lambda conn: book_availability(conn, book_id), done)
+
+    # --- امانت کل کتاب‌ها ---
+    def commit(self, then=None):
+        book_ids = self.book_ids()
+        if self.person is None or not book_ids:
+            self.show_status("Nothing to check out.", error=True)
+            return
+        person_id, person_name = self.person
+        items = self.tree.get_children()
+        started = time.perf_counter()
+
+        def done(rows):
+            elapsed = (time.perf_counter() - started) * 1000
+            for iid in items:
+                if self.tree.exists(iid):
+                    self.tree.delete(iid)
+            self.show_status(f"✅ {len(rows)} book(s) checked out to {person_name} in {elapsed:.0f} ms.")
+            if then is not None:
+                then()
+
+        def failed(error):
+            # کتاب‌ها در لیست می‌مانند تا مورد مشکل‌دار حذف و دوباره امانت داده شود
+            if isinstance(error, CirculationError):
+                self.show_status(str(error).replace("\n", " "), error=True)
+            else:
+                messagebox.showerror("Error", str(error))
 
-    def perform_search(self, keyword):
-        query = """
-        SELECT bg.id, b.name, g.name
-        FROM book_genres bg
-        JOIN books b ON bg.book_id = b.id
-        JOIN genres g ON bg.genre_id = g.id
-        WHERE b.name ILIKE %s OR g.name ILIKE %s
-        """
-        params = (f"%{keyword}%", f"%{keyword}%")
-        self.refresh_table(query, params)
+        self.run_in_background(lambda conn: REPOSITORIES["borrowings"].checkout(conn, person_id, book_ids), done,
+                               on_error=failed)
 
+    def remove_selected(self):
+        for iid in self.tree.selection():
+            self.tree.delete(iid)
+        self.scan_entry.focus_set()
 
-class BookPublishersPage(CRUDFrame):
-    def __init__(self, parent):
-        super().__init__(parent, "Book-Publishers Relationships", ("ID", "Book ID", "Publisher ID"), "book_publishers")
+    def clear(self):
+        self.tree.delete(*self.tree.get_children())
+        self.person = None
+        self.person_label.configure(text="No member scanned")
+        self.show_status(f"Scan a member card ({PERSON_PREFIX}<id>), then books.")
+        self.scan_entry.focus_set()
 
-    def add_item(self, item_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                INSERT INTO book_publishers (book_id, publisher_id)
-                VALUES (%s, %s) RETURNING id
-            """, item_data)
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+    def show_status(self, text, error=False):
+        if error:
+            self.bell()
+        self.status_label.configure(text=text, bootstyle=DANGER if error else DEFAULT)
 
-    def update_item(self, old_data, new_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                UPDATE book_publishers SET book_id=%s, publisher_id=%s
-                WHERE id=%s
-            """, (new_data[1], new_data[2], new_data[0]))
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
 
-    def perform_search(self, keyword):
-        query = """
-        SELECT bp.id, b.name, p.name
-        FROM book_publishers bp
-        JOIN books b ON bp.book_id = b.id
-        JOIN publishers p ON bp.publisher_id = p.id
-        WHERE b.name ILIKE %s OR p.name ILIKE %s
-        """
-        params = (f"%{keyword}%", f"%{keyword}%")
-        self.refresh_table(query, params)
+# --- صفحه Reports ---
+class ReportsPage(DBFrame):
+    """نمایش گزارش‌ها از materialized view ها (reports.py) و تازه کردن آن‌ها در پس‌زمینه"""
 
-class BorrowingsPage(CRUDFrame):
     def __init__(self, parent):
-        super().__init__(parent, "Borrowings Management",
-                        ("ID", "Book ID", "Person ID", "Borrow Date", "Return Date", "Status"), "borrowings")
+        super().__init__(parent)
+        self._check_after = None
+        self._refreshing = False
+        self._titles = {title: name for name, (title, *_rest) in REPORTS.items()}
+        self.create_widgets()
 
-    def add_item(self, item_data):
-        conn = connect_db()
-        if not conn:
-            return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                INSERT INTO borrowings (book_id, person_id, borrow_date, return_date, status)
-                VALUES (%s, %s, %s, %s, %s) RETURNING id
-            """, item_data)
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+    def create_widgets(self):
+        tb.Label(self, text="Reports", font=("Arial", 14, "bold")).pack(anchor="w", padx=10, pady=10)
 
-    def update_item(self, old_data, new_data):
-        conn = connect_db()
-        if not conn:
+        btn_frame = tb.Frame(self)
+        btn_frame.pack(fill=X, padx=10, pady=5)
+        self.report_var = tk.StringVar(value=next(iter(self._titles)))
+        chooser = tb.Combobox(btn_frame, textvariable=self.report_var, values=list(self._titles),
+                              state="readonly", width=40)
+        chooser.pack(side=LEFT, padx=5)
+        chooser.bind("<<ComboboxSelected>>", lambda event: self.load_report())
+        tb.Button(btn_frame, text="Refresh Data", bootstyle=WARNING, command=self.refresh_data).pack(
+            side=LEFT, padx=5)
+        self.busy_bar = tb.Progressbar(btn_frame, mode="indeterminate", bootstyle="info-striped", length=120)
+        self.busy_bar.pack(side=RIGHT, padx=5)
+        self.status_label = tb.Label(btn_frame, text="")
+        self.status_label.pack(side=RIGHT, padx=5)
+
+        table_frame = tb.Frame(self)
+        table_frame.pack(fill=BOTH, expand=True, padx=10, pady=5)
+        self.tree = ttk.Treeview(table_frame, show="headings")
+        vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side=LEFT, fill=BOTH, expand=True)
+        vsb.pack(side=RIGHT, fill=Y)
+
+    def on_show(self):
+        if self._check_after is not None:
+            self.after_cancel(self._check_after)
+            self._check_after = None
+        self.load_report()
+        self.scheduled_refresh()
+
+    def selected_report(self):
+        return self._titles[self.report_var.get()]
+
+    def load_report(self):
+        name = self.selected_report()
+
+        def work(conn):
+            return report_rows(conn, name), last_refreshed(conn).get(name)
+
+        def done(result):
+            rows, refreshed = result
+            _, columns, *_rest = REPORTS[name]
+            self.tree.delete(*self.tree.get_children())
+            self.tree.configure(columns=columns)
+            for col in columns:
+                self.tree.heading(col, text=col)
+                self.tree.column(col, width=120, anchor=W)
+            for row in rows:
+                self.tree.insert("", "end", values=row)
+            text = f"{len(rows)} rows" + (f" (first {REPORT_ROWS})" if len(rows) == REPORT_ROWS else "")
+            if refreshed:
+                refreshed_at, duration_ms = refreshed
+                text += f", data as of {refreshed_at.astimezone():%Y-%m-%d %H:%M}"
+                if duration_ms is not None:
+                    text += f" (refresh took {duration_ms:.0f} ms)"
+            self.status_label.configure(text=text)
+
+        self.run_in_background(work, done, key="report")
+
+    def refresh_data(self, max_age_minutes=None):
+        """تازه کردن view ها در پس‌زمینه؛ خواننده‌ها (و بقیه کلاینت‌ها) در این مدت منتظر نمی‌مانند"""
+        if self._refreshing:
             return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                UPDATE borrowings SET book_id=%s, person_id=%s, borrow_date=%s, return_date=%s, status=%s
-                WHERE id=%s
-            """, (*new_data[1:], new_data[0]))
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+        self._refreshing = True
+
+        def done(timings):
+            self._refreshing = False
+            if timings is None:
+                self.status_label.configure(text="Another client is refreshing the reports...")
+            elif timings:
+                self.load_report()
+
+        def failed(error):
+            self._refreshing = False
+            messagebox.showerror("Error", str(error))
+
+        self.run_in_background(lambda conn: refresh_reports(conn, max_age_minutes=max_age_minutes), done,
+                               on_error=failed)
+
+    def scheduled_refresh(self):
+        # فقط تا وقتی صفحه نمایش داده می‌شود
+        if not self.winfo_ismapped() and self._check_after is not None:
+            self._check_after = None
+            return
+        self.refresh_data(REPORT_MAX_AGE_MINUTES)
+        self._check_after = self.after(REPORTS_CHECK_MS, self.scheduled_refresh)
 
-    def perform_search(self, keyword):
-        query = """
-        SELECT id, book_id, person_id, borrow_date, return_date, status 
-        FROM borrowings
-        WHERE book_id::TEXT ILIKE %s OR person_id::TEXT ILIKE %s OR status ILIKE %s
-        """
-        params = (f"%{keyword}%", f"%{keyword}%", f"%{keyword}%")
-        self.refresh_table(query, params)
 
+# --- صفحه Diagnostics ---
+class DiagnosticsPage(tb.Frame):
+    """کندترین کوئری‌ها و هیستوگرام زمان اجرای آن‌ها (داده‌ها از diagnostics)"""
 
-class BorrowingsPage(CRUDFrame):
     def __init__(self, parent):
-        super().__init__(parent, "Borrowings Management",
-                        ("ID", "Book ID", "Person ID", "Borrow Date", "Return Date", "Status"), "borrowings")
+        super().__init__(parent)
+        self._refresh_after = None
+        self._groups = []
+        self.create_widgets()
 
-    def add_item(self, item_data):
-        conn = connect_db()
-        if not conn:
+    def create_widgets(self):
+        tb.Label(self, text="Diagnostics", font=("Arial", 14, "bold")).pack(anchor="w", padx=10, pady=10)
+
+        btn_frame = tb.Frame(self)
+        btn_frame.pack(fill=X, padx=10, pady=5)
+        tb.Label(btn_frame, text="Slow query threshold (ms):").pack(side=LEFT, padx=5)
+        self.threshold_var = tk.IntVar(value=diagnostics.slow_query_ms)
+        threshold = tb.Spinbox(btn_frame, from_=0, to=60000, increment=50, width=8,
+                               textvariable=self.threshold_var, command=self.set_threshold)
+        threshold.pack(side=LEFT, padx=5)
+        threshold.bind("<Return>", lambda event: self.set_threshold())
+        tb.Button(btn_frame, text="Clear", bootstyle=WARNING, command=self.clear).pack(side=LEFT, padx=5)
+        self.summary_label = tb.Label(btn_frame, text="")
+        self.summary_label.pack(side=RIGHT, padx=5)
+
+        # هیستوگرام زمان اجرا
+        self.histogram = tk.Canvas(self, height=140, highlightthickness=0, bg=tb.Style().colors.bg)
+        self.histogram.pack(fill=X, padx=10, pady=5)
+
+        # کندترین کوئری‌ها
+        table_frame = tb.Frame(self)
+        table_frame.pack(fill=BOTH, expand=True, padx=10, pady=5)
+        columns = ("Caller", "Query", "Calls", "Errors", "Avg ms", "Max ms", "Rows", "KB")
+        self.tree = ttk.Treeview(table_frame, columns=columns, show="headings", height=10)
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=400 if col == "Query" else 80, anchor=W)
+        self.tree.column("Caller", width=200)
+        vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side=LEFT, fill=BOTH, expand=True)
+        vsb.pack(side=RIGHT, fill=Y)
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+
+        # متن کامل کوئری انتخاب‌شده و پلن EXPLAIN آن
+        self.details = tk.Text(self, height=10, wrap="none")
+        self.details.pack(fill=X, padx=10, pady=5)
+
+    def on_show(self):
+        if self._refresh_after is not None:
+            self.after_cancel(self._refresh_after)
+            self._refresh_after = None
+        self.refresh()
+
+    def refresh(self):
+        # فقط تا وقتی صفحه نمایش داده می‌شود به‌روز می‌شود
+        if not self.winfo_ismapped() and self._refresh_after is not None:
+            self._refresh_after = None
             return
-        cur = conn.cursor()
-        try:
-            cur.execute("""
-                INSERT INTO borrowings (book_id, person_id, borrow_date, return_date, status)
-                VALUES (%s, %s, %s, %s, %s) RETURNING id
-            """, item_data)
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+        records = diagnostics.records()
+        slow = sum(record.duration_ms >= diagnostics.slow_query_ms for record in records)
+        errors = sum(record.error is not None for record in records)
+        self.summary_label.configure(
+            text=f"{len(records)} queries, {errors} errors, {slow} slower than {diagnostics.slow_query_ms} ms")
+        self.draw_histogram(diagnostics.histogram())
 
-    def update_item(self, old_data, new_data):
-        conn = connect_db()
-        if not conn:
+        selected = self.tree.selection()
+        selected_key = None
+        if selected:
+            group = self._groups[int(selected[0])]
+            selected_key = (group["caller"], group["query"])
+        self._groups = diagnostics.slowest(DIAGNOSTICS_TOP_N)
+        self.tree.delete(*self.tree.get_children())
+        for index, group in enumerate(self._groups):
+            self.tree.insert("", "end", iid=str(index), values=(
+                group["caller"], group["query"][:200], group["calls"], group["errors"],
+                f"{group['total_ms'] / group['calls']:.1f}", f"{group['max_ms']:.1f}",
+                group["rows"], f"{group['bytes'] / 1024:.1f}"))
+            if (group["caller"], group["query"]) == selected_key:
+                self.tree.selection_set(str(index))
+        self._refresh_after = self.after(DIAGNOSTICS_REFRESH_MS, self.refresh)
+
+    def draw_histogram(self, counts):
+        canvas = self.histogram
+        canvas.delete("all")
+        colors = tb.Style().colors
+        width, height = max(canvas.winfo_width(), 400), int(canvas["height"])
+        labels = [f"≤{bound} ms" for bound in diagnostics.HISTOGRAM_BUCKETS_MS]
+        labels.append(f">{diagnostics.HISTOGRAM_BUCKETS_MS[-1]} ms")
+        bar_width = width / len(counts)
+        top = max(counts) or 1
+        for index, (count, label) in enumerate(zip(counts, labels)):
+            x0 = index * bar_width + 8
+            x1 = (index + 1) * bar_width - 8
+            bar_height = (height - 40) * count / top
+            canvas.create_rectangle(x0, height - 20 - bar_height, x1, height - 20, fill=colors.info, width=0)
+            canvas.create_text((x0 + x1) / 2, height - 28 - bar_height, text=str(count), fill=colors.fg)
+            canvas.create_text((x0 + x1) / 2, height - 10, text=label, fill=colors.fg)
+
+    def on_select(self, event):
+        selected = self.tree.selection()
+        if not selected:
             return
-        cur = conn.cursor()
+        group = self._groups[int(selected[0])]
+        text = f"{group['caller']}\n\n{group['query']}\n\n{group['plan'] or '(no EXPLAIN plan: query was not slow)'}"
+        self.details.delete("1.0", tk.END)
+        self.details.insert("1.0", text)
+
+    def set_threshold(self):
         try:
-            cur.execute("""
-                UPDATE borrowings SET book_id=%s, person_id=%s, borrow_date=%s, return_date=%s, status=%s
-                WHERE id=%s
-            """, (*new_data[1:], new_data[0]))
-            conn.commit()
-            self.refresh_table()
-            self.clear_form()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            cur.close()
-            conn.close()
+            diagnostics.set_slow_threshold(max(0, int(self.threshold_var.get())))
+        except (tk.TclError, ValueError):
+            messagebox.showerror("Error", "Threshold must be a number of milliseconds.")
 
-    def perform_search(self, keyword):
-        query = """
-        SELECT id, book_id, person_id, borrow_date, return_date, status 
-        FROM borrowings
-        WHERE book_id::TEXT ILIKE %s OR person_id::TEXT ILIKE %s OR status ILIKE %s
-        """
-        params = (f"%{keyword}%", f"%{keyword}%", f"%{keyword}%")
-        self.refresh_table(query, params)
+    def clear(self):
+        diagnostics.clear()
+        self.details.delete("1.0", tk.END)
+        self.refresh()
 
 
 class MainApp(tb.Window):
     def __init__(self):
+        self.started_at = time.perf_counter()
         super().__init__(themename="darkly")
         self.title("Library Admin Panel")
         self.geometry("1200x700")
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.create_ui()
+        self.after_idle(self.report_startup_time)
+
+        self.change_listener = ChangeListener()
+        self.change_listener.start()
+        self.after(CHANGES_POLL_MS, self.poll_changes)
+
+        # نسخه محلی SQLite (اگر offline.MIRROR_ENABLED روشن باشد)
+        self.mirror = get_mirror()
+        self.mirror_sync = None
+        if self.mirror is not None:
+            self.mirror_sync = MirrorSync(self.mirror)
+            self.mirror_sync.start()
+            self.after(MIRROR_STATUS_MS, self.poll_mirror)
 
     def create_ui(self):
         main_container = tb.Frame(self)
@@ -726,13 +1369,14 @@ class MainApp(tb.Window):
         sidebar = tb.Frame(main_container, width=200, bootstyle="secondary")
         sidebar.pack(side=LEFT, fill=Y)
 
-        content_area = tb.Frame(main_container)
-        content_area.pack(side=LEFT, fill=BOTH, expand=True)
+        self.content_area = tb.Frame(main_container)
+        self.content_area.pack(side=LEFT, fill=BOTH, expand=True)
 
         categories = {
             "Entities": ["Books", "Authors", "Genres", "People", "Publishers"],
             "Relationships": ["Book-Authors", "Book-Genres", "Book-Publishers"],
-            "Operations": ["Borrowings"]
+            "Operations": ["Borrowings", "Checkout Desk", "Reports"],
+            "System": ["Diagnostics"],
         }
 
         for category, items in categories.items():
@@ -742,24 +1386,157 @@ class MainApp(tb.Window):
                 tb.Button(sidebar, text=item, command=lambda name=item: self.show_page(name)).pack(
                     pady=2, padx=5, fill=X)
 
-        self.pages = {
-            "Books": BooksPage(content_area),
-            "Authors": AuthorsPage(content_area),
-            "Genres": GenresPage(content_area),
-            "People": PeoplePage(content_area),
-            "Publishers": PublishersPage(content_area),
-            "Book-Authors": BookAuthorsPage(content_area),
-            "Book-Genres": BookGenresPage(content_area),
-            "Book-Publishers": BookPublishersPage(content_area),
-            "Borrowings": BorrowingsPage(content_area),
+        # وضعیت ارتباط با سرور و نسخه محلی
+        self.link_label = tb.Label(sidebar, text="", bootstyle="inverse-secondary", wraplength=190)
+        self.link_label.pack(side=BOTTOM, pady=10, padx=5, fill=X)
+
+        # صفحه‌ها اولین بار که باز می‌شوند ساخته می‌شوند
+        self.page_classes = {
+            "Books": BooksPage,
+            "Authors": AuthorsPage,
+            "Genres": GenresPage,
+            "People": PeoplePage,
+            "Publishers": PublishersPage,
+            "Book-Authors": BookAuthorsPage,
+            "Book-Genres": BookGenresPage,
+            "Book-Publishers": BookPublishersPage,
+            "Borrowings": BorrowingsPage,
+            "Checkout Desk": CheckoutPage,
+            "Reports": ReportsPage,
+            "Diagnostics": DiagnosticsPage,
         }
+        self.pages = {}
+        self.current_page = None
 
         self.show_page("Books")
+        self.pages["Books"].bind("<<TableLoaded>>", self.report_first_load, add="+")
 
     def show_page(self, name):
         for page in self.pages.values():
             page.pack_forget()
-        self.pages[name].pack(fill=BOTH, expand=True)
+        if name not in self.pages:
+            self.pages[name] = self.page_classes[name](self.content_area)
+        page = self.current_page = self.pages[name]
+        page.pack(fill=BOTH, expand=True)
+        page.on_show()
+
+    # --- نسخه محلی و وضعیت ارتباط با سرور ---
+    def poll_mirror(self):
+        ready, pending, conflicts = self.mirror.status()
+        active = ready and self.mirror_sync.link_is_down_or_slow()
+        if active != self.mirror.active:
+            # صفحه‌های جدول از این به بعد از منبع دیگر می‌خوانند
+            self.mirror.active = active
+            for page in self.pages.values():
+                if isinstance(page, CRUDFrame) and page.loaded:
+                    page.refresh_table()
+        if self.mirror_sync.online is None:
+            text = "⚪ Connecting..."
+        elif not self.mirror_sync.link_is_down_or_slow():
+            text = "🟢 Online"
+        elif not ready:
+            text = "🔴 Offline (no local copy yet)"
+        elif self.mirror_sync.online:
+            text = "🟡 Slow link: using local copy"
+        else:
+            text = "🔴 Offline: using local copy"
+        if pending:
+            text += f"\n{pending} change(s) waiting to sync"
+        if conflicts:
+            text += f"\n⚠️ {conflicts} conflict(s): python offline.py status"
+        self.link_label.configure(text=text)
+        self.after(MIRROR_STATUS_MS, self.poll_mirror)
+
+    def check_link(self):
+        """یک کوئری سرور با خطای اتصال تمام شد؛ وضعیت ارتباط بدون صبر تا SYNC_INTERVAL بررسی می‌شود"""
+        if self.mirror_sync is not None:
+            self.mirror_sync.wake()
+
+    # --- تغییرات بقیه کلاینت‌ها ---
+    def poll_changes(self):
+        # own: تغییرات خود این کلاینت که صفحه انجام‌دهنده‌شان قبلا اعمال کرده؛ فقط به بقیه صفحه‌ها می‌رسند
+        upserted, deleted, resync = {}, {}, set()
+        own_upserted, own_deleted = {}, {}
+        server_changes = self._drain(self.change_listener.changes)
+        mirror_changes = self._drain(self.mirror_sync.changes) if self.mirror_sync is not None else []
+        if server_changes and self.mirror_sync is not None:
+            # تغییرات سرور زودتر از SYNC_INTERVAL به نسخه محلی هم می‌رسند
+            self.mirror_sync.wake()
+        # وقتی صفحه‌ها از نسخه محلی می‌خوانند تغییرات خود نسخه محلی (بعد از همگام‌سازی) اعمال می‌شوند
+        for change in mirror_changes if self.mirror is not None and self.mirror.active else server_changes:
+            if change["op"] == "RESYNC":
+                # table خالی یعنی اتصال قطع شده بود و همه صفحه‌ها باید دوباره خوانده شوند
+                resync.add(change["table"])
+                if change["table"] is None:
+                    name_cache.clear()
+                    prefix_cache.clear()
+                else:
+                    name_cache.invalidate(change["table"])
+                    prefix_cache.invalidate(change["table"])
+            elif change["op"] == "DELETE":
+                target_deleted = own_deleted if change.get("own") else deleted
+                target_deleted.setdefault(change["table"], set()).add(change["id"])
+                upserted.get(change["table"], set()).discard(change["id"])
+                own_upserted.get(change["table"], set()).discard(change["id"])
+            else:
+                target_upserted = own_upserted if change.get("own") else upserted
+                target_upserted.setdefault(change["table"], set()).add(change["id"])
+
+        for page in self.pages.values():
+            if not isinstance(page, CRUDFrame) or not page.loaded:
+                continue
+            lookup_tables = {table for table, _ in page.lookups.values()}
+            if None in resync or page.table_name in resync or lookup_tables & resync:
+                page.refresh_table()
+                continue
+            page_upserted = upserted.get(page.table_name, set())
+            page_deleted = deleted.get(page.table_name, set())
+            if page is not self.current_page:
+                page_upserted = page_upserted | own_upserted.get(page.table_name, set())
+                page_deleted = page_deleted | own_deleted.get(page.table_name, set())
+            if page_upserted or page_deleted:
+                page.apply_changes(page_upserted, page_deleted)
+        for table in NAME_COLUMNS.keys() - resync:
+            changed = upserted.get(table, set()) | deleted.get(table, set())
+            if changed:
+                self.names_changed(table, changed)
+        self.after(CHANGES_POLL_MS, self.poll_changes)
+
+    @staticmethod
+    def _drain(changes):
+        drained = []
+        while True:
+            try:
+                drained.append(changes.get_nowait())
+            except queue.Empty:
+                return drained
+
+    def names_changed(self, table, ids):
+        """نام رکوردهای ids از table عوض شده یا حذف شده‌اند؛ cache و صفحه‌هایی که آن‌ها را نشان می‌دهند به‌روز می‌شوند"""
+        name_cache.invalidate(table, ids)
+        prefix_cache.invalidate(table)
+        for page in self.pages.values():
+            if isinstance(page, CRUDFrame) and page.loaded:
+                page.refresh_names(table, ids)
+
+    # --- اندازه‌گیری زمان راه‌اندازی ---
+    def report_startup_time(self):
+        self.update_idletasks()
+        elapsed = (time.perf_counter() - self.started_at) * 1000
+        print(f"⏱️ Window interactive after {elapsed:.0f} ms")
+
+    def report_first_load(self, event):
+        event.widget.unbind("<<TableLoaded>>")
+        elapsed = (time.perf_counter() - self.started_at) * 1000
+        print(f"⏱️ First page data loaded after {elapsed:.0f} ms")
+
+    def on_close(self):
+        self.change_listener.stop()
+        if self.mirror_sync is not None:
+            self.mirror_sync.stop()
+        shutdown_executor()
+        close_pool()
+        self.destroy()
 
 
 if __name__ == '__main__':
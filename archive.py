@@ -0,0 +1,171 @@
+import argparse
+import gzip
+import os
+import sys
+from datetime import date
+
+from psycopg2 import errors
+
+from circulation import BORROWED
+from db import get_connection
+
+# --- partition های امانت‌ها و بایگانی امانت‌های قدیمی ---
+# borrowings بر اساس borrow_date به partition های سالانه borrowings_y<سال> تقسیم شده است (migration 3 در
+# setup_db.py)؛ کوئری‌هایی که borrow_date را محدود می‌کنند فقط partition های همان سال‌ها را می‌خوانند.
+# امانتی که در هیچ سالی نیفتد در BORROWINGS_DEFAULT_PARTITION ذخیره می‌شود.
+# partition سال‌هایی که همه امانت‌هایشان برگشت خورده و قدیمی‌تر از ARCHIVE_AFTER_YEARS سال هستند از جدول
+# جدا (DETACH) و به borrowings_archive_<سال> تغییر نام داده می‌شوند؛ داده حذف نمی‌شود مگر بعد از export.
+PARTITIONED_TABLE = "borrowings"
+BORROWINGS_DEFAULT_PARTITION = "borrowings_default"
+# partition های چند سال گذشته همیشه ساخته می‌شوند تا ورود سابقه امانت‌ها به partition پیش‌فرض نرود
+PARTITION_HISTORY_YEARS = 10
+# partition سال‌های آینده زودتر ساخته می‌شوند (archive.py از cron هر سال یکی اضافه می‌کند)
+PARTITION_YEARS_AHEAD = 1
+ARCHIVE_AFTER_YEARS = 3
+# DETACH که قفل جدول borrowings را در این مدت نگیرد انجام نمی‌شود و دفعه بعد دوباره امتحان می‌شود
+ARCHIVE_LOCK_TIMEOUT = "5s"
+
+
+def partition_name(year):
+    return f"{PARTITIONED_TABLE}_y{year}"
+
+
+def archive_name(year):
+    return f"{PARTITIONED_TABLE}_archive_{year}"
+
+
+def partition_years(cur):
+    """سال partition های فعلی borrowings به ترتیب"""
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (PARTITIONED_TABLE,))
+    prefix = partition_name("")
+    return sorted(int(name[len(prefix):]) for (name,) in cur.fetchall()
+                  if name.startswith(prefix) and name[len(prefix):].isdigit())
+
+
+def ensure_partitions(cur, first_year, last_year):
+    """ساختن partition سال‌های first_year تا last_year که هنوز وجود ندارند و برگرداندن سال‌های ساخته‌شده
+
+    ایندکس‌ها، constraint ها و تریگرهای borrowings خودکار روی partition جدید هم ساخته می‌شوند.
+    """
+    existing = set(partition_years(cur))
+    created = []
+    for year in range(first_year, last_year + 1):
+        if year in existing:
+            continue
+        # partition جدید نباید ردیف‌هایی را بپوشاند که قبلا در partition پیش‌فرض رفته‌اند
+        cur.execute(f"""
+            SELECT EXISTS (SELECT 1 FROM {BORROWINGS_DEFAULT_PARTITION}
+                           WHERE borrow_date >= %s AND borrow_date < %s)
+        """, (date(year, 1, 1), date(year + 1, 1, 1)))
+        if cur.fetchone()[0]:
+            print(f"⚠️ {BORROWINGS_DEFAULT_PARTITION} has loans from {year}; "
+                  f"{partition_name(year)} is not created until they are moved.")
+            continue
+        cur.execute(f"""
+            CREATE TABLE {partition_name(year)} PARTITION OF {PARTITIONED_TABLE}
+            FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')
+        """)
+        created.append(year)
+    return created
+
+
+def archivable_years(cur, keep_years=ARCHIVE_AFTER_YEARS):
+    """سال partition هایی که قدیمی‌تر از keep_years سال هستند"""
+    return [year for year in partition_years(cur) if year < date.today().year - keep_years]
+
+
+def archive_year(conn, year):
+    """جدا کردن partition سال year به borrowings_archive_<year> در یک تراکنش
+
+    اگر امانت بازی در آن سال باشد چیزی تغییر نمی‌کند و تعداد امانت‌های باز برمی‌گردد؛ در غیر این صورت 0.
+    """
+    partition = partition_name(year)
+    # شمارش اول بدون قفل است تا امانت‌ها و بازگشت‌ها پشت خواندن partition قدیمی نمانند
+    with conn.cursor() as cur:
+        open_loans = _open_loans(cur, partition)
+    if open_loans:
+        return open_loans
+    with conn, conn.cursor() as cur:
+        # DETACH ... CONCURRENTLY با partition پیش‌فرض ممکن نیست؛ DETACH معمولی اول جدول اصلی و بعد partition را
+        # قفل می‌کند، به همان ترتیب UPDATE/DELETE های میز امانت، پس با آن‌ها deadlock نمی‌شود. پشت کوئری‌های
+        # طولانی هم صف نمی‌کشد (ARCHIVE_LOCK_TIMEOUT)
+        cur.execute("SET LOCAL lock_timeout = %s", (ARCHIVE_LOCK_TIMEOUT,))
+        cur.execute(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {partition}")
+        # امانتی که بین شمارش اول و گرفتن قفل باز شده باشد؛ حالا دیگر چیزی در این partition عوض نمی‌شود
+        open_loans = _open_loans(cur, partition)
+        if open_loans:
+            conn.rollback()
+            return open_loans
+        cur.execute(f"ALTER TABLE {partition} RENAME TO {archive_name(year)}")
+    return 0
+
+
+def _open_loans(cur, partition):
+    cur.execute(f"SELECT count(*) FROM {partition} WHERE status = %s", (BORROWED,))
+    return cur.fetchone()[0]
+
+
+def export_archive(conn, year, directory):
+    """نوشتن borrowings_archive_<year> در فایل CSV فشرده و برگرداندن مسیر فایل"""
+    path = os.path.join(directory, f"{archive_name(year)}.csv.gz")
+    with conn.cursor() as cur, gzip.open(path, "wb") as file:
+        cur.copy_expert(f"COPY {archive_name(year)} TO STDOUT WITH (FORMAT csv, HEADER true)", file)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create upcoming borrowings partitions and archive old, fully returned years (e.g. from cron).")
+    parser.add_argument("--keep-years", type=int, default=ARCHIVE_AFTER_YEARS,
+                        help=f"archive years older than this many years (default {ARCHIVE_AFTER_YEARS})")
+    parser.add_argument("--export", metavar="DIR", help="also write each archived year to DIR as .csv.gz")
+    parser.add_argument("--drop", action="store_true", help="drop archived tables after exporting them")
+    parser.add_argument("--dry-run", action="store_true", help="only print the years that would be archived")
+    args = parser.parse_args()
+    if args.drop and not args.export:
+        parser.error("--drop needs --export (archived loans are only dropped after they are exported)")
+
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                years = archivable_years(cur, args.keep_years)
+            if args.dry_run:
+                for year in years:
+                    print(f"📝 {partition_name(year)} would be archived to {archive_name(year)}")
+                if not years:
+                    print("🟢 Nothing to archive.")
+                return
+
+            with conn, conn.cursor() as cur:
+                this_year = date.today().year
+                for year in ensure_partitions(cur, this_year, this_year + PARTITION_YEARS_AHEAD):
+                    print(f"✅ Created partition {partition_name(year)}")
+
+            for year in years:
+                try:
+                    open_loans = archive_year(conn, year)
+                except errors.LockNotAvailable:
+                    print(f"⏳ {PARTITIONED_TABLE} is busy; {year} not archived, try again later.")
+                    continue
+                if open_loans:
+                    print(f"⚠️ {year} still has {open_loans} open loan(s); not archived.")
+                    continue
+                print(f"✅ Archived {partition_name(year)} to {archive_name(year)}")
+                if args.export:
+                    print(f"📦 Exported to '{export_archive(conn, year, args.export)}'")
+                    if args.drop:
+                        with conn.cursor() as cur:
+                            cur.execute(f"DROP TABLE {archive_name(year)}")
+                        print(f"🗑️ Dropped {archive_name(year)}")
+            if not years:
+                print("🟢 Nothing to archive.")
+    except Exception as e:
+        print(f"❌ Archive failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,553 @@
+import argparse
+import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import psycopg2
+
+from circulation import CirculationError, checkout, return_book
+from db import POOL_MAX_SIZE, SORT_COLUMNS, get_connection, keyset_page, filter_query, estimate_table_rows
+from export import table_columns
+from repositories import REPOSITORIES
+from search import SEARCHES
+
+# --- داده‌های ساختگی ---
+# حجم هر جدول با --scale ضرب می‌شود (مثلا --scale 0.01 برای یک اجرای سریع)
+VOLUMES = {
+    "genres": 200,
+    "publishers": 5_000,
+    "authors": 50_000,
+    "books": 1_000_000,
+    "people": 200_000,
+    "book_authors": 1_200_000,
+    "book_genres": 1_500_000,
+    "book_publishers": 1_000_000,
+    "borrowings": 5_000_000,
+}
+# ردیف‌ها در تراکنش‌های جدا با این اندازه ساخته می‌شوند
+POPULATE_CHUNK = 200_000
+# سهم کتاب‌هایی که الان امانت هستند (هر کدام یک امانت باز، پس از موجودی بیشتر نمی‌شود)
+OPEN_LOANS_SHARE = 0.2
+
+FIRST_NAMES = ["John", "Mary", "Ali", "Sara", "Reza", "Maryam", "David", "Anna", "Omid", "Leila",
+               "James", "Emma", "Hassan", "Zahra", "Peter", "Laura", "Amir", "Nina", "Thomas", "Elena"]
+LAST_NAMES = ["Tolkien", "Smith", "Ahmadi", "Rowling", "Karimi", "Brown", "Hosseini", "Martin", "Rahimi",
+              "Garcia", "Lewis", "Moradi", "Austen", "Jafari", "Orwell", "Miller", "Sadeghi", "King"]
+TITLE_WORDS = ["ring", "shadow", "history", "garden", "night", "river", "stone", "silent", "king", "war",
+               "peace", "city", "secret", "journey", "light", "winter", "sea", "fire", "house", "road"]
+# زبان‌ها با وزن تکرار (انگلیسی بیشتر از بقیه)
+LANGUAGES = ["English"] * 6 + ["Persian"] * 2 + ["French", "German"]
+
+# --- سنجش ---
+# هم‌اندازه PAGE_SIZE در Main_application.py
+BENCH_PAGE_SIZE = 200
+SEARCH_KEYWORDS = ("tolkien", "ring", "42")
+# فیلترهای ستون‌ها مثل ردیف Filter صفحه‌ها: (جدول، ستون -> متن فیلتر)
+FILTERS = (
+    ("books", {"name": "peace"}),
+    ("people", {"last_name": "mor"}),
+    ("borrowings", {"status": "=borrowed", "borrow_date": ">=2024-01-01"}),
+)
+# تعداد ردیف‌های انتخاب‌شده برای پیش‌نمایش حذف گروهی
+BULK_ROWS = 1000
+# کارهای پرتکرار صفحه‌ها که یک بار با prepared statement (db.execute_prepared) و یک بار بدون آن سنجیده می‌شوند
+PREPARED_SEARCH_KEYWORDS = ("ring", "tolkien")
+DEFAULT_REPEAT = 20
+
+# انتخاب id با توزیع نامتوازن: تعداد کمی کتاب/شخص بیشترِ امانت‌ها را دارند
+_SKEWED_ID = "1 + floor({count} * power(random(), {power}))::int"
+_PICK = "(%({array})s::text[])[1 + floor(random() * array_length(%({array})s::text[], 1))::int]"
+
+POPULATE_QUERIES = {
+    "genres": f"""
+        INSERT INTO genres (name)
+        SELECT initcap({_PICK.format(array="words")}) || ' ' || g
+        FROM generate_series(%(start)s, %(stop)s) AS g
+    """,
+    "publishers": f"""
+        INSERT INTO publishers (name, address)
+        SELECT initcap({_PICK.format(array="words")}) || ' Press ' || g,
+               g || ' ' || initcap({_PICK.format(array="words")}) || ' Street'
+        FROM generate_series(%(start)s, %(stop)s) AS g
+    """,
+    "authors": f"""
+        INSERT INTO authors (first_name, last_name, start_of_activity, language)
+        SELECT {_PICK.format(array="first_names")}, {_PICK.format(array="last_names")},
+               DATE '1900-01-01' + floor(random() * 44000)::int, {_PICK.format(array="languages")}
+        FROM generate_series(%(start)s, %(stop)s) AS g
+    """,
+    "books": f"""
+        INSERT INTO books (name, publish_date, description, number_of_books, language)
+        SELECT initcap({_PICK.format(array="words")} || ' ' || {_PICK.format(array="words")}
+                       || ' ' || {_PICK.format(array="words")}),
+               DATE '1900-01-01' + floor(random() * 45000)::int,
+               'A book about ' || {_PICK.format(array="words")} || ' and ' || {_PICK.format(array="words")},
+               1 + floor(power(random(), 2) * 10)::int,
+               {_PICK.format(array="languages")}
+        FROM generate_series(%(start)s, %(stop)s) AS g
+    """,
+    "people": f"""
+        INSERT INTO people (first_name, last_name, email, phone, address)
+        SELECT p.first_name, p.last_name,
+               lower(p.first_name || '.' || p.last_name || p.g) || '@example.com',
+               '09' || lpad((floor(random() * 1000000000))::bigint::text, 9, '0'),
+               p.g || ' ' || initcap({_PICK.format(array="words")}) || ' Avenue'
+        FROM (
+            SELECT g, {_PICK.format(array="first_names")} AS first_name, {_PICK.format(array="last_names")} AS last_name
+            FROM generate_series(%(start)s, %(stop)s) AS g
+        ) AS p
+    """,
+    # هر کتاب به نوبت یک رابطه می‌گیرد؛ طرف دیگر رابطه با توزیع نامتوازن انتخاب می‌شود
+    "book_authors": f"""
+        INSERT INTO book_authors (book_id, author_id)
+        SELECT (g - 1) %% %(books)s + 1, {_SKEWED_ID.format(count="%(authors)s", power=2)}
+        FROM generate_series(%(start)s, %(stop)s) AS g
+        ON CONFLICT DO NOTHING
+    """,
+    "book_genres": f"""
+        INSERT INTO book_genres (book_id, genre_id)
+        SELECT (g - 1) %% %(books)s + 1, {_SKEWED_ID.format(count="%(genres)s", power=2)}
+        FROM generate_series(%(start)s, %(stop)s) AS g
+        ON CONFLICT DO NOTHING
+    """,
+    "book_publishers": f"""
+        INSERT INTO book_publishers (book_id, publisher_id)
+        SELECT (g - 1) %% %(books)s + 1, {_SKEWED_ID.format(count="%(publishers)s", power=2)}
+        FROM generate_series(%(start)s, %(stop)s) AS g
+        ON CONFLICT DO NOTHING
+    """,
+    # سابقه امانت‌های برگشت‌خورده ده سال گذشته
+    "borrowings": f"""
+        INSERT INTO borrowings (book_id, person_id, borrow_date, return_date, status)
+        SELECT b.book_id, b.person_id, b.borrow_date,
+               least(b.borrow_date + 1 + floor(random() * 60)::int, CURRENT_DATE), 'returned'
+        FROM (
+            SELECT {_SKEWED_ID.format(count="%(books)s", power=3)} AS book_id,
+                   {_SKEWED_ID.format(count="%(people)s", power=2)} AS person_id,
+                   CURRENT_DATE - 30 - floor(random() * 3620)::int AS borrow_date
+            FROM generate_series(%(start)s, %(stop)s) AS g
+        ) AS b
+    """,
+}
+# امانت‌های باز ماه اخیر؛ تریگر setup_db.py موجودی کتاب‌ها را کم می‌کند
+OPEN_LOANS_QUERY = f"""
+    INSERT INTO borrowings (book_id, person_id, borrow_date, status)
+    SELECT id, {_SKEWED_ID.format(count="%(people)s", power=2)}, CURRENT_DATE - floor(random() * 30)::int, 'borrowed'
+    FROM books
+    WHERE random() < %(open_share)s
+"""
+
+
+def populate(conn, scale, reset=False):
+    """پر کردن جدول‌ها با داده ساختگی به حجم VOLUMES * scale"""
+    counts = {table: max(1, round(volume * scale)) for table, volume in VOLUMES.items()}
+    params = {"words": TITLE_WORDS, "first_names": FIRST_NAMES, "last_names": LAST_NAMES,
+              "languages": LANGUAGES, **counts}
+    cur = conn.cursor()
+
+    try:
+        if reset:
+            cur.execute(f"TRUNCATE {', '.join(VOLUMES)} RESTART IDENTITY CASCADE;")
+            print("🧹 All tables were emptied.")
+        else:
+            # id ها از ۱ شروع فرض می‌شوند، پس جدول‌ها باید خالی باشند
+            for table in VOLUMES:
+                cur.execute(f"SELECT EXISTS (SELECT 1 FROM {table});")
+                if cur.fetchone()[0]:
+                    print(f"❌ Table '{table}' is not empty. Use --reset to empty all tables first.")
+                    return False
+
+        for table, query in POPULATE_QUERIES.items():
+            started = time.perf_counter()
+            for start in range(1, counts[table] + 1, POPULATE_CHUNK):
+                stop = min(start + POPULATE_CHUNK - 1, counts[table])
+                # هزاران NOTIFY تک‌ردیفی به کلاینت‌های باز فرستاده نمی‌شود
+                with conn:
+                    cur.execute("SET LOCAL library.skip_notify = 'on';")
+                    cur.execute(query, {**params, "start": start, "stop": stop})
+                print(f"\r📤 {table}: {stop}/{counts[table]}", end="", flush=True)
+            print(f"\r✅ {table}: {counts[table]} rows in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        with conn:
+            cur.execute("SET LOCAL library.skip_notify = 'on';")
+            cur.execute(OPEN_LOANS_QUERY, {**params, "open_share": OPEN_LOANS_SHARE})
+        print(f"✅ open loans: {cur.rowcount} rows in {time.perf_counter() - started:.1f}s")
+
+        cur.execute("ANALYZE;")
+    except Exception as e:
+        print(f"\n❌ Error populating tables: {e}")
+        return False
+    finally:
+        cur.close()
+
+    return True
+
+
+# --- عملیات‌هایی که زمان‌شان اندازه گرفته می‌شود ---
+def _load_operation(table, base_query):
+    # همان کار load_from_db: تخمین تعداد ردیف‌ها و صفحه اول keyset
+    def operation(cur):
+        estimate_table_rows(cur, table)
+        cur.execute(*keyset_page(base_query, (), BENCH_PAGE_SIZE))
+        cur.fetchall()
+    return operation
+
+
+def _scroll_operation(base_query, max_id, rng):
+    # همان کار fetch_page: صفحه بعدی از یک نقطه تصادفی جدول
+    def operation(cur):
+        cur.execute(*keyset_page(base_query, (), BENCH_PAGE_SIZE, after_id=rng.randint(1, max_id)))
+        cur.fetchall()
+    return operation
+
+
+def _sort_operation(base_query, column, index):
+    # همان کار sort_by و fetch_page: صفحه اول به ترتیب نزولی ستون و صفحه بعد از آن
+    def operation(cur):
+        cur.execute(*keyset_page(base_query, (), BENCH_PAGE_SIZE, sort_column=column, descending=True))
+        rows = cur.fetchall()
+        if rows:
+            cur.execute(*keyset_page(base_query, (), BENCH_PAGE_SIZE, after_id=rows[-1][0], sort_column=column,
+                                     descending=True, sort_value=rows[-1][index]))
+            cur.fetchall()
+    return operation
+
+
+def _filter_operation(base_query, filters):
+    # همان کار apply_filters: صفحه اول ردیف‌های فیلترشده
+    def operation(cur):
+        cur.execute(*keyset_page(*filter_query(base_query, (), filters), BENCH_PAGE_SIZE))
+        cur.fetchall()
+    return operation
+
+
+def _delete_impact_operation(table, max_id, rng):
+    # همان کار delete_item قبل از پرسیدن: ردیف‌های وابسته به BULK_ROWS ردیف تصادفی (چیزی حذف نمی‌شود)
+    repository = REPOSITORIES[table]
+
+    def operation(cur):
+        repository.delete_impact(cur.connection, rng.sample(range(1, max_id + 1), min(BULK_ROWS, max_id)))
+    return operation
+
+
+def _recent_operation(repository):
+    # همان کار صفحه امانت‌ها: تخمین و صفحه اول و دوم امانت‌های اخیر به ترتیب نزولی تاریخ (partition های اخیر)
+    def operation(cur):
+        conn = cur.connection
+        repository.estimate(conn)
+        rows = repository.page(conn, BENCH_PAGE_SIZE, sort_column="borrow_date", descending=True)
+        if rows:
+            repository.page(conn, BENCH_PAGE_SIZE, after_id=rows[-1].id, sort_column="borrow_date",
+                            descending=True, sort_value=rows[-1].borrow_date)
+    return operation
+
+
+def _search_operation(build_search, keyword):
+    def operation(cur):
+        cur.execute(*build_search(keyword))
+        cur.fetchall()
+    return operation
+
+
+def _page_search_operation(repository, keyword):
+    # همان کار BooksPage.perform_search: نتیجه جستجو از مسیر repository (قابل prepare)
+    def operation(cur):
+        repository.rows(cur.connection, repository.source(search=repository.search_query(keyword)))
+    return operation
+
+
+def _add_borrowing_operations(max_ids, rng):
+    """همان کار BorrowingsPage.add_item (امانت باز از مسیر checkout) و تابع پاک کردن امانت‌های ساخته‌شده"""
+    repository = REPOSITORIES["borrowings"]
+    created = []
+
+    def operation(cur):
+        for _ in range(20):
+            try:
+                row = repository.insert(cur.connection, (rng.randint(1, max_ids["books"]),
+                                                         rng.randint(1, max_ids["people"]), None, None, "borrowed"))
+            except CirculationError:
+                continue
+            created.append(row.id)
+            return
+
+    def cleanup():
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM borrowings WHERE id = ANY(%s)", (created,))
+
+    return operation, cleanup
+
+
+def _unprepared(operation):
+    # همان operation با cur.execute معمولی به جای prepared statement های اتصال
+    def unprepared_operation(cur):
+        cur.connection.prepare_statements = False
+        try:
+            operation(cur)
+        finally:
+            cur.connection.prepare_statements = True
+    return unprepared_operation
+
+
+def _sample_values(table, max_ids, rng):
+    """مقادیر تصادفی برای INSERT/UPDATE یک ردیف، مثل فرم‌های صفحه‌ها"""
+    word = rng.choice(TITLE_WORDS)
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    day = date(1950, 1, 1) + timedelta(days=rng.randrange(27000))
+    token = f"{rng.getrandbits(32):08x}"
+    if table == "genres":
+        return {"name": f"Bench {word} {token}"}
+    if table == "publishers":
+        return {"name": f"Bench {word} Press", "address": f"{token} Bench Street"}
+    if table == "authors":
+        return {"first_name": first, "last_name": last, "start_of_activity": day, "language": "English"}
+    if table == "books":
+        return {"name": f"Bench {word} {token}", "publish_date": day, "description": "Benchmark book",
+                "number_of_books": rng.randint(1, 10), "language": "English"}
+    if table == "people":
+        return {"first_name": first, "last_name": last, "email": f"{token}@bench.example.com",
+                "phone": f"09{rng.randrange(10 ** 9):09d}", "address": f"{token} Bench Avenue"}
+    if table == "borrowings":
+        return {"book_id": rng.randint(1, max_ids["books"]), "person_id": rng.randint(1, max_ids["people"]),
+                "borrow_date": date.today(), "return_date": None, "status": "borrowed"}
+    # جدول‌های رابطه: book_authors -> author_id و ...
+    other = {"book_authors": "authors", "book_genres": "genres", "book_publishers": "publishers"}[table]
+    return {"book_id": rng.randint(1, max_ids["books"]), f"{other[:-1]}_id": rng.randint(1, max_ids[other])}
+
+
+def _write_operations(table, max_ids, rng):
+    """سه عملیات insert/update/delete روی ردیف‌هایی که خود بنچمارک می‌سازد (داده اصلی دست نمی‌خورد)"""
+    created = []
+
+    def insert(cur):
+        # جدول‌های رابطه UNIQUE دارند؛ جفت تکراری با مقادیر تازه دوباره امتحان می‌شود
+        for _ in range(20):
+            values = _sample_values(table, max_ids, rng)
+            try:
+                cur.execute(f"INSERT INTO {table} ({', '.join(values)}) VALUES ({', '.join(['%s'] * len(values))})"
+                            f" RETURNING *", tuple(values.values()))
+            except psycopg2.IntegrityError:
+                continue
+            created.append(cur.fetchone()[0])
+            return
+
+    def update(cur):
+        # ردیف تکراری در جدول‌های رابطه مهم نیست، فقط زمان UPDATE سنجیده می‌شود
+        values = _sample_values(table, max_ids, rng)
+        try:
+            cur.execute(f"UPDATE {table} SET {', '.join(f'{column}=%s' for column in values)} WHERE id=%s"
+                        f" RETURNING *", (*values.values(), rng.choice(created or [0])))
+        except psycopg2.IntegrityError:
+            pass
+
+    def delete(cur):
+        if created:
+            cur.execute(f"DELETE FROM {table} WHERE id = %s", (created.pop(),))
+
+    return insert, update, delete
+
+
+def _circulation_operations(max_ids, rng):
+    """امانت و بازگشت از مسیر تراکنشی circulation و تابع پاک کردن امانت‌هایی که بنچمارک ساخته"""
+    created, opened = [], []
+
+    def checkout_operation(cur):
+        # کتاب بدون موجودی یا شخص غیرفعال با مقادیر دیگر دوباره امتحان می‌شود
+        for _ in range(20):
+            try:
+                borrowing_id = checkout(cur.connection, rng.randint(1, max_ids["books"]),
+                                        rng.randint(1, max_ids["people"]))[0]
+            except CirculationError:
+                continue
+            created.append(borrowing_id)
+            opened.append(borrowing_id)
+            return
+
+    def return_operation(cur):
+        if opened:
+            return_book(cur.connection, opened.pop())
+
+    def cleanup():
+        # حذف امانت باز موجودی کتاب را با تریگر برمی‌گرداند
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM borrowings WHERE id = ANY(%s)", (created,))
+
+    return checkout_operation, return_operation, cleanup
+
+
+def build_operations(conn, rng):
+    """فهرست (نام، تابع) همه عملیات‌های سنجیده‌شده به ترتیب اجرا و توابعی که بعد از آن‌ها داده را تمیز می‌کنند"""
+    with conn.cursor() as cur:
+        max_ids = {}
+        columns = {}
+        base_queries = {}
+        for table in VOLUMES:
+            cur.execute(f"SELECT coalesce(max(id), 0) FROM {table}")
+            max_ids[table] = cur.fetchone()[0]
+            # همان ستون‌هایی که صفحه‌ها می‌خوانند (Repository.select_list)
+            columns[table] = table_columns(table)
+            base_queries[table] = f"SELECT {REPOSITORIES[table].select_list} FROM {table}"
+
+    if not all(max_ids.values()):
+        empty = ", ".join(table for table, max_id in max_ids.items() if not max_id)
+        raise RuntimeError(f"Tables are empty ({empty}); run 'python benchmark.py populate' first.")
+
+    operations = []
+    for table, base_query in base_queries.items():
+        operations.append((f"load {table}", _load_operation(table, base_query)))
+        operations.append((f"scroll {table}", _scroll_operation(base_query, max_ids[table], rng)))
+    operations.append(("load recent borrowings", _recent_operation(REPOSITORIES["borrowings"].recent())))
+    for table, sort_columns in SORT_COLUMNS.items():
+        for column in sort_columns:
+            operations.append((f"sort {table} by {column}",
+                               _sort_operation(base_queries[table], column, columns[table].index(column))))
+    for table, filters in FILTERS:
+        operations.append((f"filter {table} by {', '.join(filters)}", _filter_operation(base_queries[table], filters)))
+    for table, build_search in SEARCHES.items():
+        for keyword in SEARCH_KEYWORDS:
+            operations.append((f"search {table} '{keyword}'", _search_operation(build_search, keyword)))
+    for table in VOLUMES:
+        insert, update, delete = _write_operations(table, max_ids, rng)
+        operations += [(f"insert {table}", insert), (f"update {table}", update), (f"delete {table}", delete)]
+    for table in ("books", "people"):
+        operations.append((f"delete preview {table}", _delete_impact_operation(table, max_ids[table], rng)))
+    # امانت‌ها مثل باجه واقعی هم‌زمان (با --clients) اجرا می‌شوند
+    checkout_operation, return_operation, cleanup = _circulation_operations(max_ids, rng)
+    operations += [("checkout", checkout_operation), ("return", return_operation)]
+    # اختلاف هر جفت زمان parse و plan است که prepared statement ها صرفه‌جویی می‌کنند
+    add_borrowing, add_cleanup = _add_borrowing_operations(max_ids, rng)
+    hot_paths = [("add borrowing", add_borrowing)]
+    hot_paths += [(f"page search books '{keyword}'", _page_search_operation(REPOSITORIES["books"], keyword))
+                  for keyword in PREPARED_SEARCH_KEYWORDS]
+    for name, operation in hot_paths:
+        operations += [(f"{name} [prepared]", operation), (f"{name} [unprepared]", _unprepared(operation))]
+    return operations, [cleanup, add_cleanup]
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))]
+
+
+def measure(operation, repeat, clients):
+    """اجرای operation به تعداد repeat (با clients اتصال هم‌زمان) و برگرداندن p50/p95 و توان عملیاتی"""
+
+    def timed():
+        started = time.perf_counter()
+        # زمان گرفتن اتصال از pool هم جزو زمان عملیات است، مثل برنامه اصلی
+        with get_connection() as conn, conn.cursor() as cur:
+            operation(cur)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    if clients == 1:
+        latencies = [timed() for _ in range(repeat)]
+    else:
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            latencies = list(executor.map(lambda _: timed(), range(repeat)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "count": repeat,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "ops_per_sec": repeat / elapsed,
+    }
+
+
+def run_suite(repeat, clients, only=None, seed=0):
+    rng = random.Random(seed)
+    with get_connection() as conn:
+        operations, cleanups = build_operations(conn, rng)
+
+    results = {}
+    try:
+        for name, operation in operations:
+            if only and only not in name:
+                continue
+            # write ها روی ردیف‌های insert شده کار می‌کنند و هم‌زمان اجرا نمی‌شوند
+            if name.split()[0] in ("insert", "update", "delete"):
+                results[name] = measure(operation, repeat, 1)
+            else:
+                # یک اجرای اولیه برای گرم شدن cache ها
+                with get_connection() as conn, conn.cursor() as cur:
+                    operation(cur)
+                results[name] = measure(operation, repeat, clients)
+            print_result(name, results[name])
+    finally:
+        for cleanup in cleanups:
+            cleanup()
+    return results
+
+
+def print_header(extra=""):
+    print(f"{'operation':<42} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'ops/s':>9}{extra}")
+
+
+def print_result(name, result, baseline=None):
+    line = (f"{name:<42} {result['count']:>5} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f}"
+            f" {result['ops_per_sec']:>9.1f}")
+    if baseline:
+        change = (result["p95_ms"] - baseline["p95_ms"]) / baseline["p95_ms"] * 100
+        line += f" {change:>+8.1f}%"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Populate the library schema with synthetic data and time its queries.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    populate_parser = commands.add_parser("populate", help="fill the tables with synthetic data")
+    populate_parser.add_argument("--scale", type=float, default=1.0,
+                                 help="multiplier for the default volumes (1M books, 200k people, 5M borrowings)")
+    populate_parser.add_argument("--reset", action="store_true", help="empty all tables before populating")
+
+    run_parser = commands.add_parser("run", help="time page loads, searches and writes")
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="runs per operation")
+    run_parser.add_argument("--clients", type=int, default=1, help="concurrent connections for read operations")
+    run_parser.add_argument("--only", help="run only operations whose name contains this text")
+    run_parser.add_argument("--save", help="write the results to this JSON file")
+    run_parser.add_argument("--compare", help="show the p95 change against a JSON file saved with --save")
+    args = parser.parse_args()
+
+    if args.command == "populate":
+        print(f"🚀 Populating tables (scale {args.scale})")
+        with get_connection() as conn:
+            if not populate(conn, args.scale, args.reset):
+                sys.exit(1)
+        print("🎉 Synthetic data is ready.")
+        return
+
+    clients = max(1, min(args.clients, POOL_MAX_SIZE))
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+    print(f"🚀 Running benchmark ({args.repeat} runs per operation, {clients} client(s))")
+    print_header()
+    try:
+        results = run_suite(args.repeat, clients, args.only)
+    except Exception as e:
+        print(f"❌ Benchmark failed: {e}")
+        sys.exit(1)
+
+    if baseline:
+        print("-" * 40)
+        print(f"📊 Compared with '{args.compare}'")
+        print_header(" p95 diff")
+        for name, result in results.items():
+            if name in baseline:
+                print_result(name, result, baseline[name])
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        print(f"📝 Results written to '{args.save}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+from db import get_connection, CHANGES_CHANNEL
+
+# --- ورود گروهی داده با COPY ---
+# فایل CSV/JSON مستقیم با COPY FROM STDIN به یک جدول موقت (همه ستون‌ها متنی) فرستاده می‌شود،
+# بعد اعتبارسنجی و درج در جدول اصلی و جدول‌های رابط با چند دستور SQL مجموعه‌ای انجام می‌شود.
+# برای کتاب‌ها ستون‌های authors / genres / publishers نام‌ها را با ; جدا می‌کنند.
+ENTITIES = {
+    "books": ("name", "publish_date", "description", "number_of_books", "language",
+              "authors", "genres", "publishers"),
+    "authors": ("first_name", "last_name", "start_of_activity", "language"),
+    "people": ("first_name", "last_name", "email", "phone", "address"),
+}
+
+LIST_SEPARATOR = ";"
+
+
+class _ProgressReader:
+    """فایل را برای COPY می‌خواند و تعداد بایت‌های خوانده‌شده را گزارش می‌دهد"""
+
+    def __init__(self, file, progress=None, total=None):
+        self.file = file
+        self.progress = progress
+        self.total = total
+        self.done = 0
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.done += len(data)
+        if self.progress:
+            self.progress(self.done, self.total)
+        return data
+
+
+class _CsvStream:
+    """تبدیل تدریجی dict های JSON به متن CSV برای COPY (بدون نگه داشتن کل فایل در حافظه)"""
+
+    def __init__(self, records, columns):
+        self.records = iter(records)
+        self.columns = columns
+        self.buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                record = next(self.records)
+            except StopIteration:
+                break
+            out = io.StringIO()
+            csv.writer(out).writerow([self._value(record.get(col)) for col in self.columns])
+            self.buffer += out.getvalue()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    @staticmethod
+    def _value(value):
+        if isinstance(value, list):
+            return LIST_SEPARATOR.join(str(item) for item in value)
+        return value
+
+
+def _json_records(file, path):
+    if path.lower().endswith(".jsonl"):
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from json.load(file)
+
+
+def _create_staging(cur, entity, columns):
+    column_defs = ", ".join(f"{col} TEXT" for col in ENTITIES[entity])
+    cur.execute(f"""
+        CREATE TEMP TABLE import_staging (
+            line_no BIGSERIAL,
+            {column_defs},
+            error TEXT,
+            new_id INTEGER
+        ) ON COMMIT DROP;
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION pg_temp.try_date(value TEXT) RETURNS DATE AS $$
+        BEGIN
+            RETURN nullif(trim(value), '')::DATE;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+
+def _copy_into_staging(cur, entity, path, progress=None):
+    """ارسال فایل به جدول موقت با COPY و برگرداندن تعداد ردیف‌ها"""
+    known = ENTITIES[entity]
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        if path.lower().endswith((".json", ".jsonl")):
+            columns = known
+            source = _CsvStream(_json_records(file, path), columns)
+        else:
+            columns = tuple(col.strip().lower() for col in next(csv.reader([file.readline()])))
+            unknown = [col for col in columns if col not in known]
+            if unknown:
+                raise ValueError(f"Unknown columns for {entity}: {', '.join(unknown)}")
+            source = _ProgressReader(file, progress, os.path.getsize(path))
+        _create_staging(cur, entity, columns)
+        cur.copy_expert(f"COPY import_staging ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", source)
+    cur.execute("SELECT count(*) FROM import_staging")
+    return cur.fetchone()[0]
+
+
+def _import_books(cur):
+    cur.execute(r"""
+        UPDATE import_staging SET error = CASE
+            WHEN nullif(trim(name), '') IS NULL THEN 'name is required'
+            WHEN nullif(trim(publish_date), '') IS NOT NULL AND pg_temp.try_date(publish_date) IS NULL
+                THEN 'invalid publish_date'
+            WHEN nullif(trim(number_of_books), '') IS NOT NULL AND trim(number_of_books) !~ '^\d{1,9}$'
+                THEN 'invalid number_of_books'
+            -- مقدار بلندتر از ستون VARCHAR موقع درج کل تراکنش را خراب می‌کند، پس همین‌جا رد می‌شود
+            WHEN length(trim(name)) > 200 THEN 'name is too long'
+            WHEN length(trim(language)) > 50 THEN 'language is too long'
+            WHEN EXISTS (SELECT 1 FROM unnest(string_to_array(genres, %(sep)s)) AS x(name)
+                         WHERE length(trim(x.name)) > 100) THEN 'genre name is too long'
+            WHEN EXISTS (SELECT 1 FROM unnest(string_to_array(publishers, %(sep)s)) AS x(name)
+                         WHERE length(trim(x.name)) > 150) THEN 'publisher name is too long'
+            WHEN EXISTS (SELECT 1 FROM unnest(string_to_array(authors, %(sep)s)) AS x(name)
+                         WHERE length(substring(trim(x.name) FROM '(\S+)$')) > 100
+                            OR length(regexp_replace(trim(x.name), '\s+\S+$', '')) > 100)
+                THEN 'author name is too long'
+        END;
+    """, {"sep": LIST_SEPARATOR})
+    cur.execute("""
+        UPDATE import_staging SET new_id = nextval(pg_get_serial_sequence('books', 'id'))
+        WHERE error IS NULL;
+    """)
+    cur.execute("""
+        INSERT INTO books (id, name, publish_date, description, number_of_books, language)
+        SELECT new_id, trim(name), pg_temp.try_date(publish_date), description,
+               coalesce(nullif(trim(number_of_books), '')::INTEGER, 1), nullif(trim(language), '')
+        FROM import_staging
+        WHERE error IS NULL
+        ORDER BY line_no;
+    """)
+
+    # نام‌های جداشده با ; به ردیف تبدیل می‌شوند
+    cur.execute("""
+        CREATE TEMP TABLE import_links ON COMMIT DROP AS
+        SELECT s.new_id AS book_id, 'author' AS kind, trim(x.name) AS name
+        FROM import_staging s, unnest(string_to_array(s.authors, %(sep)s)) AS x(name)
+        WHERE s.error IS NULL AND trim(x.name) <> ''
+        UNION
+        SELECT s.new_id, 'genre', trim(x.name)
+        FROM import_staging s, unnest(string_to_array(s.genres, %(sep)s)) AS x(name)
+        WHERE s.error IS NULL AND trim(x.name) <> ''
+        UNION
+        SELECT s.new_id, 'publisher', trim(x.name)
+        FROM import_staging s, unnest(string_to_array(s.publishers, %(sep)s)) AS x(name)
+        WHERE s.error IS NULL AND trim(x.name) <> '';
+    """, {"sep": LIST_SEPARATOR})
+
+    # ژانرها
+    cur.execute("""
+        INSERT INTO genres (name)
+        SELECT DISTINCT name FROM import_links WHERE kind = 'genre'
+        ON CONFLICT (name) DO NOTHING;
+    """)
+    cur.execute("""
+        INSERT INTO book_genres (book_id, genre_id)
+        SELECT l.book_id, g.id
+        FROM import_links l JOIN genres g ON g.name = l.name
+        WHERE l.kind = 'genre'
+        ON CONFLICT DO NOTHING;
+    """)
+
+    # ناشران (نام یکتا نیست؛ با اولین ناشر هم‌نام تطبیق داده می‌شود)
+    cur.execute("""
+        INSERT INTO publishers (name)
+        SELECT DISTINCT ON (lower(l.name)) l.name
+        FROM import_links l
+        WHERE l.kind = 'publisher'
+          AND NOT EXISTS (SELECT 1 FROM publishers p WHERE lower(p.name) = lower(l.name));
+    """)
+    cur.execute("""
+        INSERT INTO book_publishers (book_id, publisher_id)
+        SELECT l.book_id, p.id
+        FROM import_links l
+        JOIN (SELECT DISTINCT ON (lower(name)) id, lower(name) AS key FROM publishers ORDER BY lower(name), id) p
+          ON p.key = lower(l.name)
+        WHERE l.kind = 'publisher'
+        ON CONFLICT DO NOTHING;
+    """)
+
+    # نویسندگان ("نام نام‌خانوادگی"؛ آخرین کلمه نام خانوادگی است)
+    cur.execute(r"""
+        INSERT INTO authors (first_name, last_name)
+        SELECT DISTINCT ON (lower(l.name))
+               CASE WHEN l.name ~ '\s' THEN regexp_replace(l.name, '\s+\S+$', '') ELSE '' END,
+               substring(l.name FROM '(\S+)$')
+        FROM import_links l
+        WHERE l.kind = 'author'
+          AND NOT EXISTS (
+              SELECT 1 FROM authors a WHERE lower(trim(a.first_name || ' ' || a.last_name)) = lower(l.name));
+    """)
+    cur.execute("""
+        INSERT INTO book_authors (book_id, author_id)
+        SELECT l.book_id, a.id
+        FROM import_links l
+        JOIN (SELECT DISTINCT ON (lower(trim(first_name || ' ' || last_name)))
+                     id, lower(trim(first_name || ' ' || last_name)) AS key
+              FROM authors ORDER BY lower(trim(first_name || ' ' || last_name)), id) a
+          ON a.key = lower(l.name)
+        WHERE l.kind = 'author'
+        ON CONFLICT DO NOTHING;
+    """)
+    return ("books", "genres", "publishers", "authors", "book_genres", "book_publishers", "book_authors")
+
+
+def _import_authors(cur):
+    cur.execute("""
+        UPDATE import_staging SET error = CASE
+            WHEN nullif(trim(first_name), '') IS NULL THEN 'first_name is required'
+            WHEN nullif(trim(last_name), '') IS NULL THEN 'last_name is required'
+            WHEN nullif(trim(start_of_activity), '') IS NOT NULL AND pg_temp.try_date(start_of_activity) IS NULL
+                THEN 'invalid start_of_activity'
+            WHEN length(trim(first_name)) > 100 THEN 'first_name is too long'
+            WHEN length(trim(last_name)) > 100 THEN 'last_name is too long'
+            WHEN length(trim(language)) > 50 THEN 'language is too long'
+        END;
+    """)
+    cur.execute("""
+        INSERT INTO authors (first_name, last_name, start_of_activity, language)
+        SELECT trim(first_name), trim(last_name), pg_temp.try_date(start_of_activity), nullif(trim(language), '')
+        FROM import_staging
+        WHERE error IS NULL
+        ORDER BY line_no;
+    """)
+    return ("authors",)
+
+
+def _import_people(cur):
+    cur.execute(r"""
+        UPDATE import_staging SET error = CASE
+            WHEN nullif(trim(first_name), '') IS NULL THEN 'first_name is required'
+            WHEN nullif(trim(last_name), '') IS NULL THEN 'last_name is required'
+            WHEN nullif(trim(email), '') IS NOT NULL AND trim(email) !~ '^[^@\s]+@[^@\s]+\.[^@\s]+$'
+                THEN 'invalid email'
+            WHEN length(trim(first_name)) > 100 THEN 'first_name is too long'
+            WHEN length(trim(last_name)) > 100 THEN 'last_name is too long'
+            WHEN length(trim(email)) > 150 THEN 'email is too long'
+            WHEN length(trim(phone)) > 20 THEN 'phone is too long'
+        END;
+    """)
+    cur.execute("""
+        INSERT INTO people (first_name, last_name, email, phone, address)
+        SELECT trim(first_name), trim(last_name), nullif(trim(email), ''), nullif(trim(phone), ''), address
+        FROM import_staging
+        WHERE error IS NULL
+        ORDER BY line_no;
+    """)
+    return ("people",)
+
+
+_IMPORTERS = {"books": _import_books, "authors": _import_authors, "people": _import_people}
+
+
+def import_file(conn, entity, path, progress=None):
+    """ورود گروهی یک فایل CSV/JSON/JSONL در یک تراکنش
+
+    خروجی: (تعداد ردیف‌های واردشده، لیست (شماره ردیف داده، خطا) برای ردیف‌های ردشده)
+    """
+    if entity not in ENTITIES:
+        raise ValueError(f"Import is not supported for '{entity}'")
+    with conn, conn.cursor() as cur:
+        # به جای یک NOTIFY برای هر ردیف، در پایان برای هر جدول یک RESYNC فرستاده می‌شود
+        cur.execute("SET LOCAL library.skip_notify = 'on'")
+        total = _copy_into_staging(cur, entity, path, progress)
+        changed_tables = _IMPORTERS[entity](cur)
+        cur.execute("SELECT line_no, error FROM import_staging WHERE error IS NOT NULL ORDER BY line_no")
+        rejected = cur.fetchall()
+        for table in changed_tables:
+            cur.execute("SELECT pg_notify(%s, %s)",
+                        (CHANGES_CHANNEL, json.dumps({"table": table, "op": "RESYNC", "id": None})))
+            # نسخه‌های محلی (offline.py) هم کل جدول را دوباره می‌خوانند؛ مثل تریگرها فقط وقتی change_log روشن است
+            cur.execute("""
+                INSERT INTO change_log (table_name, op)
+                SELECT %s, 'RESYNC' WHERE (SELECT enabled FROM change_log_settings)
+            """, (table,))
+    return total - len(rejected), rejected
+
+
+def write_rejects(path, rejected):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(("row", "error"))
+        writer.writerows(rejected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import books, authors or people from CSV/JSON files.")
+    parser.add_argument("entity", choices=sorted(ENTITIES))
+    parser.add_argument("path", help="CSV file with a header row, JSON array or JSON Lines (.jsonl) file")
+    parser.add_argument("--rejects", help="write rejected rows (row number and reason) to this CSV file")
+    args = parser.parse_args()
+
+    def progress(done, total):
+        if total:
+            print(f"\r📤 Sending... {done * 100 // total}%", end="", flush=True)
+
+    print(f"🚀 Importing {args.entity} from '{args.path}'")
+    try:
+        with get_connection() as conn:
+            imported, rejected = import_file(conn, args.entity, args.path, progress)
+    except Exception as e:
+        print(f"\n❌ Import failed: {e}")
+        sys.exit(1)
+
+    print(f"\n✅ Imported {imported} rows.")
+    if rejected:
+        print(f"⚠️ Rejected {len(rejected)} rows:")
+        for line_no, error in rejected[:10]:
+            print(f"   row {line_no}: {error}")
+        if args.rejects:
+            write_rejects(args.rejects, rejected)
+            print(f"📝 Rejected rows written to '{args.rejects}'.")
+
+
+if __name__ == "__main__":
+    main()
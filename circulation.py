@@ -0,0 +1,107 @@
+from collections import Counter
+
+from db import execute_prepared
+from lookups import NAME_COLUMNS
+
+# --- امانت و بازگشت کتاب ---
+# ستون books.available_copies با تریگرهای setup_db.py همیشه برابر number_of_books منهای امانت‌های باز
+# (status = 'borrowed') است؛ پس موجودی بدون COUNT روی borrowings معلوم است.
+# هر امانت در یک تراکنش ردیف کتاب را با FOR UPDATE قفل می‌کند: امانت‌های هم‌زمان یک کتاب پشت سر هم
+# انجام می‌شوند و امانت کتاب‌های دیگر منتظر نمی‌ماند.
+BORROWED = "borrowed"
+RETURNED = "returned"
+# به ترتیب ستون‌های صفحه Borrowings
+BORROWING_COLUMNS = "id, book_id, person_id, borrow_date, return_date, status"
+
+
+class CirculationError(Exception):
+    """امانت یا بازگشت قابل انجام نیست؛ پیام آن برای نمایش به کاربر است"""
+
+
+def _check_person(cur, person_id):
+    execute_prepared(cur, "check_person", "SELECT is_active FROM people WHERE id = %s FOR SHARE", (person_id,))
+    row = cur.fetchone()
+    if row is None:
+        raise CirculationError(f"Person #{person_id} does not exist.")
+    if not row[0]:
+        raise CirculationError(f"Person #{person_id} is not an active member.")
+
+
+def _reserve_copies(cur, book_ids):
+    """قفل ردیف کتاب‌ها و بررسی موجودی برای book_ids (تکرار یک id یعنی چند نسخه از آن)
+
+    کتاب‌ها به ترتیب id قفل می‌شوند تا دو امانت گروهی هم‌زمان همدیگر را deadlock نکنند.
+    همه کمبودها با هم در یک CirculationError گزارش می‌شوند.
+    """
+    requested = Counter(book_ids)
+    execute_prepared(cur, "reserve_copies",
+                     "SELECT id, name, available_copies FROM books WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+                     (sorted(requested),))
+    books = {book_id: (name, available or 0) for book_id, name, available in cur.fetchall()}
+    problems = []
+    for book_id, count in requested.items():
+        if book_id not in books:
+            problems.append(f"Book #{book_id} does not exist.")
+            continue
+        name, available = books[book_id]
+        if available < count:
+            problems.append(f"Not enough copies of '{name}' (#{book_id}) are available: "
+                            f"{available} left, {count} requested.")
+    if problems:
+        raise CirculationError("\n".join(problems))
+
+
+def member_status(conn, person_id):
+    """(نام، فعال بودن) شخص یا None اگر وجود نداشته باشد"""
+    with conn.cursor() as cur:
+        execute_prepared(cur, "member_status",
+                         f"SELECT {NAME_COLUMNS['people'].format(t='people')}, is_active FROM people WHERE id = %s",
+                         (person_id,))
+        return cur.fetchone()
+
+
+def book_availability(conn, book_id):
+    """(نام، تعداد نسخه‌های موجود) کتاب یا None اگر وجود نداشته باشد"""
+    with conn.cursor() as cur:
+        execute_prepared(cur, "book_availability", "SELECT name, available_copies FROM books WHERE id = %s",
+                         (book_id,))
+        return cur.fetchone()
+
+
+def checkout_many(conn, person_id, book_ids, borrow_date=None):
+    """امانت دادن همه book_ids به یک شخص در یک تراکنش و برگرداندن ردیف‌های borrowings به همان ترتیب
+
+    اگر حتی یکی از کتاب‌ها قابل امانت نباشد هیچ امانتی ثبت نمی‌شود.
+    """
+    if not book_ids:
+        return []
+    with conn, conn.cursor() as cur:
+        _check_person(cur, person_id)
+        _reserve_copies(cur, book_ids)
+        # همه ردیف‌ها با یک INSERT چندمقداری (یک prepared statement برای هر تعداد کتاب)؛ تریگر borrowings
+        # موجودی هر کتاب را کم می‌کند
+        rows = ", ".join(["(%s, %s, coalesce(%s::date, CURRENT_DATE), %s)"] * len(book_ids))
+        execute_prepared(cur, f"checkout_{len(book_ids)}", f"""
+            INSERT INTO borrowings (book_id, person_id, borrow_date, status) VALUES {rows}
+            RETURNING {BORROWING_COLUMNS}
+        """, [value for book_id in book_ids for value in (book_id, person_id, borrow_date, BORROWED)])
+        return cur.fetchall()
+
+
+def checkout(conn, book_id, person_id, borrow_date=None):
+    """امانت دادن یک نسخه از کتاب به شخص و برگرداندن ردیف borrowings ساخته‌شده"""
+    return checkout_many(conn, person_id, [book_id], borrow_date)[0]
+
+
+def return_book(conn, borrowing_id, return_date=None):
+    """ثبت بازگشت یک امانت باز و برگرداندن ردیف به‌روزشده"""
+    with conn, conn.cursor() as cur:
+        execute_prepared(cur, "return_book", f"""
+            UPDATE borrowings SET status = %s, return_date = coalesce(%s, CURRENT_DATE)
+            WHERE id = %s AND status = %s
+            RETURNING {BORROWING_COLUMNS}
+        """, (RETURNED, return_date, borrowing_id, BORROWED))
+        row = cur.fetchone()
+        if row is None:
+            raise CirculationError(f"Borrowing #{borrowing_id} is not an open loan.")
+        return row
@@ -0,0 +1,386 @@
+import hashlib
+import json
+import queue
+import re
+import select
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+
+import psycopg2
+from psycopg2 import errors, pool
+from psycopg2.extensions import connection as _pg_connection, TRANSACTION_STATUS_IDLE
+
+from diagnostics import InstrumentedCursor
+
+# --- تنظیمات دیتابیس ---
+DB_NAME = "DB NAME"
+USER = "USERNAME"
+PASSWORD = "PASSWORD"
+HOST = "HOST"
+PORT = "PORT"
+
+# --- تنظیمات Pool ---
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+# اتصالی که بیشتر از این مدت (ثانیه) بیکار بوده قبل از تحویل با SELECT 1 بررسی می‌شود
+HEALTH_CHECK_INTERVAL = 30
+# اگر سرور در این مدت (ثانیه) جواب ندهد اتصال خطا می‌دهد (به جای معطل ماندن روی شبکه قطع)
+CONNECT_TIMEOUT = 5
+
+# --- prepared statement ها ---
+# کوئری‌های ثابت repository ها (درج، ویرایش، جستجو، صفحه‌ها و ...) برای هر اتصال pool یک بار با PREPARE ثبت و
+# بعد با EXECUTE اجرا می‌شوند تا Postgres متن را هر بار parse و plan نکند (execute_prepared).
+PREPARED_STATEMENTS = True
+# بیشتر از این تعداد دستور در یک اتصال، دستوری که مدت بیشتری استفاده نشده DEALLOCATE می‌شود
+PREPARED_CACHE_SIZE = 100
+
+# --- کانال تغییرات (LISTEN/NOTIFY) ---
+# تریگرهای setup_db.py روی این کانال {"table", "op", "id"} می‌فرستند
+CHANGES_CHANNEL = "table_changes"
+LISTENER_RECONNECT_DELAY = 5
+
+# --- مرتب‌سازی و فیلتر ستون‌ها ---
+# ستون‌هایی که با کلیک روی عنوانشان مرتب می‌شوند؛ setup_db.py برای هر کدام ایندکس (ستون، id) می‌سازد
+SORT_COLUMNS = {
+    "books": ("name", "publish_date", "number_of_books", "language"),
+    "authors": ("first_name", "last_name", "start_of_activity", "language"),
+    "people": ("first_name", "last_name", "email"),
+    "publishers": ("name",),
+    "genres": ("name",),
+    "borrowings": ("borrow_date", "return_date", "status"),
+}
+# فیلتری که با یکی از این‌ها شروع شود مقایسه است؛ بقیه فیلترها پیشوند متن هستند (* یعنی هر متنی)
+FILTER_OPERATORS = (">=", "<=", "!=", "=", ">", "<")
+
+_pool = None
+_pool_lock = threading.Lock()
+# pid اتصال‌های خود این برنامه؛ NOTIFY هایی که از خودمان آمده با own علامت می‌خورند
+_own_pids = set()
+_PLACEHOLDER = re.compile(r"%%|%s|%\((\w+)\)s")
+
+
+class PooledConnection(_pg_connection):
+    """اتصال psycopg2 در حالت autocommit که زمان آخرین استفاده‌اش را نگه می‌دارد
+
+    cursor های آن InstrumentedCursor هستند و زمان هر کوئری در diagnostics ثبت می‌شود.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.autocommit = True
+        self.cursor_factory = InstrumentedCursor
+        self.last_used = time.monotonic()
+        self.backend_pid = self.get_backend_pid()
+        # نام -> متن prepared statement هایی که روی همین اتصال سرور ساخته شده‌اند؛ اتصال تازه (مثلا بعد از
+        # قطع شدن) خالی شروع می‌کند و دستورها دوباره PREPARE می‌شوند
+        self.prepared = OrderedDict()
+        self.prepare_statements = PREPARED_STATEMENTS
+        _own_pids.add(self.backend_pid)
+
+    def close(self):
+        _own_pids.discard(self.backend_pid)
+        super().close()
+
+
+def get_pool():
+    """ساخت یا برگرداندن pool مشترک کل برنامه"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = pool.ThreadedConnectionPool(
+                POOL_MIN_SIZE,
+                POOL_MAX_SIZE,
+                dbname=DB_NAME,
+                user=USER,
+                password=PASSWORD,
+                host=HOST,
+                port=PORT,
+                connect_timeout=CONNECT_TIMEOUT,
+                connection_factory=PooledConnection,
+            )
+        return _pool
+
+
+def close_pool():
+    """بستن تمام اتصال‌های pool (هنگام خروج از برنامه)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - conn.last_used < HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout(db_pool):
+    # اگر سرور ری‌استارت شده باشد اتصال‌های قدیمی مرده‌اند؛ دورشان می‌اندازیم و اتصال تازه می‌گیریم
+    for _ in range(POOL_MAX_SIZE + 1):
+        conn = db_pool.getconn()
+        if _is_healthy(conn):
+            return conn
+        db_pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("Could not obtain a healthy database connection")
+
+
+@contextmanager
+def get_connection():
+    """امانت گرفتن یک اتصال از pool و برگرداندن آن بعد از استفاده
+
+    اتصال‌ها در حالت autocommit هستند؛ برای چند دستور در یک تراکنش از `with conn:` استفاده کنید.
+    """
+    db_pool = get_pool()
+    conn = _checkout(db_pool)
+    try:
+        yield conn
+    finally:
+        # psycopg2 وقتی ارتباط با سرور قطع شود conn.closed را مقداردهی می‌کند؛
+        # خطاهای دیگر (مثل لغو کوئری) اتصال را خراب نمی‌کنند و به pool برمی‌گردد
+        if not conn.closed and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        conn.last_used = time.monotonic()
+        db_pool.putconn(conn, close=bool(conn.closed))
+
+
+# --- prepared statement ها ---
+def statement_name(prefix, query):
+    """نام prepared statement برای کوئری‌هایی که متنشان (مثلا با فیلترها یا ترتیب) عوض می‌شود"""
+    return f"{prefix}_{hashlib.md5(query.encode()).hexdigest()[:12]}"
+
+
+def _positional(query, params):
+    # %s و %(name)s -> $1، $2، ... و مقادیر به همان ترتیب
+    numbers, values = {}, []
+
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%"
+        if match.group(1) is None:
+            values.append(params[len(values)])
+            return f"${len(values)}"
+        if match.group(1) not in numbers:
+            values.append(params[match.group(1)])
+            numbers[match.group(1)] = len(values)
+        return f"${numbers[match.group(1)]}"
+
+    return _PLACEHOLDER.sub(replace, query), values
+
+
+def execute_prepared(cur, name, query, params=()):
+    """اجرای query (با %s یا %(name)s مثل cur.execute) به صورت prepared statement سمت سرور به نام name
+
+    بار اول روی هر اتصال PREPARE و بعد فقط EXECUTE می‌شود؛ نتیجه مثل cur.execute از همان cur خوانده می‌شود.
+    اتصال‌های خارج از pool (یا با prepare_statements خاموش) همان cur.execute را اجرا می‌کنند. در diagnostics
+    همه این دستورها یک کوئری با متن اصلی query ثبت می‌شوند (زمان PREPARE هم جزو همان است).
+    """
+    conn = cur.connection
+    if not getattr(conn, "prepare_statements", False):
+        cur.execute(query, params or None)
+        return
+    if isinstance(cur, InstrumentedCursor):
+        cur.execute_as(query, params or None, partial(_execute_prepared, cur, name, query, params))
+    else:
+        _execute_prepared(cur, name, query, params)
+
+
+def _execute_prepared(cur, name, query, params):
+    conn = cur.connection
+    text, values = _positional(query, params or ())
+    try:
+        if conn.prepared.get(name) != text:
+            if name in conn.prepared:
+                del conn.prepared[name]
+                cur.execute(f"DEALLOCATE {name}")
+            cur.execute(f"PREPARE {name} AS {text}")
+            conn.prepared[name] = text
+            while len(conn.prepared) > PREPARED_CACHE_SIZE:
+                cur.execute(f"DEALLOCATE {conn.prepared.popitem(last=False)[0]}")
+        else:
+            conn.prepared.move_to_end(name)
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(values))})" if values else f"EXECUTE {name}",
+                    values or None)
+    except (errors.InvalidSqlStatementName, errors.DuplicatePreparedStatement):
+        # دستورهای سرور بیرون از این cache پاک شده‌اند (مثلا DISCARD ALL)؛ بیرون از تراکنش یک بار از نو ساخته می‌شوند
+        conn.prepared.clear()
+        if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            raise
+        cur.execute("DEALLOCATE ALL")
+        _execute_prepared(cur, name, query, params)
+
+
+# --- دریافت تغییرات بقیه کلاینت‌ها ---
+class ChangeListener(threading.Thread):
+    """یک اتصال جدا (خارج از pool) که LISTEN می‌کند و تغییرات را در صف changes می‌گذارد
+
+    هر عضو صف یک dict با table و op (INSERT/UPDATE/DELETE) و id است؛ own یعنی تغییر از اتصال‌های
+    خود این برنامه آمده (مثلا ردیف‌های cascade شده یا ثبت امانت در Checkout Desk). اگر اتصال قطع و
+    دوباره وصل شود ممکن است تغییراتی از دست رفته باشد، پس {"op": "RESYNC"} در صف قرار می‌گیرد.
+    """
+
+    def __init__(self):
+        super().__init__(name="db-listener", daemon=True)
+        self.changes = queue.Queue()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        connected_before = False
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(dbname=DB_NAME, user=USER, password=PASSWORD, host=HOST, port=PORT,
+                                        connect_timeout=CONNECT_TIMEOUT)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANGES_CHANNEL}")
+                if connected_before:
+                    self.changes.put({"table": None, "op": "RESYNC", "id": None})
+                connected_before = True
+                self._listen(conn)
+            except psycopg2.Error:
+                self._stop_event.wait(LISTENER_RECONNECT_DELAY)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _listen(self, conn):
+        while not self._stop_event.is_set():
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    change = json.loads(notify.payload)
+                except ValueError:
+                    continue
+                change["own"] = notify.pid in _own_pids
+                self.changes.put(change)
+
+
+# --- صفحه‌بندی و تخمین تعداد ردیف‌ها ---
+def keyset_page(base_query, params, limit, after_id=None, before_id=None,
+                sort_column=None, descending=False, sort_value=None):
+    """ساخت کوئری صفحه‌بندی keyset روی ستون id یا (sort_column, id) (به جای OFFSET)
+
+    ستون اول base_query باید id باشد. sort_value مقدار sort_column در ردیف after_id/before_id است.
+    برای before_id ردیف‌ها برعکس ترتیب نمایش برمی‌گردند.
+    """
+    params = tuple(params or ())
+    if sort_column is None:
+        if before_id is not None:
+            where, order, params = "WHERE page.id < %s", "DESC", params + (before_id,)
+        elif after_id is not None:
+            where, order, params = "WHERE page.id > %s", "ASC", params + (after_id,)
+        else:
+            where, order = "", "ASC"
+        query = f"SELECT * FROM ({base_query}) AS page {where} ORDER BY page.id {order} LIMIT %s"
+        return query, params + (limit,)
+
+    backward = before_id is not None
+    key_id = before_id if backward else after_id
+    # جهت خود کوئری؛ برای before_id برعکس جهت نمایش
+    reverse = descending != backward
+    order = "DESC" if reverse else "ASC"
+    column = f"page.{sort_column}"
+    source = f"SELECT * FROM ({base_query}) AS page"
+    order_by = f"ORDER BY {column} {order}, page.id {order}"
+    if key_id is None:
+        return f"{source} {order_by} LIMIT %s", params + (limit,)
+
+    # مثل ایندکس btree، NULL در ترتیب صعودی آخر و در نزولی اول می‌آید. مقایسه سطری (ستون، id) با ایندکس
+    # انجام می‌شود؛ ردیف‌های NULL در شاخه جدای UNION ALL با LIMIT خودش خوانده می‌شوند
+    compare = "<" if reverse else ">"
+    if sort_value is None:
+        branches = [(f"{column} IS NULL AND page.id {compare} %s", (key_id,))]
+        if reverse:
+            branches.append((f"{column} IS NOT NULL", ()))
+    else:
+        branches = [(f"({column}, page.id) {compare} (%s, %s)", (sort_value, key_id))]
+        if not reverse:
+            branches.append((f"{column} IS NULL", ()))
+    if len(branches) == 1:
+        where, branch_params = branches[0]
+        return f"{source} WHERE {where} {order_by} LIMIT %s", params + branch_params + (limit,)
+    parts, query_params = [], ()
+    for where, branch_params in branches:
+        parts.append(f"({source} WHERE {where} {order_by} LIMIT %s)")
+        query_params += params + branch_params + (limit,)
+    query = f"SELECT * FROM ({' UNION ALL '.join(parts)}) AS page {order_by} LIMIT %s"
+    return query, query_params + (limit,)
+
+
+def sorted_query(query, sort_column=None, descending=False):
+    """query به ترتیب (sort_column, id)؛ بدون sort_column همان query (برای نتیجه جستجو و خروجی گرفتن)"""
+    if sort_column is None:
+        return query
+    order = "DESC" if descending else "ASC"
+    return f"SELECT * FROM ({query}) AS page ORDER BY page.{sort_column} {order}, page.id {order}"
+
+
+def like_prefix(text):
+    """الگوی LIKE برای متن‌هایی که با text شروع می‌شوند (% و _ در LIKE معنی خاص دارند)"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def filter_query(base_query, params, filters):
+    """(query, params) برای ردیف‌هایی از base_query که با همه filters (ستون -> متن فیلتر) جور هستند
+
+    «>=10» یا «=borrowed» مقایسه است (Postgres متن را به نوع ستون تبدیل می‌کند). بقیه متن‌ها بدون توجه به
+    بزرگی حروف با ابتدای مقدار مقایسه می‌شوند تا ایندکس‌های پیشوندی lower(...) COLLATE "C" استفاده شوند.
+    """
+    conditions, values = [], []
+    for column, text in filters.items():
+        text = text.strip()
+        if not text:
+            continue
+        for operator in FILTER_OPERATORS:
+            if text.startswith(operator):
+                conditions.append(f"page.{column} {operator} %s")
+                values.append(text[len(operator):].strip())
+                break
+        else:
+            conditions.append(f'lower(page.{column}::text) COLLATE "C" LIKE %s')
+            values.append(like_prefix(text.lower()).replace("*", "%"))
+    if not conditions:
+        return base_query, tuple(params or ())
+    return (f"SELECT * FROM ({base_query}) AS page WHERE {' AND '.join(conditions)}",
+            tuple(params or ()) + tuple(values))
+
+
+def estimate_table_rows(cur, table_name):
+    """تخمین تعداد ردیف‌های جدول از آمار pg_class بدون COUNT(*)
+
+    برای جدول partitioned (مثل borrowings) جمع partition ها؛ خود جدول مادر آمار ندارد.
+    """
+    # جدولی که هنوز ANALYZE نشده reltuples = -1 دارد
+    cur.execute("""
+        SELECT sum(reltuples)::bigint FROM pg_class
+        WHERE relkind <> 'p' AND reltuples >= 0
+          AND oid IN (SELECT %(table)s::regclass UNION ALL SELECT relid FROM pg_partition_tree(%(table)s::regclass))
+    """, {"table": table_name})
+    return cur.fetchone()[0]
+
+
+def estimate_query_rows(cur, query, params):
+    """تخمین تعداد ردیف‌های نتیجه یک کوئری از روی EXPLAIN"""
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    return int(cur.fetchone()[0][0]["Plan"]["Plan Rows"])
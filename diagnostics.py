@@ -0,0 +1,202 @@
+import sys
+import threading
+import time
+from collections import deque
+
+from psycopg2.extensions import cursor as _pg_cursor, TRANSACTION_STATUS_INTRANS
+
+# --- ثبت زمان کوئری‌ها ---
+# همه cursor های اتصال‌های pool از InstrumentedCursor هستند؛ هر execute یک QueryRecord ثبت می‌کند.
+# کوئری‌های کندتر از slow_query_ms همراه با پلن EXPLAIN چاپ و نگه داشته می‌شوند.
+SLOW_QUERY_MS = 200
+MAX_RECORDS = 5000
+# مرز ستون‌های هیستوگرام زمان اجرا (میلی‌ثانیه)
+HISTOGRAM_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+# فقط این دستورها بدون اجرا شدن قابل EXPLAIN هستند
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+slow_query_ms = SLOW_QUERY_MS
+_records = deque(maxlen=MAX_RECORDS)
+_lock = threading.Lock()
+_context = threading.local()
+
+
+class QueryRecord:
+    """زمان، تعداد ردیف و حجم داده یک کوئری اجراشده"""
+
+    def __init__(self, query, caller):
+        self.query = " ".join(query.split())
+        self.caller = caller
+        self.started = time.time()
+        self.duration_ms = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.error = None
+        self.plan = None
+
+
+def set_caller(name):
+    """نام صفحه/متدی که کوئری‌های بعدی این thread از طرف آن اجرا می‌شوند (None برای پاک کردن)"""
+    _context.caller = name
+
+
+def set_slow_threshold(ms):
+    """تغییر آستانه کوئری کند (میلی‌ثانیه) در زمان اجرا"""
+    global slow_query_ms
+    slow_query_ms = ms
+
+
+def _find_caller():
+    caller = getattr(_context, "caller", None)
+    if caller:
+        return caller
+    # بدون set_caller (مثلا ابزارهای خط فرمان) اولین تابع بیرون از لایه دیتابیس گزارش می‌شود
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module not in (__name__, "db") and not module.startswith("psycopg2"):
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+def _size(rows):
+    # حجم تقریبی داده: طول متن‌ها و ۸ بایت برای بقیه مقادیر
+    return sum(len(value) if isinstance(value, (str, bytes)) else 8
+               for row in rows for value in row if value is not None)
+
+
+def records():
+    """کپی کوئری‌های ثبت‌شده (قدیمی‌ترین اول)"""
+    with _lock:
+        return list(_records)
+
+
+def clear():
+    with _lock:
+        _records.clear()
+
+
+def slowest(limit=20):
+    """کوئری‌ها گروه‌بندی‌شده بر اساس (caller, query) و مرتب بر اساس بیشترین زمان اجرا"""
+    groups = {}
+    for record in records():
+        group = groups.setdefault((record.caller, record.query), {
+            "caller": record.caller, "query": record.query, "calls": 0, "errors": 0,
+            "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "bytes": 0, "plan": None,
+        })
+        group["calls"] += 1
+        group["errors"] += record.error is not None
+        group["total_ms"] += record.duration_ms
+        group["max_ms"] = max(group["max_ms"], record.duration_ms)
+        group["rows"] += record.rows
+        group["bytes"] += record.bytes
+        group["plan"] = record.plan or group["plan"]
+    return sorted(groups.values(), key=lambda group: group["max_ms"], reverse=True)[:limit]
+
+
+def histogram():
+    """تعداد کوئری‌ها در هر بازه زمانی HISTOGRAM_BUCKETS_MS (آخرین عضو: کندتر از بزرگترین مرز)"""
+    counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+    for record in records():
+        index = 0
+        while index < len(HISTOGRAM_BUCKETS_MS) and record.duration_ms > HISTOGRAM_BUCKETS_MS[index]:
+            index += 1
+        counts[index] += 1
+    return counts
+
+
+class InstrumentedCursor(_pg_cursor):
+    """cursor psycopg2 که زمان اجرا، تعداد ردیف و حجم داده خوانده‌شده را ثبت می‌کند"""
+
+    _record = None
+    # داخل execute_as: دستورهای cursor جدا ثبت نمی‌شوند
+    _nested = False
+
+    def execute(self, query, vars=None):
+        return self._run(query, super().execute, (query, vars), explain_vars=vars)
+
+    def executemany(self, query, vars_list):
+        return self._run(query, super().executemany, (query, vars_list), explain=False)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._run(sql, super().copy_expert, (sql, file, size), explain=False)
+
+    def execute_as(self, query, vars, run):
+        """اجرای run() (مثلا PREPARE و EXECUTE در db.execute_prepared) که با متن query و vars ثبت می‌شود
+
+        execute های داخل run یک QueryRecord مشترک دارند و کوئری کند با همان query و vars EXPLAIN می‌شود.
+        """
+        return self._run(query, run, (), explain_vars=vars)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched([row] if row is not None else [], started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(rows, started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(rows, started)
+        return rows
+
+    def _fetched(self, rows, started):
+        if self._record is None:
+            return
+        self._record.bytes += _size(rows)
+        # cursor سمت سرور ردیف‌ها را هنگام fetch از سرور می‌خواند؛ زمان و تعدادشان اینجا معلوم می‌شود
+        if self.name:
+            self._record.rows += len(rows)
+            self._record.duration_ms += (time.perf_counter() - started) * 1000
+
+    def _run(self, query, method, args, explain=True, explain_vars=None):
+        if self._nested:
+            return method(*args)
+        text = query.decode(errors="replace") if isinstance(query, bytes) else str(query)
+        record = QueryRecord(text, _find_caller())
+        self._record = record
+        self._nested = True
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        except Exception as e:
+            record.error = str(e)
+            raise
+        finally:
+            self._nested = False
+            record.duration_ms = (time.perf_counter() - started) * 1000
+            if not self.name and self.rowcount > 0:
+                record.rows = self.rowcount
+            with _lock:
+                _records.append(record)
+            if record.duration_ms >= slow_query_ms and record.error is None:
+                if explain and text.lstrip().upper().startswith(_EXPLAINABLE):
+                    record.plan = self._explain(text, explain_vars)
+                print(f"🐢 Slow query ({record.duration_ms:.0f} ms) in {record.caller}: {record.query[:200]}")
+                if record.plan:
+                    print(record.plan)
+
+    def _explain(self, text, vars):
+        # cursor ساده جدا: نتیجه همین cursor دست نمی‌خورد و خود EXPLAIN ثبت نمی‌شود.
+        # داخل تراکنش، خطای EXPLAIN با SAVEPOINT از تراکنش اصلی جدا می‌ماند.
+        in_transaction = self.connection.info.transaction_status == TRANSACTION_STATUS_INTRANS
+        with _pg_cursor(self.connection) as cur:
+            try:
+                if in_transaction:
+                    cur.execute("SAVEPOINT diagnostics_explain")
+                cur.execute("EXPLAIN " + text, vars)
+                plan = "\n".join(row[0] for row in cur.fetchall())
+                if in_transaction:
+                    cur.execute("RELEASE SAVEPOINT diagnostics_explain")
+                return plan
+            except Exception as e:
+                if in_transaction:
+                    cur.execute("ROLLBACK TO SAVEPOINT diagnostics_explain")
+                return f"(EXPLAIN failed: {e})"
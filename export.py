@@ -0,0 +1,155 @@
+import argparse
+import sys
+import time
+
+from db import get_connection
+from repositories import REPOSITORIES
+from search import SEARCHES
+
+# --- خروجی گرفتن از جدول‌ها ---
+# CSV مستقیم با COPY ... TO STDOUT در فایل نوشته می‌شود؛ Parquet با cursor سمت سرور دسته‌دسته خوانده می‌شود.
+# در هر دو حالت حافظه مصرفی به اندازه جدول بستگی ندارد.
+EXPORT_BATCH_SIZE = 10000
+
+
+class _CountingWriter:
+    """نوشتن خروجی COPY در فایل و شمردن تقریبی ردیف‌ها برای گزارش پیشرفت
+
+    تعداد خط‌ها شمرده می‌شود؛ فیلد متنی چندخطی (داخل "") بیش از یک بار شمرده می‌شود.
+    """
+
+    def __init__(self, file, progress=None):
+        self.file = file
+        self.progress = progress
+        self.rows = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.rows += data.count(b"\n")
+        if self.progress:
+            self.progress(self.rows)
+
+
+def _export_csv(conn, query, params, path, progress):
+    # psycopg2 خروجی COPY را به صورت بایت (با encoding اتصال) به write می‌دهد
+    with conn.cursor() as cur, open(path, "wb") as file:
+        sql = cur.mogrify(query, params)
+        cur.copy_expert(b"COPY (" + sql + b") TO STDOUT WITH (FORMAT csv, HEADER true)",
+                        _CountingWriter(file, progress))
+        # تعداد دقیق ردیف‌ها را خود سرور گزارش می‌کند (COPY n)
+        return cur.rowcount
+
+
+# نوع ستون‌های PostgreSQL (oid) -> نوع Parquet؛ بقیه به صورت متن ذخیره می‌شوند
+_ARROW_TYPES = {
+    16: "bool_",
+    20: "int64",
+    21: "int16",
+    23: "int32",
+    700: "float32",
+    701: "float64",
+    1082: "date32",
+}
+
+
+def _export_parquet(conn, query, params, path, progress):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs the 'pyarrow' package (pip install pyarrow).")
+
+    rows_written = 0
+    writer = None
+    # cursor با نام (سمت سرور) فقط داخل تراکنش و بدون autocommit کار می‌کند
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        with conn, conn.cursor(name="export_cursor") as cur:
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                if writer is None:
+                    names, fields = [], []
+                    for column in cur.description:
+                        name = column.name
+                        while name in names:
+                            name += "_"
+                        names.append(name)
+                        fields.append(pa.field(name, getattr(pa, _ARROW_TYPES.get(column.type_code, "string"))()))
+                    schema = pa.schema(fields)
+                    writer = pq.ParquetWriter(path, schema)
+                columns = []
+                for index, field in enumerate(schema):
+                    values = [row[index] for row in rows]
+                    if pa.types.is_string(field.type):
+                        values = [None if value is None else str(value) for value in values]
+                    columns.append(pa.array(values, type=field.type))
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                rows_written += len(rows)
+                if progress:
+                    progress(rows_written)
+    finally:
+        if writer is not None:
+            writer.close()
+        conn.autocommit = autocommit
+    return rows_written
+
+
+def export_query(conn, query, params, path, progress=None):
+    """نوشتن نتیجه query در فایل CSV یا Parquet (بر اساس پسوند path) و برگرداندن تعداد ردیف‌ها
+
+    progress (اگر داده شود) با تعداد ردیف‌های نوشته‌شده تا آن لحظه صدا زده می‌شود؛ برای CSV این عدد
+    تقریبی است (_CountingWriter).
+    """
+    params = tuple(params or ())
+    if path.lower().endswith(".parquet"):
+        return _export_parquet(conn, query, params, path, progress)
+    return _export_csv(conn, query, params, path, progress)
+
+
+def table_columns(table_name):
+    """ستون‌های جدول همان‌طور که برنامه می‌خواند (بدون ستون‌هایی که تریگرها پر می‌کنند مثل search_vector)"""
+    if table_name not in REPOSITORIES:
+        raise ValueError(f"Unknown table '{table_name}'")
+    return list(REPOSITORIES[table_name].db_columns)
+
+
+def table_query(table_name):
+    """SELECT روی ستون‌های جدول به ترتیب id"""
+    return f"SELECT {REPOSITORIES[table_name].select_list} FROM {table_name} ORDER BY id"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a table or a search result to CSV or Parquet.")
+    parser.add_argument("table", choices=sorted(SEARCHES))
+    parser.add_argument("path", help="output file (.csv or .parquet)")
+    parser.add_argument("--search", help="export only the rows matching this search keyword")
+    args = parser.parse_args()
+
+    last_report = 0
+
+    def progress(rows):
+        nonlocal last_report
+        if time.monotonic() - last_report > 0.5:
+            last_report = time.monotonic()
+            print(f"\r📥 Exported ~{rows} rows...", end="", flush=True)
+
+    print(f"🚀 Exporting {args.table} to '{args.path}'")
+    try:
+        with get_connection() as conn:
+            if args.search:
+                query, params = SEARCHES[args.table](args.search)
+            else:
+                query, params = table_query(args.table), ()
+            rows = export_query(conn, query, params, args.path, progress)
+    except Exception as e:
+        print(f"\n❌ Export failed: {e}")
+        sys.exit(1)
+    print(f"\n✅ Exported {rows} rows to '{args.path}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import csv
+import sys
+import time
+
+from bulk_import import ENTITIES, import_file, write_rejects
+from db import SORT_COLUMNS, get_connection, sorted_query
+from export import export_query
+from reports import REPORTS, refresh_reports, report_rows, view_name
+from repositories import REPOSITORIES
+
+# --- ابزار خط فرمان کتابخانه (بدون رابط گرافیکی) ---
+# همه کارها از همان repositories / bulk_import / export / reports که برنامه گرافیکی استفاده می‌کند:
+#   python library.py query books --filter name peace --sort publish_date --desc
+#   python library.py import books new_books.csv
+#   python library.py export borrowings open.csv --filter status =borrowed
+#   python library.py report overdue_by_person --refresh
+QUERY_LIMIT = 50
+# حداکثر عرض هر ستون در خروجی جدولی
+MAX_COLUMN_WIDTH = 40
+
+
+def _source(args):
+    """(repository، (query, params)) برای جدول، جستجو و فیلترهای آرگومان‌ها"""
+    repository = REPOSITORIES[args.table]
+    filters = dict(args.filter or ())
+    unknown = set(filters) - set(repository.row_columns)
+    if unknown:
+        raise ValueError(f"Unknown column(s) for {args.table}: {', '.join(sorted(unknown))} "
+                         f"(columns: {', '.join(repository.row_columns)})")
+    if args.sort and args.sort not in ("id",) + SORT_COLUMNS.get(args.table, ()):
+        raise ValueError(f"'{args.sort}' has no sort index; sortable columns of {args.table}: "
+                         f"{', '.join(('id',) + SORT_COLUMNS.get(args.table, ()))}")
+    search = repository.search_query(args.search) if args.search else None
+    return repository, repository.source(filters, search)
+
+
+def print_rows(columns, rows, as_csv=False):
+    if as_csv:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        writer.writerows(rows)
+        return
+    texts = [["" if value is None else str(value)[:MAX_COLUMN_WIDTH] for value in row] for row in rows]
+    widths = [max([len(column)] + [len(row[index]) for row in texts]) for index, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    print("  ".join("-" * width for width in widths))
+    for row in texts:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+# --- دستورها ---
+def query_command(conn, args):
+    repository, source = _source(args)
+    if args.search:
+        rows = repository.rows(conn, source, args.sort, args.desc)[:args.limit]
+    else:
+        rows = repository.page(conn, args.limit, source, sort_column=args.sort, descending=args.desc)
+    print_rows(repository.row_columns, rows, args.csv)
+    if not args.csv:
+        print(f"\n{len(rows)} row(s)")
+
+
+def import_command(conn, args):
+    def progress(done, total):
+        if total:
+            print(f"\r📤 Sending... {done * 100 // total}%", end="", flush=True)
+
+    print(f"🚀 Importing {args.entity} from '{args.path}'")
+    imported, rejected = import_file(conn, args.entity, args.path, progress)
+    print(f"\n✅ Imported {imported} rows.")
+    if rejected:
+        print(f"⚠️ Rejected {len(rejected)} rows:")
+        for line_no, error in rejected[:10]:
+            print(f"   row {line_no}: {error}")
+        if args.rejects:
+            write_rejects(args.rejects, rejected)
+            print(f"📝 Rejected rows written to '{args.rejects}'.")
+
+
+def export_command(conn, args):
+    _, (query, params) = _source(args)
+    last_report = 0
+
+    def progress(rows):
+        nonlocal last_report
+        if time.monotonic() - last_report > 0.5:
+            last_report = time.monotonic()
+            print(f"\r📥 Exported {rows} rows...", end="", flush=True)
+
+    print(f"🚀 Exporting {args.table} to '{args.path}'")
+    rows = export_query(conn, sorted_query(query, args.sort, args.desc), params, args.path, progress)
+    print(f"\n✅ Exported {rows} rows to '{args.path}'.")
+
+
+def report_command(conn, args):
+    if args.refresh:
+        timings = refresh_reports(conn, [args.name] if args.name else None)
+        if timings is None:
+            print("⏳ Another client is already refreshing the reports.")
+        for name, ms in (timings or {}).items():
+            print(f"✅ {view_name(name)} refreshed in {ms:.0f} ms")
+    if not args.name:
+        if not args.refresh:
+            for name, (title, *_rest) in REPORTS.items():
+                print(f"{name:30} {title}")
+        return
+    title, columns, *_rest = REPORTS[args.name]
+    rows = report_rows(conn, args.name, args.limit)
+    if not args.csv:
+        print(f"📊 {title}\n")
+    print_rows(columns, rows, args.csv)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query, import, export and report on the library database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_selection(command_parser):
+        command_parser.add_argument("table", choices=sorted(REPOSITORIES))
+        command_parser.add_argument("--search", help="only rows matching this search keyword")
+        command_parser.add_argument("--filter", nargs=2, action="append", metavar=("COLUMN", "TEXT"),
+                                    help="filter a column like the filter row of the app "
+                                         "(prefix text, * wildcard, or =, !=, <, <=, >, >= comparisons)")
+        command_parser.add_argument("--sort", help="sort by this column (must have a sort index)")
+        command_parser.add_argument("--desc", action="store_true", help="sort descending")
+
+    query_parser = commands.add_parser("query", help="print rows of a table")
+    add_selection(query_parser)
+    query_parser.add_argument("--limit", type=int, default=QUERY_LIMIT)
+    query_parser.add_argument("--csv", action="store_true", help="print CSV instead of a table")
+
+    import_parser = commands.add_parser("import", help="bulk import books, authors or people from CSV/JSON")
+    import_parser.add_argument("entity", choices=sorted(ENTITIES))
+    import_parser.add_argument("path", help="CSV file with a header row, JSON array or JSON Lines (.jsonl) file")
+    import_parser.add_argument("--rejects", help="write rejected rows (row number and reason) to this CSV file")
+
+    export_parser = commands.add_parser("export", help="export a table, search or filtered rows to CSV/Parquet")
+    add_selection(export_parser)
+    export_parser.add_argument("path", help="output file (.csv or .parquet)")
+
+    report_parser = commands.add_parser("report", help="show a report (no name: list the reports)")
+    report_parser.add_argument("name", nargs="?", choices=sorted(REPORTS))
+    report_parser.add_argument("--refresh", action="store_true", help="refresh the report view(s) first")
+    report_parser.add_argument("--limit", type=int, default=QUERY_LIMIT)
+    report_parser.add_argument("--csv", action="store_true", help="print CSV instead of a table")
+
+    args = parser.parse_args()
+    handlers = {"query": query_command, "import": import_command, "export": export_command,
+                "report": report_command}
+    try:
+        with get_connection() as conn:
+            handlers[args.command](conn, args)
+    except Exception as e:
+        print(f"\n❌ {args.command.capitalize()} failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
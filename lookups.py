@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+
+from db import execute_prepared, like_prefix, statement_name
+
+# --- نام رکوردها برای نمایش به جای id ---
+# عبارت SQL نام هر جدول؛ {t} نام جدول یا alias آن است
+NAME_COLUMNS = {
+    "books": "{t}.name",
+    "authors": "{t}.first_name || ' ' || {t}.last_name",
+    "people": "{t}.first_name || ' ' || {t}.last_name",
+    "genres": "{t}.name",
+    "publishers": "{t}.name",
+}
+# حداکثر تعداد id -> نام که در حافظه نگه داشته می‌شود (کم‌استفاده‌ترین‌ها اول حذف می‌شوند)
+LOOKUP_CACHE_SIZE = 20000
+
+# --- جستجوی پیشوندی برای انتخاب کلید خارجی ---
+# عبارت‌هایی که ایندکس پیشوندی lower(...) COLLATE "C" در setup_db.py دارند؛ نام نویسنده/شخص
+# هم از اول نام و هم از اول نام خانوادگی پیدا می‌شود
+PREFIX_COLUMNS = {
+    "books": ("name",),
+    "authors": ("first_name || ' ' || last_name", "last_name"),
+    "people": ("first_name || ' ' || last_name", "last_name"),
+    "genres": ("name",),
+    "publishers": ("name",),
+}
+PICKER_LIMIT = 20
+PREFIX_CACHE_SIZE = 2000
+
+
+class LookupCache:
+    """cache از نوع LRU برای (table, کلید) -> مقدار (مثلا id -> نام)، مشترک بین همه صفحه‌ها و thread ها"""
+
+    def __init__(self, max_size=LOOKUP_CACHE_SIZE):
+        self.max_size = max_size
+        self._names = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, table, item_id):
+        """مقدار ذخیره‌شده یا None (بدون رفتن به دیتابیس)"""
+        with self._lock:
+            if (table, item_id) not in self._names:
+                return None
+            self._names.move_to_end((table, item_id))
+            return self._names[(table, item_id)]
+
+    def put(self, table, item_id, name):
+        with self._lock:
+            self._names[(table, item_id)] = name
+            self._names.move_to_end((table, item_id))
+            while len(self._names) > self.max_size:
+                self._names.popitem(last=False)
+
+    def invalidate(self, table, ids=None):
+        """حذف نام‌های table (فقط ids اگر داده شود) بعد از ویرایش یا حذف"""
+        with self._lock:
+            if ids is None:
+                for key in [key for key in self._names if key[0] == table]:
+                    del self._names[key]
+            else:
+                for item_id in ids:
+                    self._names.pop((table, item_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+
+    def resolve(self, conn, table, ids):
+        """dict از id -> نام؛ id هایی که در cache نیستند با یک کوئری خوانده می‌شوند"""
+        names, missing = {}, []
+        with self._lock:
+            for item_id in set(ids):
+                if (table, item_id) in self._names:
+                    self._names.move_to_end((table, item_id))
+                    names[item_id] = self._names[(table, item_id)]
+                else:
+                    missing.append(item_id)
+        if missing:
+            with conn.cursor() as cur:
+                execute_prepared(cur, f"{table}_names",
+                                 f"SELECT id, {NAME_COLUMNS[table].format(t=table)} FROM {table} WHERE id = ANY(%s)",
+                                 (missing,))
+                for item_id, name in cur.fetchall():
+                    names[item_id] = name
+                    self.put(table, item_id, name)
+        return names
+
+
+def prefix_search_query(table, prefix):
+    """(query, params) برای حداکثر PICKER_LIMIT رکورد (id, نام) که نامشان با prefix شروع می‌شود
+
+    عدد به عنوان id جستجو می‌شود. هر شاخه با ایندکس پیشوندی و LIMIT خودش اجرا می‌شود.
+    """
+    name = NAME_COLUMNS[table].format(t=table)
+    if prefix.isdigit():
+        return f"SELECT id, {name} AS name FROM {table} WHERE id = %s", (int(prefix),)
+    pattern = like_prefix(prefix.lower())
+    branches, params = [], []
+    for column in PREFIX_COLUMNS[table]:
+        key = f'lower({column}) COLLATE "C"'
+        branches.append(f"SELECT id, {name} AS name FROM {table} WHERE {key} LIKE %s ORDER BY {key} LIMIT %s")
+        params += [pattern, PICKER_LIMIT]
+    if len(branches) == 1:
+        return branches[0], tuple(params)
+    query = " UNION ".join(f"({branch})" for branch in branches) + " ORDER BY name, id LIMIT %s"
+    return query, (*params, PICKER_LIMIT)
+
+
+def search_names(conn, table, prefix):
+    """لیست (id, نام) برای prefix؛ نتیجه هر پیشوند در prefix_cache نگه داشته می‌شود"""
+    key = prefix.strip().lower()
+    results = prefix_cache.get(table, key)
+    if results is None:
+        with conn.cursor() as cur:
+            query, params = prefix_search_query(table, key)
+            execute_prepared(cur, statement_name(f"{table}_prefix", query), query, params)
+            results = cur.fetchall()
+        prefix_cache.put(table, key, results)
+    for item_id, name in results:
+        name_cache.put(table, item_id, name)
+    return results
+
+
+name_cache = LookupCache()
+# (table, پیشوند) -> نتیجه جستجو؛ با ویرایش هر رکورد آن جدول کامل پاک می‌شود
+prefix_cache = LookupCache(PREFIX_CACHE_SIZE)
@@ -0,0 +1,752 @@
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import psycopg2
+
+from circulation import BORROWED, RETURNED, CirculationError
+from db import FILTER_OPERATORS, SORT_COLUMNS, get_connection, like_prefix
+from lookups import NAME_COLUMNS, PICKER_LIMIT, PREFIX_COLUMNS
+from repositories import REPOSITORIES, referencing_columns
+from search import SEARCH_LIMIT
+
+# --- نسخه محلی (SQLite) برای کار بدون سرور ---
+# وقتی MIRROR_ENABLED روشن باشد Main_application یک کپی SQLite از MIRROR_TABLES نگه می‌دارد و در پس‌زمینه
+# به‌روزش می‌کند. اگر سرور در دسترس نباشد یا هر رفت و برگشت بیشتر از SLOW_LINK_MS طول بکشد، صفحه‌های
+# جدول از همین کپی می‌خوانند و نوشتن‌ها در جدول outbox صف می‌شوند تا بعدا به ترتیب روی سرور اجرا شوند.
+# ویرایش یا حذفی که ردیفش در این فاصله روی سرور عوض شده اجرا نمی‌شود و به عنوان conflict می‌ماند
+# (python offline.py status).
+MIRROR_ENABLED = False
+MIRROR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "library_mirror.sqlite3")
+MIRROR_TABLES = ("genres", "publishers", "authors", "books", "people",
+                 "book_authors", "book_genres", "book_publishers", "borrowings")
+SYNC_INTERVAL = 10
+SLOW_LINK_MS = 500
+SNAPSHOT_BATCH_SIZE = 10000
+# هر بار حداکثر این تعداد id با یک کوئری از سرور خوانده می‌شود
+FETCH_BATCH_SIZE = 1000
+# سرور فقط بعد از اولین همگام‌سازی یک نسخه محلی در change_log می‌نویسد. تغییرات قدیمی‌تر از این هر
+# PRUNE_INTERVAL_HOURS ساعت در همگام‌سازی (یا با python offline.py prune) از change_log پاک می‌شوند؛ نسخه
+# محلی که بیشتر از این همگام نشده باشد کامل دوباره خوانده می‌شود
+CHANGE_LOG_KEEP_DAYS = 30
+PRUNE_INTERVAL_HOURS = 24
+# فاصله بررسی تمام شدن تراکنش‌هایی که قبل از روشن شدن change_log شروع شده‌اند (ثانیه)
+CHANGE_LOG_WAIT_INTERVAL = 0.1
+# ثانیه‌هایی که یک اتصال SQLite پشت نوشتن اتصال دیگر صبر می‌کند
+LOCAL_BUSY_TIMEOUT = 30
+
+# نوع ستون‌های PostgreSQL (oid) -> نوع ستون SQLite؛ بقیه (متن، تاریخ) به صورت متن ذخیره می‌شوند
+_LOCAL_TYPES = {
+    16: "INTEGER",
+    20: "INTEGER",
+    21: "INTEGER",
+    23: "INTEGER",
+    700: "REAL",
+    701: "REAL",
+    1700: "NUMERIC",
+}
+
+_STATE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS mirror_state (key TEXT PRIMARY KEY, value TEXT);
+    CREATE TABLE IF NOT EXISTS outbox (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        op TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        row_values TEXT,
+        base TEXT,
+        queued_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        conflict TEXT
+    );
+"""
+
+
+class OfflineError(Exception):
+    """کاری که بدون سرور انجام نمی‌شود (مثلا امانت با بررسی موجودی)"""
+
+
+def _local_value(value):
+    # تاریخ‌ها مثل خروجی ::text در PostgreSQL ذخیره می‌شوند تا ترتیب و مقایسه‌شان درست بماند
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _local_row(row):
+    return [_local_value(value) for value in row]
+
+
+def _placeholders(count):
+    return ", ".join("?" * count)
+
+
+def _snapshot_query(table):
+    # از امانت‌ها فقط امانت‌های اخیر (مثل صفحه Borrowings)؛ تغییرات امانت‌های قدیمی‌تر بعدا اضافه می‌شوند
+    repository = REPOSITORIES[table]
+    if table == "borrowings":
+        repository = repository.recent()
+    return f"SELECT {repository.select_list} FROM {repository.relation}"
+
+
+def _enable_change_log(conn):
+    """روشن کردن change_log سرور (اگر خاموش باشد) پیش از اولین snapshot
+
+    تراکنشی که قبل از روشن شدن شروع شده ممکن است تغییراتش را ثبت نکند؛ تا تمام شدن همه آن‌ها صبر می‌شود
+    تا snapshot بعدی تغییراتشان را ببیند.
+    """
+    with conn.cursor() as cur:
+        cur.execute("UPDATE change_log_settings SET enabled = TRUE WHERE NOT enabled RETURNING txid_current()")
+        row = cur.fetchone()
+        if row is None:
+            return
+        while True:
+            cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()) > %s", row)
+            if cur.fetchone()[0]:
+                return
+            time.sleep(CHANGE_LOG_WAIT_INTERVAL)
+
+
+def _fetch_rows(cur, table, ids):
+    """ردیف‌های فعلی ids روی سرور (فقط ستون‌های db_columns) با کلید id"""
+    repository = REPOSITORIES[table]
+    rows = {}
+    ids = list(ids)
+    for start in range(0, len(ids), FETCH_BATCH_SIZE):
+        cur.execute(f"SELECT {repository.select_list} FROM {table} WHERE id = ANY(%s)",
+                    (ids[start:start + FETCH_BATCH_SIZE],))
+        rows.update((row[0], _local_row(row)) for row in cur.fetchall())
+    return rows
+
+
+def _upsert(local, table, rows):
+    columns = REPOSITORIES[table].db_columns
+    local.executemany(f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({_placeholders(len(columns))})",
+                      rows)
+
+
+@contextmanager
+def _server_snapshot(conn):
+    """تراکنش REPEATABLE READ روی سرور (همه کوئری‌ها یک تصویر ثابت از دیتابیس را می‌بینند)
+
+    cursor با نام (سمت سرور) هم فقط داخل تراکنش و بدون autocommit کار می‌کند.
+    """
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            yield
+    finally:
+        conn.autocommit = autocommit
+
+
+class Mirror:
+    """فایل SQLite نسخه محلی: کپی جدول‌ها، وضعیت همگام‌سازی (mirror_state) و صف نوشتن‌ها (outbox)
+
+    هر thread با connect() اتصال خودش را می‌گیرد؛ فایل در حالت WAL است و خواندن‌ها پشت همگام‌سازی نمی‌مانند.
+    """
+
+    def __init__(self, path=MIRROR_PATH):
+        self.path = path
+        # True یعنی صفحه‌های جدول از نسخه محلی می‌خوانند و در آن می‌نویسند؛ فقط thread رابط کاربری عوضش می‌کند
+        self.active = False
+        self._repositories = {}
+        with self.connect() as local:
+            local.execute("PRAGMA journal_mode=WAL")
+            local.executescript(_STATE_SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        local = sqlite3.connect(self.path, timeout=LOCAL_BUSY_TIMEOUT)
+        try:
+            yield local
+        finally:
+            local.close()
+
+    def repository(self, table):
+        """MirrorRepository جدول table (همان رابط repositories.Repository روی نسخه محلی)"""
+        if table not in self._repositories:
+            repository_class = MirrorBorrowingsRepository if table == "borrowings" else MirrorRepository
+            self._repositories[table] = repository_class(table)
+        return self._repositories[table]
+
+    # --- وضعیت ---
+    def status(self):
+        """(آماده بودن نسخه محلی، تعداد نوشتن‌های در صف، تعداد conflict ها)"""
+        with self.connect() as local:
+            ready = _get_state(local, "horizon") is not None
+            total, conflicts = local.execute("SELECT count(*), count(conflict) FROM outbox").fetchone()
+        return ready, total - conflicts, conflicts
+
+    def table_counts(self):
+        with self.connect() as local:
+            return {table: local.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                    for table in MIRROR_TABLES if _has_table(local, table)}
+
+    # --- همگام‌سازی با سرور ---
+    def sync(self, conn):
+        """اجرای نوشتن‌های صف‌شده و خواندن تغییرات سرور؛ خروجی لیست تغییرات نسخه محلی مثل db.ChangeListener
+
+        بار اول (یا اگر نسخه محلی از CHANGE_LOG_KEEP_DAYS قدیمی‌تر باشد) همه جدول‌ها کامل خوانده می‌شوند.
+        """
+        changes = self.replay(conn)
+        with conn.cursor() as cur:
+            cur.execute("SELECT now()")
+            server_now = cur.fetchone()[0]
+        with self.connect() as local:
+            synced_at = _get_state(local, "synced_at")
+        if synced_at is None or (datetime.fromisoformat(synced_at)
+                                 < server_now - timedelta(days=CHANGE_LOG_KEEP_DAYS - 1)):
+            self.snapshot(conn)
+            return changes + [{"table": None, "op": "RESYNC", "id": None}]
+        changes += self.pull(conn)
+        prune_change_log(conn, interval_hours=PRUNE_INTERVAL_HOURS)
+        return changes
+
+    def snapshot(self, conn, tables=MIRROR_TABLES):
+        """خواندن کامل tables از یک تصویر ثابت سرور؛ بدون tables کامل همه جدول‌ها و ثبت horizon"""
+        full = tables == MIRROR_TABLES
+        if full:
+            _enable_change_log(conn)
+        with _server_snapshot(conn):
+            with conn.cursor() as cur:
+                cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()), now()")
+                horizon, synced_at = cur.fetchone()
+            with self.connect() as local, local:
+                for table in tables:
+                    self._copy_table(conn, local, table)
+                if full:
+                    _set_state(local, "horizon", horizon)
+                    _set_state(local, "synced_at", synced_at.isoformat())
+
+    def _copy_table(self, conn, local, table):
+        with conn.cursor(name=f"mirror_{table}") as cur:
+            cur.itersize = SNAPSHOT_BATCH_SIZE
+            cur.execute(_snapshot_query(table))
+            rows = cur.fetchmany(SNAPSHOT_BATCH_SIZE)
+            _create_table(local, table, cur.description)
+            local.execute(f"DELETE FROM {table}")
+            while rows:
+                _upsert(local, table, (_local_row(row) for row in rows))
+                rows = cur.fetchmany(SNAPSHOT_BATCH_SIZE)
+
+    def pull(self, conn):
+        """اعمال ردیف‌هایی که از آخرین همگام‌سازی در change_log سرور ثبت شده‌اند
+
+        همه تراکنش‌های با xid کمتر از txid_snapshot_xmin تمام شده‌اند؛ پس تغییرات بازه [horizon قبلی،
+        horizon جدید) کامل هستند و تراکنشی که هنوز باز است دفعه بعد خوانده می‌شود. برای هر id ردیف فعلی
+        سرور خوانده می‌شود، پس ترتیب و تکرار تغییرها مهم نیست.
+        """
+        with self.connect() as local:
+            horizon = int(_get_state(local, "horizon"))
+        with conn.cursor() as cur:
+            cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()), now()")
+            new_horizon, synced_at = cur.fetchone()
+            cur.execute("""
+                SELECT table_name, row_id, bool_or(op = 'RESYNC') FROM change_log
+                WHERE xid >= %s AND xid < %s AND table_name = ANY(%s)
+                GROUP BY table_name, row_id
+            """, (horizon, new_horizon, list(MIRROR_TABLES)))
+            logged = cur.fetchall()
+            resync = {table for table, _, is_resync in logged if is_resync}
+            changed = {}
+            for table, row_id, _ in logged:
+                if table not in resync and row_id is not None:
+                    changed.setdefault(table, set()).add(row_id)
+            current = {table: _fetch_rows(cur, table, ids) for table, ids in changed.items()}
+        if resync:
+            self.snapshot(conn, tuple(resync))
+
+        changes = [{"table": table, "op": "RESYNC", "id": None} for table in resync]
+        with self.connect() as local, local:
+            # ردیفی که نوشتن صف‌شده دارد تا اجرای آن نوشتن دست نمی‌خورد
+            local.execute("BEGIN IMMEDIATE")
+            pending = set(local.execute("SELECT table_name, row_id FROM outbox WHERE conflict IS NULL"))
+            for table, ids in changed.items():
+                ids = {row_id for row_id in ids if (table, row_id) not in pending}
+                rows = [row for row_id, row in current[table].items() if row_id in ids]
+                # از ردیف‌های حذف‌شده فقط آن‌هایی که در نسخه محلی بودند (مثلا نه امانت‌های قدیمی)
+                deleted = [row_id for row_id in ids - current[table].keys()
+                           if local.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,)).rowcount]
+                _upsert(local, table, rows)
+                changes += [{"table": table, "op": "UPDATE", "id": row[0]} for row in rows]
+                changes += [{"table": table, "op": "DELETE", "id": row_id} for row_id in deleted]
+            _set_state(local, "horizon", new_horizon)
+            _set_state(local, "synced_at", synced_at.isoformat())
+        return changes
+
+    def replay(self, conn):
+        """اجرای نوشتن‌های صف‌شده روی سرور به ترتیب ثبت
+
+        ویرایش و حذف فقط وقتی اجرا می‌شوند که ردیف سرور هنوز همان base (مقدار قبل از ویرایش محلی) باشد؛
+        در غیر این صورت (یا اگر سرور خطا بدهد) نوشتن با پیام conflict در outbox می‌ماند و ردیف محلی
+        مقدار سرور را می‌گیرد. قطع اتصال (OperationalError) کار را متوقف می‌کند تا دفعه بعد ادامه یابد.
+        """
+        with self.connect() as local:
+            entries = local.execute("""
+                SELECT seq, table_name, op, row_id, row_values, base FROM outbox
+                WHERE conflict IS NULL ORDER BY seq
+            """).fetchall()
+        changes = []
+        for seq, table, op, row_id, row_values, base in entries:
+            with self.connect() as local:
+                # ممکن است id کلید خارجی آن بعد از اجرای درج قبلی عوض شده باشد
+                row_values = local.execute("SELECT row_values FROM outbox WHERE seq = ?", (seq,)).fetchone()[0]
+            values = json.loads(row_values) if row_values is not None else None
+            try:
+                conflict, row = _replay_entry(conn, REPOSITORIES[table], op, row_id, values,
+                                              json.loads(base) if base is not None else None)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                raise
+            except (psycopg2.Error, CirculationError, ValueError) as e:
+                conflict, row = str(e).strip(), None
+            if conflict is not None and row is None and op != "INSERT":
+                with conn.cursor() as cur:
+                    row = _fetch_rows(cur, table, [row_id]).get(row_id)
+
+            with self.connect() as local, local:
+                if conflict is not None:
+                    local.execute("UPDATE outbox SET conflict = ? WHERE seq = ?", (conflict, seq))
+                else:
+                    local.execute("DELETE FROM outbox WHERE seq = ?", (seq,))
+                if op == "INSERT" and conflict is None:
+                    # ردیف id موقت منفی داشت؛ id واقعی سرور جایگزین می‌شود
+                    _rename_row(local, table, row_id, row[0])
+                    changes.append({"table": table, "op": "DELETE", "id": row_id})
+                    row_id = row[0]
+                if row is not None:
+                    _upsert(local, table, [row])
+                    changes.append({"table": table, "op": "UPDATE", "id": row_id})
+                elif op == "INSERT" or conflict is not None:
+                    local.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+                    changes.append({"table": table, "op": "DELETE", "id": row_id})
+        return changes
+
+
+def _replay_entry(conn, repository, op, row_id, values, base):
+    """(پیام conflict یا None، ردیف فعلی سرور یا None) برای یک نوشتن صف‌شده"""
+    if op == "INSERT":
+        row = repository.insert(conn, values)
+        return None, _local_row(row[:len(repository.db_columns)])
+    with conn, conn.cursor() as cur:
+        cur.execute(f"SELECT {repository.select_list} FROM {repository.table} WHERE id = %s FOR UPDATE",
+                    (row_id,))
+        current = cur.fetchone()
+        if current is None:
+            return "Deleted on the server.", None
+        current = _local_row(current)
+        if current[1:] != base:
+            return "Changed on the server.", current
+        if op == "DELETE":
+            repository.delete(conn, [row_id])
+            return None, None
+        row = repository.update(conn, row_id, values)
+        return None, _local_row(row[:len(repository.db_columns)])
+
+
+def _rename_row(local, table, old_id, new_id):
+    """عوض کردن id ردیف محلی و همه کلیدهای خارجی (محلی و صف‌شده) که به آن اشاره می‌کنند"""
+    local.execute(f"UPDATE {table} SET id = ? WHERE id = ?", (new_id, old_id))
+    for ref_table, column in referencing_columns(table):
+        if ref_table not in MIRROR_TABLES:
+            continue
+        local.execute(f"UPDATE {ref_table} SET {column} = ? WHERE {column} = ?", (new_id, old_id))
+        index = REPOSITORIES[ref_table].columns.index(column)
+        for seq, row_values in local.execute(
+                "SELECT seq, row_values FROM outbox WHERE table_name = ? AND row_values IS NOT NULL",
+                (ref_table,)).fetchall():
+            values = json.loads(row_values)
+            if str(values[index]) == str(old_id):
+                values[index] = new_id
+                local.execute("UPDATE outbox SET row_values = ? WHERE seq = ?", (json.dumps(values), seq))
+
+
+# --- جدول‌های SQLite ---
+def _has_table(local, table):
+    return local.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+
+
+def _create_table(local, table, description):
+    """جدول محلی با نوع ستون‌های سرور و ایندکس‌های مرتب‌سازی و کلیدهای خارجی (اگر هنوز نباشد)"""
+    if _has_table(local, table):
+        return
+    columns = ", ".join(f"{column.name} {_LOCAL_TYPES.get(column.type_code, 'TEXT')}" for column in description[1:])
+    local.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, {columns})")
+    for column in SORT_COLUMNS.get(table, ()):
+        local.execute(f"CREATE INDEX idx_{table}_{column} ON {table} ({column}, id)")
+    for column in REPOSITORIES[table].lookups:
+        local.execute(f"CREATE INDEX idx_{table}_{column} ON {table} ({column})")
+
+
+def _get_state(local, key):
+    row = local.execute("SELECT value FROM mirror_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row is not None else None
+
+
+def _set_state(local, key, value):
+    local.execute("INSERT OR REPLACE INTO mirror_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+def _queue(local, table, op, row_id, values=None, base=None):
+    """ثبت نوشتن در outbox؛ چند نوشتن روی یک ردیف که هنوز اجرا نشده‌اند یکی می‌شوند
+
+    base مقدار ردیف قبل از اولین ویرایش محلی است و هنگام اجرا با ردیف سرور مقایسه می‌شود.
+    """
+    pending = local.execute("""
+        SELECT seq, op FROM outbox WHERE table_name = ? AND row_id = ? AND conflict IS NULL
+    """, (table, row_id)).fetchone()
+    row_values = json.dumps(list(values), default=str) if values is not None else None
+    if pending is None:
+        local.execute("INSERT INTO outbox (table_name, op, row_id, row_values, base) VALUES (?, ?, ?, ?, ?)",
+                      (table, op, row_id, row_values, json.dumps(base) if base is not None else None))
+    elif op == "DELETE" and pending[1] == "INSERT":
+        # ردیفی که هیچ وقت به سرور نرسیده
+        local.execute("DELETE FROM outbox WHERE seq = ?", (pending[0],))
+    elif op == "DELETE":
+        local.execute("UPDATE outbox SET op = 'DELETE', row_values = NULL WHERE seq = ?", (pending[0],))
+    else:
+        local.execute("UPDATE outbox SET row_values = ? WHERE seq = ?", (row_values, pending[0]))
+
+
+# --- خواندن و نوشتن جدول‌ها در نسخه محلی ---
+def _filter_query(query, params, filters):
+    """مثل db.filter_query برای SQLite (LIKE در SQLite خودش به بزرگی حروف انگلیسی حساس نیست)"""
+    conditions, values = [], []
+    for column, text in filters.items():
+        text = text.strip()
+        if not text:
+            continue
+        for operator in FILTER_OPERATORS:
+            if text.startswith(operator):
+                conditions.append(f"page.{column} {operator} ?")
+                values.append(text[len(operator):].strip())
+                break
+        else:
+            conditions.append(f"page.{column} LIKE ? ESCAPE '\\'")
+            values.append(like_prefix(text).replace("*", "%"))
+    if not conditions:
+        return query, tuple(params)
+    return f"SELECT * FROM ({query}) AS page WHERE {' AND '.join(conditions)}", tuple(params) + tuple(values)
+
+
+def _order_keys(sort_column):
+    # مثل ایندکس btree در PostgreSQL: NULL در ترتیب صعودی آخر و در نزولی اول می‌آید
+    if sort_column is None:
+        return ["page.id"]
+    return [f"(page.{sort_column} IS NULL)", f"coalesce(page.{sort_column}, '')", "page.id"]
+
+
+class MirrorRepository:
+    """همان رابط repositories.Repository روی نسخه محلی؛ conn اتصال sqlite3 از Mirror.connect است
+
+    ردیف‌ها همان row_type سرور را دارند (تاریخ‌ها به صورت متن). نوشتن‌ها روی نسخه محلی انجام و در outbox
+    صف می‌شوند؛ ردیف درج‌شده تا اجرا روی سرور id منفی موقت دارد.
+    """
+
+    def __init__(self, table):
+        self.server = REPOSITORIES[table]
+        self.table = table
+        self.columns = self.server.columns
+        self.lookups = self.server.lookups
+        self.db_columns = self.server.db_columns
+        self.row_columns = self.server.row_columns
+        self.row_type = self.server.row_type
+
+    def to_rows(self, rows):
+        return [self.row_type(*row) for row in rows]
+
+    # --- کوئری‌های خواندن ---
+    def page_query(self):
+        # SELECT و JOIN نام‌های Repository در SQLite هم معتبر است
+        return self.server.page_query()
+
+    def search_query(self, keyword):
+        """(query, params) هر کلمه keyword جایی در متن ردیف؛ عدد یعنی id ردیف یا کلید خارجی"""
+        keyword = keyword.strip()
+        if keyword.isdigit():
+            columns = ("id",) + tuple(self.lookups)
+            where = " OR ".join(f"page.{column} = ?" for column in columns)
+            params = (int(keyword),) * len(columns)
+        else:
+            text = " || ' ' || ".join(f"coalesce(page.{column}, '')" for column in self.row_columns)
+            words = keyword.split()
+            where = " AND ".join(f"({text}) LIKE ? ESCAPE '\\'" for _ in words)
+            params = tuple("%" + like_prefix(word) for word in words)
+        query = f"SELECT * FROM ({self.page_query()}) AS page WHERE {where} ORDER BY page.id LIMIT ?"
+        return query, params + (SEARCH_LIMIT,)
+
+    def source(self, filters=None, search=None):
+        query, params = search or (self.page_query(), ())
+        return _filter_query(query, params, filters or {})
+
+    def page(self, conn, limit, source=None, after_id=None, before_id=None,
+             sort_column=None, descending=False, sort_value=None):
+        """یک صفحه keyset مثل db.keyset_page (برای before_id برعکس ترتیب نمایش)"""
+        query, params = source or self.source()
+        backward = before_id is not None
+        key_id = before_id if backward else after_id
+        reverse = descending != backward
+        keys = _order_keys(sort_column)
+        where = ""
+        if key_id is not None:
+            where = f"WHERE ({', '.join(keys)}) {'<' if reverse else '>'} ({_placeholders(len(keys))})"
+            if sort_column is None:
+                params += (key_id,)
+            else:
+                params += (sort_value is None, "" if sort_value is None else sort_value, key_id)
+        order = "DESC" if reverse else "ASC"
+        order_by = ", ".join(f"{key} {order}" for key in keys)
+        return self.to_rows(conn.execute(
+            f"SELECT * FROM ({query}) AS page {where} ORDER BY {order_by} LIMIT ?", params + (limit,)))
+
+    def rows(self, conn, source, sort_column=None, descending=False):
+        query, params = source
+        if sort_column is not None:
+            order = "DESC" if descending else "ASC"
+            order_by = ", ".join(f"{key} {order}" for key in _order_keys(sort_column))
+            query = f"SELECT * FROM ({query}) AS page ORDER BY {order_by}"
+        return self.to_rows(conn.execute(query, params))
+
+    def estimate(self, conn, source=None):
+        query, params = source or self.source()
+        return conn.execute(f"SELECT count(*) FROM ({query})", params).fetchone()[0]
+
+    def get_many(self, conn, ids, source=None):
+        query, params = source or self.source()
+        ids = tuple(ids)
+        return self.to_rows(conn.execute(
+            f"SELECT * FROM ({query}) AS page WHERE page.id IN ({_placeholders(len(ids))}) ORDER BY page.id",
+            params + ids))
+
+    def _values(self, conn, item_id):
+        row = conn.execute(f"SELECT {', '.join(self.columns)} FROM {self.table} WHERE id = ?", (item_id,)).fetchone()
+        return list(row) if row is not None else None
+
+    # --- نوشتن (در صف outbox) ---
+    def insert(self, conn, values):
+        with conn:
+            item_id = conn.execute(f"SELECT min(coalesce(min(id), 0), 0) - 1 FROM {self.table}").fetchone()[0]
+            conn.execute(f"INSERT INTO {self.table} ({', '.join(self.db_columns)}) "
+                         f"VALUES ({_placeholders(len(self.db_columns))})", (item_id, *values))
+            _queue(conn, self.table, "INSERT", item_id, values)
+        return self.get_many(conn, [item_id])[0]
+
+    def update(self, conn, item_id, values):
+        with conn:
+            base = self._values(conn, item_id)
+            if base is None:
+                return None
+            assignments = ", ".join(f"{column} = ?" for column in self.columns)
+            conn.execute(f"UPDATE {self.table} SET {assignments} WHERE id = ?", (*values, item_id))
+            _queue(conn, self.table, "UPDATE", item_id, values, base)
+        return self.get_many(conn, [item_id])[0]
+
+    def update_column(self, conn, ids, column, value):
+        if column not in self.columns:
+            raise ValueError(f"Unknown column for {self.table}: {column}")
+        index = self.columns.index(column)
+        updated = []
+        for item_id in ids:
+            values = self._values(conn, item_id)
+            if values is not None:
+                values[index] = value
+                updated.append(self.update(conn, item_id, values))
+        return updated
+
+    def delete(self, conn, ids):
+        """حذف ids؛ ردیف‌های وابسته محلی هم مثل ON DELETE CASCADE سرور حذف می‌شوند"""
+        deleted = 0
+        with conn:
+            for item_id in ids:
+                base = self._values(conn, item_id)
+                if base is None:
+                    continue
+                conn.execute(f"DELETE FROM {self.table} WHERE id = ?", (item_id,))
+                _queue(conn, self.table, "DELETE", item_id, base=base)
+                deleted += 1
+            for table, column in referencing_columns(self.table):
+                if table in MIRROR_TABLES:
+                    conn.execute(f"DELETE FROM {table} WHERE {column} IN ({_placeholders(len(ids))})", tuple(ids))
+        return deleted
+
+    def delete_impact(self, conn, ids):
+        impact = {}
+        for table, column in referencing_columns(self.table):
+            if table in MIRROR_TABLES:
+                count = conn.execute(f"SELECT count(*) FROM {table} WHERE {column} IN ({_placeholders(len(ids))})",
+                                     tuple(ids)).fetchone()[0]
+                if count:
+                    impact[table] = count
+        return impact
+
+
+class MirrorBorrowingsRepository(MirrorRepository):
+    """امانت‌ها در نسخه محلی؛ بازگشت امانت صف می‌شود ولی امانت جدید بررسی موجودی سرور را لازم دارد"""
+
+    def checkout(self, conn, person_id, book_ids, borrow_date=None):
+        raise OfflineError("Checking out books needs the database server (availability is checked there).")
+
+    def return_loan(self, conn, borrowing_id, return_date=None):
+        rows = self.get_many(conn, [borrowing_id])
+        if not rows or rows[0].status != BORROWED:
+            raise CirculationError(f"Borrowing #{borrowing_id} is not an open loan.")
+        row = rows[0]
+        values = (row.book_id, row.person_id, row.borrow_date, return_date or date.today().isoformat(), RETURNED)
+        return self.update(conn, borrowing_id, values)
+
+
+def search_local_names(conn, table, prefix):
+    """مثل lookups.search_names روی نسخه محلی: لیست (id, نام) برای prefix"""
+    name = NAME_COLUMNS[table].format(t=table)
+    prefix = prefix.strip()
+    if prefix.isdigit():
+        return conn.execute(f"SELECT id, {name} FROM {table} WHERE id = ?", (int(prefix),)).fetchall()
+    where = " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in PREFIX_COLUMNS[table])
+    params = (like_prefix(prefix),) * len(PREFIX_COLUMNS[table])
+    return conn.execute(f"SELECT id, {name} AS name FROM {table} WHERE {where} ORDER BY name, id LIMIT ?",
+                        params + (PICKER_LIMIT,)).fetchall()
+
+
+# --- همگام‌سازی در پس‌زمینه ---
+class MirrorSync(threading.Thread):
+    """thread که هر SYNC_INTERVAL ثانیه (یا با wake) نسخه محلی را با سرور همگام می‌کند
+
+    online (None تا اولین تلاش) و latency_ms وضعیت ارتباط با سرور هستند. تغییرات نسخه محلی مثل
+    db.ChangeListener در صف changes قرار می‌گیرند. online فقط بعد از اجرای نوشتن‌های صف‌شده True می‌شود تا
+    صفحه‌هایی که به سرور برمی‌گردند آن‌ها را ببینند.
+    """
+
+    def __init__(self, mirror):
+        super().__init__(name="mirror-sync", daemon=True)
+        self.mirror = mirror
+        self.online = None
+        self.latency_ms = None
+        self.changes = queue.Queue()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+
+    def wake(self):
+        self._wake_event.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def link_is_down_or_slow(self):
+        return self.online is False or (self.latency_ms or 0) > SLOW_LINK_MS
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                started = time.perf_counter()
+                with get_connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                    latency_ms = (time.perf_counter() - started) * 1000
+                    self.latency_ms, self.online = latency_ms, True
+                    # sync خودش اول نوشتن‌های صف‌شده را اجرا می‌کند (replay)
+                    changes = self.mirror.sync(conn)
+                for change in changes:
+                    self.changes.put(change)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self.online = False
+            except Exception as e:
+                print(f"❌ Local copy sync failed: {e}")
+            self._wake_event.wait(SYNC_INTERVAL)
+            self._wake_event.clear()
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror():
+    """Mirror مشترک برنامه یا None اگر MIRROR_ENABLED خاموش باشد"""
+    global _mirror
+    if not MIRROR_ENABLED:
+        return None
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = Mirror()
+        return _mirror
+
+
+def prune_change_log(conn, keep_days=CHANGE_LOG_KEEP_DAYS, interval_hours=None):
+    """حذف تغییرات قدیمی‌تر از keep_days روز از change_log سرور و برگرداندن تعداد ردیف‌های حذف‌شده
+
+    با interval_hours فقط اگر آخرین حذف قدیمی‌تر از این باشد (از میان همه کلاینت‌ها فقط یکی حذف می‌کند).
+    """
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE change_log_settings SET pruned_at = now()
+            WHERE %(hours)s IS NULL OR pruned_at IS NULL OR pruned_at < now() - make_interval(hours => %(hours)s)
+            RETURNING 1
+        """, {"hours": interval_hours})
+        if cur.fetchone() is None:
+            return 0
+        cur.execute("DELETE FROM change_log WHERE changed_at < now() - make_interval(days => %s)", (keep_days,))
+        return cur.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the local SQLite copy used when the server is unreachable.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("sync", help="send queued changes and update the local copy now")
+    commands.add_parser("status", help="show the local copy, queued changes and conflicts")
+    commands.add_parser("discard", help="drop queued changes that conflicted with the server")
+    prune_parser = commands.add_parser("prune", help="delete old entries of the server change log now")
+    prune_parser.add_argument("--keep-days", type=int, default=CHANGE_LOG_KEEP_DAYS)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "prune":
+            with get_connection() as conn:
+                print(f"✅ Deleted {prune_change_log(conn, args.keep_days)} old change log entries.")
+            return
+
+        mirror = Mirror()
+        if args.command == "sync":
+            started = time.perf_counter()
+            with get_connection() as conn:
+                changes = mirror.sync(conn)
+            print(f"✅ Local copy synced in {time.perf_counter() - started:.1f}s ({len(changes)} change(s)).")
+        elif args.command == "discard":
+            with mirror.connect() as local, local:
+                discarded = local.execute("DELETE FROM outbox WHERE conflict IS NOT NULL").rowcount
+            print(f"🗑️ Discarded {discarded} conflicting change(s).")
+            return
+
+        ready, pending, conflicts = mirror.status()
+        if not ready:
+            print(f"⚠️ '{mirror.path}' has no local copy yet; run 'python offline.py sync'.")
+            return
+        with mirror.connect() as local:
+            synced_at = _get_state(local, "synced_at")
+            entries = local.execute("""
+                SELECT seq, table_name, op, row_id, row_values, conflict FROM outbox
+                WHERE conflict IS NOT NULL ORDER BY seq
+            """).fetchall()
+        print(f"📦 Local copy '{mirror.path}', last synced {synced_at}")
+        for table, count in mirror.table_counts().items():
+            print(f"   {table:16} {count} rows")
+        print(f"📝 {pending} queued change(s), {conflicts} conflict(s)")
+        for seq, table, op, row_id, row_values, conflict in entries:
+            print(f"   #{seq} {op} {table} #{row_id} {row_values or ''}: {conflict}")
+    except Exception as e:
+        print(f"❌ {args.command.capitalize()} failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
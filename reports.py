@@ -0,0 +1,179 @@
+import argparse
+import sys
+import time
+
+from circulation import BORROWED
+from db import get_connection
+
+# --- گزارش‌ها (materialized view) ---
+# هر گزارش یک materialized view به نام report_<name> است که setup_db.py می‌سازد. صفحه Reports فقط از
+# همین view ها می‌خواند؛ REFRESH ... CONCURRENTLY آن‌ها را بدون قفل کردن خواننده‌ها دوباره حساب می‌کند.
+# امانت بازی که از LOAN_PERIOD_DAYS روز قدیمی‌تر باشد دیرکرد حساب می‌شود.
+LOAN_PERIOD_DAYS = 14
+REPORT_ROWS = 500
+# گزارش‌هایی که قدیمی‌تر از این باشند با باز شدن صفحه Reports (یا در زمان‌بندی آن) تازه می‌شوند
+REPORT_MAX_AGE_MINUTES = 15
+# همه کلاینت‌ها با همین advisory lock مطمئن می‌شوند در هر لحظه فقط یکی گزارش‌ها را تازه می‌کند
+REFRESH_LOCK_ID = 4017
+
+# name -> (عنوان، ستون‌های نمایش، تعریف view، کلید یکتا برای REFRESH CONCURRENTLY، ترتیب نمایش)
+REPORTS = {
+    "overdue_by_person": (
+        "Overdue loans by member",
+        ("Person ID", "Member", "Email", "Phone", "Overdue Loans", "Oldest Loan", "Days Overdue"),
+        f"""
+            SELECT p.id AS person_id, p.first_name || ' ' || p.last_name AS member, p.email, p.phone,
+                   count(*) AS overdue_loans, min(br.borrow_date) AS oldest_loan,
+                   CURRENT_DATE - min(br.borrow_date) - {LOAN_PERIOD_DAYS} AS days_overdue
+            FROM borrowings br
+            JOIN people p ON p.id = br.person_id
+            WHERE br.status = '{BORROWED}' AND br.borrow_date < CURRENT_DATE - {LOAN_PERIOD_DAYS}
+            GROUP BY p.id
+        """,
+        "person_id",
+        "days_overdue DESC, person_id",
+    ),
+    "circulation_by_book": (
+        "Most borrowed books",
+        ("Book ID", "Book", "Loans", "Open Loans", "Last Borrowed"),
+        f"""
+            SELECT b.id AS book_id, b.name AS book, count(*) AS loans,
+                   count(*) FILTER (WHERE br.status = '{BORROWED}') AS open_loans,
+                   max(br.borrow_date) AS last_borrowed
+            FROM borrowings br
+            JOIN books b ON b.id = br.book_id
+            GROUP BY b.id
+        """,
+        "book_id",
+        "loans DESC, book_id",
+    ),
+    "circulation_by_genre_month": (
+        "Loans per genre and month",
+        ("Genre ID", "Genre", "Month", "Loans", "Borrowers"),
+        """
+            SELECT g.id AS genre_id, g.name AS genre, date_trunc('month', br.borrow_date)::date AS month,
+                   count(*) AS loans, count(DISTINCT br.person_id) AS borrowers
+            FROM borrowings br
+            JOIN book_genres bg ON bg.book_id = br.book_id
+            JOIN genres g ON g.id = bg.genre_id
+            GROUP BY g.id, month
+        """,
+        "genre_id, month",
+        "month DESC, loans DESC, genre_id",
+    ),
+    "circulation_by_month": (
+        "Loans per month",
+        ("Month", "Loans", "Still Open", "Borrowers", "Titles"),
+        f"""
+            SELECT date_trunc('month', borrow_date)::date AS month, count(*) AS loans,
+                   count(*) FILTER (WHERE status = '{BORROWED}') AS still_open,
+                   count(DISTINCT person_id) AS borrowers, count(DISTINCT book_id) AS titles
+            FROM borrowings
+            GROUP BY month
+        """,
+        "month",
+        "month DESC",
+    ),
+    "active_loans": (
+        "Active loans by genre and publisher",
+        ("Category", "ID", "Name", "Active Loans", "Members"),
+        f"""
+            SELECT 'genre' AS category, g.id AS item_id, g.name, count(*) AS active_loans,
+                   count(DISTINCT br.person_id) AS members
+            FROM borrowings br
+            JOIN book_genres bg ON bg.book_id = br.book_id
+            JOIN genres g ON g.id = bg.genre_id
+            WHERE br.status = '{BORROWED}'
+            GROUP BY g.id
+            UNION ALL
+            SELECT 'publisher', pb.id, pb.name, count(*), count(DISTINCT br.person_id)
+            FROM borrowings br
+            JOIN book_publishers bp ON bp.book_id = br.book_id
+            JOIN publishers pb ON pb.id = bp.publisher_id
+            WHERE br.status = '{BORROWED}'
+            GROUP BY pb.id
+        """,
+        "category, item_id",
+        "active_loans DESC, category, item_id",
+    ),
+}
+
+
+def view_name(name):
+    return f"report_{name}"
+
+
+def report_rows(conn, name, limit=REPORT_ROWS):
+    """ردیف‌های گزارش name به ترتیب نمایش (حداکثر limit ردیف)"""
+    _, _, _, _, order = REPORTS[name]
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT * FROM {view_name(name)} ORDER BY {order} LIMIT %s", (limit,))
+        return cur.fetchall()
+
+
+def last_refreshed(conn):
+    """dict از name -> (زمان آخرین REFRESH، مدت آن به میلی‌ثانیه)"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT name, refreshed_at, duration_ms FROM report_refreshes")
+        return {name: (refreshed_at, duration_ms) for name, refreshed_at, duration_ms in cur.fetchall()}
+
+
+def refresh_reports(conn, names=None, max_age_minutes=None):
+    """تازه کردن گزارش‌ها با REFRESH MATERIALIZED VIEW CONCURRENTLY
+
+    با max_age_minutes فقط گزارش‌هایی که قدیمی‌تر از آن هستند تازه می‌شوند. اگر کلاینت دیگری در حال
+    تازه کردن باشد کاری انجام نمی‌شود و None برمی‌گردد؛ در غیر این صورت dict از name -> میلی‌ثانیه.
+    """
+    names = list(names or REPORTS)
+    timings = {}
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (REFRESH_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            return None
+        try:
+            if max_age_minutes is not None:
+                cur.execute("""
+                    SELECT name FROM report_refreshes
+                    WHERE refreshed_at > now() - make_interval(mins => %s)
+                """, (max_age_minutes,))
+                fresh = {row[0] for row in cur.fetchall()}
+                names = [name for name in names if name not in fresh]
+            for name in names:
+                started = time.perf_counter()
+                cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view_name(name)}")
+                timings[name] = (time.perf_counter() - started) * 1000
+                cur.execute("""
+                    INSERT INTO report_refreshes (name, refreshed_at, duration_ms) VALUES (%s, now(), %s)
+                    ON CONFLICT (name) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at,
+                                                     duration_ms = EXCLUDED.duration_ms
+                """, (name, timings[name]))
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (REFRESH_LOCK_ID,))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the report materialized views (e.g. from cron).")
+    parser.add_argument("--only", nargs="+", choices=sorted(REPORTS), help="refresh only these reports")
+    parser.add_argument("--max-age", type=int, metavar="MINUTES",
+                        help="skip reports refreshed less than MINUTES ago")
+    args = parser.parse_args()
+
+    try:
+        with get_connection() as conn:
+            timings = refresh_reports(conn, args.only, args.max_age)
+    except Exception as e:
+        print(f"❌ Refresh failed: {e}")
+        sys.exit(1)
+
+    if timings is None:
+        print("⏳ Another client is already refreshing the reports.")
+        return
+    for name, ms in timings.items():
+        print(f"✅ {view_name(name)} refreshed in {ms:.0f} ms")
+    if not timings:
+        print("🟢 All reports are up to date.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+from datetime import date
+from itertools import groupby
+
+from psycopg2.extras import execute_batch, execute_values
+
+from circulation import BORROWED, RETURNED, checkout_many, return_book
+from db import (estimate_query_rows, estimate_table_rows, execute_prepared, filter_query, keyset_page,
+                sorted_query, statement_name)
+from lookups import NAME_COLUMNS, name_cache
+from search import SEARCHES
+
+# --- دسترسی به جدول‌ها بدون رابط گرافیکی ---
+# هر Repository کوئری‌های یک جدول را می‌سازد و اجرا می‌کند. صفحه‌های Main_application، library.py و ابزارهای
+# خط فرمان همه از همین‌ها استفاده می‌کنند. هر ردیف یک tuple به ترتیب row_columns است:
+# id، ستون‌های جدول و در انتها نام کلیدهای خارجی (lookups).
+# عملیات گروهی هر BATCH_SIZE ردیف را با یک دستور SQL می‌فرستند. بقیه کوئری‌ها prepared statement های هر
+# اتصال هستند (db.execute_prepared) و نامشان با نام جدول شروع می‌شود، مثلا books_update.
+BATCH_SIZE = 1000
+# صفحه Borrowings به طور پیش‌فرض فقط امانت‌های این چند روز اخیر را نشان می‌دهد (امانت باز قدیمی‌تر هم نه)
+RECENT_LOAN_DAYS = 365
+
+
+class Row:
+    """یک ردیف با نوع‌های اصلی دیتابیس (int، date، ...) و یک slot برای هر ستون
+
+    هر Repository زیرکلاس خودش را با __slots__ = row_columns می‌سازد؛ ردیف __dict__ ندارد و از tuple
+    هم کم‌حجم‌تر است. مثل tuple پیمایش و ایندکس می‌شود (برای csv، print و کدهای قدیمی‌تر).
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for column, value in zip(self.__slots__, values):
+            setattr(self, column, value)
+
+    def __iter__(self):
+        return (getattr(self, column) for column in self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        return getattr(self, self.__slots__[index])
+
+    def __eq__(self, other):
+        return type(other) is type(self) and tuple(other) == tuple(self)
+
+    def __repr__(self):
+        values = ", ".join(f"{column}={getattr(self, column)!r}" for column in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+
+def row_type(table, columns):
+    """زیرکلاس Row برای ستون‌های columns، مثلا BookAuthorsRow"""
+    name = "".join(part.title() for part in table.split("_")) + "Row"
+    return type(name, (Row,), {"__slots__": tuple(columns)})
+
+
+class Repository:
+    """خواندن، جستجو و نوشتن ردیف‌های یک جدول"""
+
+    def __init__(self, table, columns, lookups=None, relation=None):
+        self.table = table
+        # کوئری‌های خواندن به جای کل جدول از relation می‌خوانند (زیرکوئری با نام همان جدول)
+        self.relation = relation or table
+        self.partial = relation is not None
+        # ستون‌های قابل نوشتن (بدون id) به ترتیب فرم‌ها و فایل‌ها
+        self.columns = tuple(columns)
+        # کلید خارجی -> جدولی که نامش به جای id نمایش داده می‌شود، مثلا {"book_id": "books"}
+        self.lookups = lookups or {}
+        self.db_columns = ("id",) + self.columns
+        self.row_columns = self.db_columns + tuple(f"{column}_name" for column in self.lookups)
+        self.select_list = ", ".join(self.db_columns)
+        # همه ردیف‌هایی که این Repository برمی‌گرداند از این نوع هستند
+        self.row_type = row_type(table, self.row_columns)
+
+    def to_rows(self, rows):
+        return [self.row_type(*row) for row in rows]
+
+    # --- کوئری‌های خواندن ---
+    def page_query(self):
+        """SELECT پایه جدول؛ نام کلیدهای خارجی با LEFT JOIN به انتهای ردیف اضافه می‌شوند"""
+        if not self.lookups:
+            return f"SELECT {self.select_list} FROM {self.relation}"
+        columns = [f"{self.table}.{column}" for column in self.db_columns]
+        joins = []
+        for column, table in self.lookups.items():
+            alias = f"{column}_ref"
+            columns.append(f"{NAME_COLUMNS[table].format(t=alias)} AS {column}_name")
+            joins.append(f"LEFT JOIN {table} AS {alias} ON {alias}.id = {self.table}.{column}")
+        return f"SELECT {', '.join(columns)} FROM {self.relation} {' '.join(joins)}"
+
+    def search_query(self, keyword):
+        """(query, params) جستجوی keyword؛ نتیجه مرتب بر اساس شباهت و حداکثر SEARCH_LIMIT ردیف"""
+        return SEARCHES[self.table](keyword)
+
+    def source(self, filters=None, search=None):
+        """(query, params) ردیف‌های جدول یا نتیجه جستجوی search با فیلترهای ستون‌ها (db.filter_query)"""
+        query, params = search or (self.page_query(), ())
+        if search:
+            # ستون‌های نتیجه جستجو نام ندارند؛ همان نام‌های row_columns به آن‌ها داده می‌شود
+            query = f"SELECT * FROM ({query}) AS page({', '.join(self.row_columns)})"
+        return filter_query(query, params, filters or {})
+
+    def page(self, conn, limit, source=None, **keyset):
+        """یک صفحه keyset از source (پیش‌فرض: کل جدول)؛ keyset همان آرگومان‌های db.keyset_page است"""
+        query, params = keyset_page(*(source or self.source()), limit, **keyset)
+        with conn.cursor() as cur:
+            execute_prepared(cur, statement_name(f"{self.table}_page", query), query, params)
+            return self.to_rows(cur.fetchall())
+
+    def rows(self, conn, source, sort_column=None, descending=False):
+        """همه ردیف‌های source (مثلا نتیجه جستجو) به ترتیب خودش یا sort_column"""
+        query = sorted_query(source[0], sort_column, descending)
+        with conn.cursor() as cur:
+            execute_prepared(cur, statement_name(f"{self.table}_rows", query), query, source[1])
+            return self.to_rows(cur.fetchall())
+
+    def estimate(self, conn, source=None):
+        """تخمین تعداد ردیف‌های جدول (از آمار) یا source (از EXPLAIN) بدون COUNT(*)"""
+        with conn.cursor() as cur:
+            if source is None and self.partial:
+                source = self.source()
+            if source is None:
+                return estimate_table_rows(cur, self.table)
+            return estimate_query_rows(cur, *source)
+
+    def get_many(self, conn, ids, source=None):
+        """ردیف‌های ids (فقط آن‌هایی که در source هستند)"""
+        query, params = source or self.source()
+        query = f"SELECT * FROM ({query}) AS page WHERE page.id = ANY(%s) ORDER BY page.id"
+        with conn.cursor() as cur:
+            execute_prepared(cur, statement_name(f"{self.table}_get", query), query, (*params, list(ids)))
+            return self.to_rows(cur.fetchall())
+
+    def resolve_names(self, conn, rows):
+        """Row های کامل از ردیف‌های خام جدول (مثلا نتیجه RETURNING) با نام کلیدهای خارجی از name_cache"""
+        if not self.lookups:
+            return self.to_rows(rows)
+        resolved = []
+        for column, table in self.lookups.items():
+            index = self.db_columns.index(column)
+            resolved.append((index, name_cache.resolve(conn, table, [row[index] for row in rows])))
+        return [self.row_type(*row, *(names.get(row[index]) for index, names in resolved)) for row in rows]
+
+    # --- نوشتن ---
+    def insert(self, conn, values):
+        """درج یک ردیف (values به ترتیب columns) و برگرداندن ردیف کامل"""
+        with conn.cursor() as cur:
+            execute_prepared(cur, f"{self.table}_insert", f"""
+                INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES ({', '.join(['%s'] * len(self.columns))})
+                RETURNING {self.select_list}
+            """, tuple(values))
+            row = cur.fetchone()
+        return self.resolve_names(conn, [row])[0]
+
+    def insert_many(self, conn, rows):
+        """درج همه ردیف‌ها در یک تراکنش (هر BATCH_SIZE ردیف با یک INSERT) و برگرداندن ردیف‌های کامل"""
+        inserted = []
+        with conn, conn.cursor() as cur:
+            for start in range(0, len(rows), BATCH_SIZE):
+                inserted += execute_values(cur, f"""
+                    INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES %s RETURNING {self.select_list}
+                """, [tuple(row) for row in rows[start:start + BATCH_SIZE]], page_size=BATCH_SIZE, fetch=True)
+        return self.resolve_names(conn, inserted)
+
+    def update(self, conn, item_id, values):
+        """ویرایش ردیف item_id (values به ترتیب columns)؛ None اگر ردیف وجود نداشته باشد"""
+        assignments = ", ".join(f"{column}=%s" for column in self.columns)
+        with conn.cursor() as cur:
+            execute_prepared(cur, f"{self.table}_update",
+                             f"UPDATE {self.table} SET {assignments} WHERE id=%s RETURNING {self.select_list}",
+                             (*values, item_id))
+            row = cur.fetchone()
+        return self.resolve_names(conn, [row])[0] if row is not None else None
+
+    def update_many(self, conn, changes):
+        """ویرایش گروهی: changes لیست (id, values) است؛ همه در یک تراکنش و با دسته‌های BATCH_SIZE تایی"""
+        assignments = ", ".join(f"{column}=%s" for column in self.columns)
+        with conn, conn.cursor() as cur:
+            execute_batch(cur, f"UPDATE {self.table} SET {assignments} WHERE id=%s",
+                          [(*values, item_id) for item_id, values in changes], page_size=BATCH_SIZE)
+
+    def update_column(self, conn, ids, column, value):
+        """گذاشتن value در column همه ردیف‌های ids با یک UPDATE و برگرداندن ردیف‌های به‌روزشده"""
+        if column not in self.columns:
+            raise ValueError(f"Unknown column for {self.table}: {column}")
+        with conn.cursor() as cur:
+            execute_prepared(cur, f"{self.table}_set_{column}",
+                             f"UPDATE {self.table} SET {column} = %s WHERE id = ANY(%s) RETURNING {self.select_list}",
+                             (value, list(ids)))
+            rows = cur.fetchall()
+        return self.resolve_names(conn, rows)
+
+    def delete(self, conn, ids):
+        """حذف ردیف‌های ids با یک DELETE و برگرداندن تعداد ردیف‌های حذف‌شده"""
+        with conn.cursor() as cur:
+            execute_prepared(cur, f"{self.table}_delete", f"DELETE FROM {self.table} WHERE id = ANY(%s)", (list(ids),))
+            return cur.rowcount
+
+    def delete_impact(self, conn, ids):
+        """dict از جدول -> تعداد ردیف‌هایی که حذف ids با ON DELETE CASCADE از آن پاک می‌کند (در یک کوئری)"""
+        references = referencing_columns(self.table)
+        if not references:
+            return {}
+        counts = ", ".join(f"(SELECT count(*) FROM {table} WHERE {column} = ANY(%(ids)s))"
+                           for table, column in references)
+        with conn.cursor() as cur:
+            execute_prepared(cur, f"{self.table}_delete_impact", f"SELECT {counts}", {"ids": list(ids)})
+            return {table: count for (table, _), count in zip(references, cur.fetchone()) if count}
+
+
+class BorrowingsRepository(Repository):
+    """امانت‌ها؛ امانت باز جدید از مسیر تراکنشی circulation (با بررسی موجودی) ثبت می‌شود
+
+    ستون‌های ردیف‌های circulation (BORROWING_COLUMNS) همان db_columns این جدول هستند. status همیشه با
+    حروف کوچک ذخیره می‌شود (CHECK migration 2) و امانت برگشت‌خورده بدون return_date تاریخ امروز را می‌گیرد.
+    """
+
+    def _normalized(self, values):
+        values = list(values)
+        status = self.columns.index("status")
+        return_date = self.columns.index("return_date")
+        if isinstance(values[status], str):
+            values[status] = values[status].strip().lower()
+        if values[status] == RETURNED and not values[return_date]:
+            values[return_date] = date.today()
+        return values
+
+    def insert(self, conn, values):
+        """درج یک امانت (مثل insert_many: امانت باز از مسیر checkout)"""
+        values = self._normalized(values)
+        if values[4] == BORROWED:
+            return self.checkout(conn, int(values[1]), [int(values[0])], values[2] or None)[0]
+        return super().insert(conn, values)
+
+    def update(self, conn, item_id, values):
+        return super().update(conn, item_id, self._normalized(values))
+
+    def update_many(self, conn, changes):
+        super().update_many(conn, [(item_id, self._normalized(values)) for item_id, values in changes])
+
+    def update_column(self, conn, ids, column, value):
+        """مثل Repository.update_column؛ تغییر status تاریخ بازگشت را هم در همان UPDATE درست می‌کند
+
+        returned: return_date خالی تاریخ امروز می‌شود؛ borrowed: return_date پاک می‌شود.
+        """
+        if column != "status":
+            return super().update_column(conn, ids, column, value)
+        value = value.strip().lower() if isinstance(value, str) else value
+        with conn.cursor() as cur:
+            execute_prepared(cur, f"{self.table}_set_status", f"""
+                UPDATE {self.table} SET status = %(status)s::text,
+                    return_date = CASE WHEN %(status)s = '{RETURNED}' THEN coalesce(return_date, CURRENT_DATE) END
+                WHERE id = ANY(%(ids)s) RETURNING {self.select_list}
+            """, {"status": value, "ids": list(ids)})
+            rows = cur.fetchall()
+        return self.resolve_names(conn, rows)
+
+    def insert_many(self, conn, rows):
+        """درج سابقه امانت‌ها در یک تراکنش و امانت‌های باز هر شخص در تراکنش خودش
+
+        ردیف‌های برگشتی اول سابقه‌ها و بعد امانت‌های باز هستند (نه به ترتیب rows).
+        """
+        rows = [self._normalized(row) for row in rows]
+        # سابقه امانت‌های قدیمی (برگشت‌خورده) مستقیم ثبت می‌شود و روی موجودی اثری ندارد
+        history = [row for row in rows if row[4] != BORROWED]
+        inserted = super().insert_many(conn, history) if history else []
+        # امانت‌های باز هر شخص (و هر تاریخ امانت) با هم در یک تراکنش
+        loans = sorted((row for row in rows if row[4] == BORROWED),
+                       key=lambda row: (int(row[1]), str(row[2] or "")))
+        for (person_id, borrow_date), group in groupby(loans, key=lambda row: (int(row[1]), row[2] or None)):
+            inserted += self.checkout(conn, person_id, [int(row[0]) for row in group], borrow_date)
+        return inserted
+
+    def recent(self, days=RECENT_LOAN_DAYS):
+        """همین جدول فقط با امانت‌های days روز اخیر
+
+        borrowings بر اساس borrow_date پارتیشن شده است (archive.py)؛ فقط partition های همین روزها خوانده
+        می‌شوند و صفحه‌بندی keyset با Merge Append روی ایندکس هر partition انجام می‌شود. امانت‌های باز قدیمی‌تر
+        در این نما نیستند: شرط OR جلوی حذف partition ها را می‌گیرد و با UNION ALL، PostgreSQL دیگر Merge Append
+        نمی‌سازد و هر صفحه همه امانت‌های اخیر را مرتب می‌کند. آن‌ها با Show older loans، گزارش دیرکردها و
+        جستجو پیدا می‌شوند.
+        """
+        relation = f"""(
+            SELECT {self.select_list} FROM {self.table} WHERE borrow_date >= CURRENT_DATE - {int(days)}
+        ) AS {self.table}"""
+        return BorrowingsRepository(self.table, self.columns, self.lookups, relation)
+
+    def checkout(self, conn, person_id, book_ids, borrow_date=None):
+        """امانت دادن همه book_ids به شخص در یک تراکنش (circulation.checkout_many)"""
+        return self.resolve_names(conn, checkout_many(conn, person_id, book_ids, borrow_date))
+
+    def return_loan(self, conn, borrowing_id, return_date=None):
+        """ثبت بازگشت یک امانت باز و برگرداندن ردیف به‌روزشده"""
+        return self.resolve_names(conn, [return_book(conn, borrowing_id, return_date)])[0]
+
+
+REPOSITORIES = {
+    "books": Repository("books", ("name", "publish_date", "description", "number_of_books", "language")),
+    "authors": Repository("authors", ("first_name", "last_name", "start_of_activity", "language")),
+    "publishers": Repository("publishers", ("name", "address")),
+    "genres": Repository("genres", ("name",)),
+    "people": Repository("people", ("first_name", "last_name", "email", "phone", "address")),
+    "book_authors": Repository("book_authors", ("book_id", "author_id"),
+                               {"book_id": "books", "author_id": "authors"}),
+    "book_genres": Repository("book_genres", ("book_id", "genre_id"),
+                              {"book_id": "books", "genre_id": "genres"}),
+    "book_publishers": Repository("book_publishers", ("book_id", "publisher_id"),
+                                  {"book_id": "books", "publisher_id": "publishers"}),
+    "borrowings": BorrowingsRepository("borrowings", ("book_id", "person_id", "borrow_date", "return_date", "status"),
+                                       {"book_id": "books", "person_id": "people"}),
+}
+
+
+def referencing_columns(table):
+    """(جدول، ستون) کلیدهای خارجی که به table اشاره می‌کنند؛ همه در setup_db.py با ON DELETE CASCADE هستند"""
+    return [(repository.table, column) for repository in REPOSITORIES.values()
+            for column, lookup_table in repository.lookups.items() if lookup_table == table]
@@ -0,0 +1,232 @@
+import re
+
+# --- کوئری‌های جستجو ---
+# هر تابع یک (query, params) برمی‌گرداند که شرط‌هایش با ایندکس‌های setup_db.py جواب داده می‌شوند:
+# کلمه عددی  -> تطابق دقیق روی id / کلید خارجی (ایندکس btree)
+# متن         -> full-text روی ستون search_vector و شباهت trigram روی نام‌ها (ایندکس GIN)
+# نتایج بر اساس میزان شباهت مرتب می‌شوند و حداکثر SEARCH_LIMIT ردیف برمی‌گردد.
+SEARCH_LIMIT = 500
+
+
+def prefix_tsquery(keyword):
+    """تبدیل کلمه جستجو به tsquery پیشوندی، مثلا 'tolk ring' -> 'tolk:* & ring:*'"""
+    words = re.findall(r"\w+", keyword)
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def search_books(keyword):
+    if keyword.isdigit():
+        return """
+        SELECT id, name, publish_date, description, number_of_books, language
+        FROM books
+        WHERE id = %s
+        """, (int(keyword),)
+    query = """
+    SELECT id, name, publish_date, description, number_of_books, language
+    FROM books
+    WHERE search_vector @@ to_tsquery('simple', %s) OR %s <%% name
+    ORDER BY ts_rank(search_vector, to_tsquery('simple', %s)) + word_similarity(%s, name) DESC, id
+    LIMIT %s
+    """
+    tsquery = prefix_tsquery(keyword)
+    return query, (tsquery, keyword, tsquery, keyword, SEARCH_LIMIT)
+
+
+def search_authors(keyword):
+    if keyword.isdigit():
+        return """
+        SELECT id, first_name, last_name, start_of_activity, language
+        FROM authors
+        WHERE id = %s
+        """, (int(keyword),)
+    query = """
+    SELECT id, first_name, last_name, start_of_activity, language
+    FROM authors
+    WHERE search_vector @@ to_tsquery('simple', %s) OR %s <%% (first_name || ' ' || last_name)
+    ORDER BY word_similarity(%s, first_name || ' ' || last_name) DESC, id
+    LIMIT %s
+    """
+    tsquery = prefix_tsquery(keyword)
+    return query, (tsquery, keyword, keyword, SEARCH_LIMIT)
+
+
+def search_publishers(keyword):
+    if keyword.isdigit():
+        return "SELECT id, name, address FROM publishers WHERE id = %s", (int(keyword),)
+    query = """
+    SELECT id, name, address FROM publishers
+    WHERE %s <%% name OR address ILIKE %s
+    ORDER BY word_similarity(%s, name) DESC, id
+    LIMIT %s
+    """
+    return query, (keyword, f"%{keyword}%", keyword, SEARCH_LIMIT)
+
+
+def search_genres(keyword):
+    if keyword.isdigit():
+        return "SELECT id, name FROM genres WHERE id = %s", (int(keyword),)
+    query = """
+    SELECT id, name FROM genres
+    WHERE name ILIKE %s OR %s <%% name
+    ORDER BY word_similarity(%s, name) DESC, id
+    LIMIT %s
+    """
+    return query, (f"%{keyword}%", keyword, keyword, SEARCH_LIMIT)
+
+
+def search_people(keyword):
+    if keyword.isdigit():
+        # شماره تلفن هم عددی است؛ هر دو شرط ایندکس دارند
+        return """
+        SELECT id, first_name, last_name, email, phone, address
+        FROM people
+        WHERE id = %s OR phone LIKE %s
+        ORDER BY id
+        LIMIT %s
+        """, (int(keyword), f"%{keyword}%", SEARCH_LIMIT)
+    query = """
+    SELECT id, first_name, last_name, email, phone, address
+    FROM people
+    WHERE search_vector @@ to_tsquery('simple', %s) OR email ILIKE %s
+       OR %s <%% (first_name || ' ' || last_name)
+    ORDER BY word_similarity(%s, first_name || ' ' || last_name) DESC, id
+    LIMIT %s
+    """
+    tsquery = prefix_tsquery(keyword)
+    return query, (tsquery, f"%{keyword}%", keyword, keyword, SEARCH_LIMIT)
+
+
+def search_book_authors(keyword):
+    if keyword.isdigit():
+        value = int(keyword)
+        return """
+        SELECT ba.id, ba.book_id, ba.author_id, b.name, a.first_name || ' ' || a.last_name AS author
+        FROM book_authors ba
+        JOIN books b ON ba.book_id = b.id
+        JOIN authors a ON ba.author_id = a.id
+        WHERE ba.id = %s OR ba.book_id = %s OR ba.author_id = %s
+        ORDER BY ba.id
+        LIMIT %s
+        """, (value, value, value, SEARCH_LIMIT)
+    # OR روی دو جدول مختلف ایندکس نمی‌خورد؛ هر طرف جدا پیدا و با UNION ترکیب می‌شود
+    return """
+    SELECT ba.id, ba.book_id, ba.author_id, b.name, a.first_name || ' ' || a.last_name AS author
+    FROM book_authors ba
+    JOIN books b ON ba.book_id = b.id
+    JOIN authors a ON ba.author_id = a.id
+    WHERE ba.id IN (
+        SELECT x.id FROM book_authors x JOIN books xb ON x.book_id = xb.id WHERE %s <%% xb.name
+        UNION
+        SELECT x.id FROM book_authors x JOIN authors xa ON x.author_id = xa.id
+        WHERE %s <%% (xa.first_name || ' ' || xa.last_name)
+    )
+    ORDER BY greatest(word_similarity(%s, b.name), word_similarity(%s, a.first_name || ' ' || a.last_name)) DESC, ba.id
+    LIMIT %s
+    """, (keyword, keyword, keyword, keyword, SEARCH_LIMIT)
+
+
+def search_book_genres(keyword):
+    if keyword.isdigit():
+        value = int(keyword)
+        return """
+        SELECT bg.id, bg.book_id, bg.genre_id, b.name, g.name
+        FROM book_genres bg
+        JOIN books b ON bg.book_id = b.id
+        JOIN genres g ON bg.genre_id = g.id
+        WHERE bg.id = %s OR bg.book_id = %s OR bg.genre_id = %s
+        ORDER BY bg.id
+        LIMIT %s
+        """, (value, value, value, SEARCH_LIMIT)
+    return """
+    SELECT bg.id, bg.book_id, bg.genre_id, b.name, g.name
+    FROM book_genres bg
+    JOIN books b ON bg.book_id = b.id
+    JOIN genres g ON bg.genre_id = g.id
+    WHERE bg.id IN (
+        SELECT x.id FROM book_genres x JOIN books xb ON x.book_id = xb.id WHERE %s <%% xb.name
+        UNION
+        SELECT x.id FROM book_genres x JOIN genres xg ON x.genre_id = xg.id WHERE xg.name ILIKE %s
+    )
+    ORDER BY word_similarity(%s, b.name) DESC, bg.id
+    LIMIT %s
+    """, (keyword, f"%{keyword}%", keyword, SEARCH_LIMIT)
+
+
+def search_book_publishers(keyword):
+    if keyword.isdigit():
+        value = int(keyword)
+        return """
+        SELECT bp.id, bp.book_id, bp.publisher_id, b.name, p.name
+        FROM book_publishers bp
+        JOIN books b ON bp.book_id = b.id
+        JOIN publishers p ON bp.publisher_id = p.id
+        WHERE bp.id = %s OR bp.book_id = %s OR bp.publisher_id = %s
+        ORDER BY bp.id
+        LIMIT %s
+        """, (value, value, value, SEARCH_LIMIT)
+    return """
+    SELECT bp.id, bp.book_id, bp.publisher_id, b.name, p.name
+    FROM book_publishers bp
+    JOIN books b ON bp.book_id = b.id
+    JOIN publishers p ON bp.publisher_id = p.id
+    WHERE bp.id IN (
+        SELECT x.id FROM book_publishers x JOIN books xb ON x.book_id = xb.id WHERE %s <%% xb.name
+        UNION
+        SELECT x.id FROM book_publishers x JOIN publishers xp ON x.publisher_id = xp.id WHERE %s <%% xp.name
+    )
+    ORDER BY greatest(word_similarity(%s, b.name), word_similarity(%s, p.name)) DESC, bp.id
+    LIMIT %s
+    """, (keyword, keyword, keyword, keyword, SEARCH_LIMIT)
+
+
+# نام کتاب و شخص هر امانت، هم‌شکل با ردیف‌های صفحه Borrowings
+_BORROWING_NAMES = """
+    SELECT br.id, br.book_id, br.person_id, br.borrow_date, br.return_date, br.status,
+           b.name, p.first_name || ' ' || p.last_name
+    FROM ({matches}) AS br
+    JOIN books b ON br.book_id = b.id
+    JOIN people p ON br.person_id = p.id
+    ORDER BY br.id DESC
+"""
+
+
+def search_borrowings(keyword):
+    if keyword.isdigit():
+        value = int(keyword)
+        return _BORROWING_NAMES.format(matches="""
+        SELECT id, book_id, person_id, borrow_date, return_date, status
+        FROM borrowings
+        WHERE id = %s OR book_id = %s OR person_id = %s
+        ORDER BY id DESC
+        LIMIT %s
+        """), (value, value, value, SEARCH_LIMIT)
+    # به جای book_id::TEXT، نام کتاب/شخص از طریق ایندکس trigram پیدا می‌شود
+    return _BORROWING_NAMES.format(matches="""
+    SELECT id, book_id, person_id, borrow_date, return_date, status
+    FROM borrowings
+    WHERE status = lower(%s)
+    UNION
+    SELECT id, book_id, person_id, borrow_date, return_date, status
+    FROM borrowings
+    WHERE book_id IN (SELECT id FROM books WHERE %s <%% name)
+    UNION
+    SELECT id, book_id, person_id, borrow_date, return_date, status
+    FROM borrowings
+    WHERE person_id IN (SELECT id FROM people WHERE %s <%% (first_name || ' ' || last_name))
+    ORDER BY id DESC
+    LIMIT %s
+    """), (keyword, keyword, keyword, SEARCH_LIMIT)
+
+
+# برای بررسی پلن کوئری‌ها در setup_db.py
+SEARCHES = {
+    "books": search_books,
+    "authors": search_authors,
+    "publishers": search_publishers,
+    "genres": search_genres,
+    "people": search_people,
+    "book_authors": search_book_authors,
+    "book_genres": search_book_genres,
+    "book_publishers": search_book_publishers,
+    "borrowings": search_borrowings,
+}
@@ -1,13 +1,516 @@
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+import argparse
 import getpass
+import re
+import time
+from datetime import date
 
-# تنظیمات دیتابیس
-DB_NAME = "DB NAME"
-USER = "USERNAME"
-PASSWORD = "PASSWORD"
-HOST = "HOST"
-PORT = "PORT"
+from archive import (BORROWINGS_DEFAULT_PARTITION, PARTITION_HISTORY_YEARS, PARTITION_YEARS_AHEAD,
+                     ensure_partitions)
+from circulation import BORROWED, RETURNED
+from db import CHANGES_CHANNEL, SORT_COLUMNS
+from lookups import PREFIX_COLUMNS
+from reports import REPORTS, view_name
+from search import SEARCHES
+
+# جدول‌هایی که تغییراتشان با NOTIFY به بقیه کلاینت‌ها خبر داده می‌شود
+NOTIFY_TABLES = ("genres", "publishers", "authors", "books", "people",
+                 "book_authors", "book_genres", "book_publishers", "borrowings")
+
+# تنظیمات دیتابیس (مشترک با برنامه اصلی در db.py)
+from db import DB_NAME, USER, PASSWORD, HOST, PORT
+
+# --- migration ها ---
+# تغییرات schema روی دیتابیس‌های موجود (و پر) فقط با migration جدید در انتهای MIGRATIONS اضافه می‌شوند.
+# هر migration یک بار اجرا و در schema_migrations ثبت می‌شود؛ دستورهایش idempotent هستند تا اگر وسط کار
+# قطع شد، اجرای دوباره از همان‌جا ادامه دهد. ایندکس‌ها با CREATE INDEX CONCURRENTLY ساخته می‌شوند که
+# نوشتن‌ها را قفل نمی‌کند، و constraint ها اول NOT VALID اضافه و بعد جدا VALIDATE می‌شوند.
+# همه کلاینت‌های setup با همین advisory lock مطمئن می‌شوند فقط یکی migration ها را اجرا می‌کند
+MIGRATION_LOCK_ID = 4022
+# دستوری که قفل جدول لازم دارد پشت کوئری‌های طولانی صف نمی‌کشد (و بقیه را پشت خودش نگه نمی‌دارد)
+MIGRATION_LOCK_TIMEOUT = "5s"
+# ردیف‌هایی که پر کردن یک ستون تازه (_backfill) در هر تراکنش به‌روز می‌کند
+BACKFILL_BATCH_SIZE = 10000
+# حداکثر id هایی که برای هر وضعیت ناشناخته امانت در پیام خطای migration نشان داده می‌شود
+UNKNOWN_STATUS_SAMPLE_IDS = 5
+
+
+def _add_constraint(table, name, definition):
+    """ADD CONSTRAINT ... NOT VALID فقط اگر constraint وجود نداشته باشد (بدون بررسی ردیف‌های موجود)"""
+    return f"""
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = '{name}') THEN
+                ALTER TABLE {table} ADD CONSTRAINT {name} {definition} NOT VALID;
+            END IF;
+        END $$
+    """
+
+
+def _reject_unknown_statuses(cur):
+    """بررسی وضعیت‌های امانت غیر از borrowed/returned؛ اگر باشند migration با فهرست آن‌ها متوقف می‌شود"""
+    cur.execute(f"""
+        SELECT status, count(*), (array_agg(id ORDER BY id))[1:{UNKNOWN_STATUS_SAMPLE_IDS}]
+        FROM borrowings WHERE status NOT IN (%s, %s) GROUP BY status ORDER BY count(*) DESC;
+    """, (BORROWED, RETURNED))
+    unknown = cur.fetchall()
+    if unknown:
+        # بدون این بررسی VALIDATE فقط می‌گوید یک ردیف constraint را نقض می‌کند
+        lines = [f"   '{status}': {count} loan(s), e.g. id {', '.join(map(str, ids))}"
+                 for status, count, ids in unknown]
+        raise RuntimeError(
+            f"borrowings has status values other than '{BORROWED}' and '{RETURNED}':\n" + "\n".join(lines) +
+            f"\n   Update them first, e.g. UPDATE borrowings SET status = '{RETURNED}' WHERE status = '...';")
+
+
+def _partition_borrowings(cur):
+    """تبدیل borrowings به جدول partitioned سالانه بر اساس borrow_date (archive.py) در یک تراکنش
+
+    ردیف‌ها یک بار کپی می‌شوند و جدول در این مدت قفل است. ستون‌ها، constraint ها، ایندکس‌ها و تریگرهای
+    جدول قدیمی روی جدول جدید دوباره ساخته می‌شوند؛ کلید اصلی (id, borrow_date) می‌شود. materialized view
+    های گزارش‌ها حذف و در migration 7 دوباره ساخته می‌شوند.
+    """
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = 'borrowings'::regclass;")
+    if cur.fetchone()[0] == "p":
+        return
+    conn = cur.connection
+    with conn:
+        cur.execute("LOCK TABLE borrowings IN ACCESS EXCLUSIVE MODE;")
+        for name in REPORTS:
+            cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {view_name(name)};")
+        cur.execute("ALTER TABLE borrowings RENAME TO borrowings_unpartitioned;")
+        cur.execute("""
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = 'borrowings_unpartitioned'::regclass AND contype IN ('c', 'f');
+        """)
+        constraints = cur.fetchall()
+        cur.execute("""
+            SELECT indexdef FROM pg_indexes
+            WHERE tablename = 'borrowings_unpartitioned' AND indexname <> 'borrowings_pkey';
+        """)
+        indexes = [row[0] for row in cur.fetchall()]
+        cur.execute("""
+            SELECT pg_get_triggerdef(oid) FROM pg_trigger
+            WHERE tgrelid = 'borrowings_unpartitioned'::regclass AND NOT tgisinternal;
+        """)
+        triggers = [row[0] for row in cur.fetchall()]
+
+        # id همان sequence قبلی را ادامه می‌دهد
+        cur.execute("""
+            CREATE TABLE borrowings (LIKE borrowings_unpartitioned INCLUDING DEFAULTS)
+            PARTITION BY RANGE (borrow_date);
+        """)
+        cur.execute("SELECT min(borrow_date), max(borrow_date) FROM borrowings_unpartitioned;")
+        first, last = cur.fetchone()
+        this_year = date.today().year
+        cur.execute(f"CREATE TABLE {BORROWINGS_DEFAULT_PARTITION} PARTITION OF borrowings DEFAULT;")
+        ensure_partitions(cur, min(this_year - PARTITION_HISTORY_YEARS, first.year if first else this_year),
+                          max(this_year + PARTITION_YEARS_AHEAD, last.year if last else this_year))
+        # بدون تریگرها: موجودی کتاب‌ها و NOTIFY برای همین ردیف‌ها قبلا حساب شده‌اند
+        cur.execute("INSERT INTO borrowings SELECT * FROM borrowings_unpartitioned;")
+        cur.execute("ALTER SEQUENCE borrowings_id_seq OWNED BY NONE;")
+        cur.execute("DROP TABLE borrowings_unpartitioned;")
+        cur.execute("ALTER SEQUENCE borrowings_id_seq OWNED BY borrowings.id;")
+
+        # در جدول partitioned هر کلید یکتا باید ستون partition را هم داشته باشد
+        cur.execute("ALTER TABLE borrowings ADD PRIMARY KEY (id, borrow_date);")
+        for name, definition in constraints:
+            cur.execute(f"ALTER TABLE borrowings ADD CONSTRAINT {name} {definition};")
+        for definition in indexes + triggers:
+            cur.execute(re.sub(r" ON (public\.)?borrowings_unpartitioned ", " ON borrowings ", definition))
+        cur.execute("ANALYZE borrowings;")
+
+
+def _install_change_triggers(cur):
+    """تابع notify_table_change و تریگرهای {table}_notify_change همه NOTIFY_TABLES (هر جدول در یک تراکنش)
+
+    ویرایش books فقط برای ستون‌های فرم‌ها اعلام می‌شود؛ available_copies که هر امانت و بازگشت عوضش
+    می‌کند NOTIFY و ردیف change_log اضافه نمی‌سازد.
+    """
+    conn = cur.connection
+    # نام جدول آرگومان تریگر است؛ TG_TABLE_NAME برای borrowings نام partition را می‌دهد
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger AS $$
+        DECLARE
+            row_id INTEGER;
+        BEGIN
+            -- ورود گروهی به جای NOTIFY هر ردیف، در پایان یک RESYNC برای کل جدول می‌فرستد
+            IF current_setting('library.skip_notify', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                row_id := OLD.id;
+            ELSE
+                row_id := NEW.id;
+            END IF;
+            PERFORM pg_notify('{CHANGES_CHANNEL}',
+                json_build_object('table', TG_ARGV[0], 'op', TG_OP, 'id', row_id)::text);
+            IF (SELECT enabled FROM change_log_settings) THEN
+                INSERT INTO change_log (table_name, op, row_id) VALUES (TG_ARGV[0], TG_OP, row_id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    for table in NOTIFY_TABLES:
+        event = "INSERT OR UPDATE OR DELETE"
+        if table == "books":
+            event = "INSERT OR DELETE OR UPDATE OF name, publish_date, description, number_of_books, language"
+        with conn:
+            cur.execute(f"DROP TRIGGER IF EXISTS {table}_notify_change ON {table};")
+            cur.execute(f"""
+                CREATE TRIGGER {table}_notify_change
+                AFTER {event} ON {table}
+                FOR EACH ROW EXECUTE FUNCTION notify_table_change('{table}');
+            """)
+
+
+def _replace_trigger(table, name, definition):
+    """DROP و CREATE تریگر name در یک رشته؛ دو دستور یک پیام هستند و در یک تراکنش اجرا می‌شوند"""
+    return f"""
+        DROP TRIGGER IF EXISTS {name} ON {table};
+        CREATE TRIGGER {name} {definition}
+    """
+
+
+def _backfill(table, assignments, condition):
+    """UPDATE {table} SET {assignments} برای ردیف‌های condition در دسته‌های BACKFILL_BATCH_SIZE تایی id"""
+    def backfill(cur):
+        cur.execute(f"SELECT min(id), max(id) FROM {table};")
+        first, last = cur.fetchone()
+        if first is None:
+            return
+        # هر دسته تراکنش خودش است (اتصال autocommit) و فقط ردیف‌های همان بازه id را قفل می‌کند؛
+        # بدون NOTIFY برای هر ردیف، وگرنه همه کلاینت‌های باز کل جدول را ردیف به ردیف دوباره می‌خوانند
+        cur.execute("SET library.skip_notify = 'on';")
+        try:
+            for start in range(first, last + 1, BACKFILL_BATCH_SIZE):
+                cur.execute(f"UPDATE {table} SET {assignments} WHERE id >= %s AND id < %s AND {condition};",
+                            (start, start + BACKFILL_BATCH_SIZE))
+        finally:
+            cur.execute("RESET library.skip_notify;")
+
+    backfill.__doc__ = (f"UPDATE {table} SET {assignments} WHERE {condition} "
+                        f"(هر {BACKFILL_BATCH_SIZE} id در یک تراکنش)")
+    return backfill
+
+
+def _search_vector(table, columns):
+    """ستون search_vector جدول table از متن columns که یک تریگر به‌روز نگهش می‌دارد
+
+    ADD COLUMN ... GENERATED ALWAYS AS ... STORED کل جدول را با قفل بازنویسی می‌کند؛ ستون ساده فوری اضافه و
+    ردیف‌های موجود دسته‌ای پر می‌شوند. دیتابیس‌هایی که ستون generated قدیمی را دارند دست نمی‌خورند.
+    """
+    def document(row=""):
+        return " || ' ' || ".join(f"coalesce({row}{column}, '')" for column in columns)
+
+    def add(cur):
+        cur.execute("""
+            SELECT attgenerated FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attname = 'search_vector' AND NOT attisdropped;
+        """, (table,))
+        row = cur.fetchone()
+        if row is not None and row[0] == "s":
+            return
+        with cur.connection:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector;")
+            cur.execute(f"""
+                CREATE OR REPLACE FUNCTION {table}_set_search_vector() RETURNS trigger AS $$
+                BEGIN
+                    NEW.search_vector := to_tsvector('simple', {document("NEW.")});
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql;
+            """)
+            cur.execute(_replace_trigger(table, f"{table}_set_search_vector", f"""
+                BEFORE INSERT OR UPDATE OF {", ".join(columns)} ON {table}
+                FOR EACH ROW EXECUTE FUNCTION {table}_set_search_vector();
+            """))
+        _backfill(table, f"search_vector = to_tsvector('simple', {document()})", "search_vector IS NULL")(cur)
+
+    add.__doc__ = (f"ADD COLUMN {table}.search_vector (تریگر to_tsvector از {', '.join(columns)}) "
+                   f"و پر کردن دسته‌ای ردیف‌های موجود")
+    return add
+
+
+def _partitioned_index(name, table, definition):
+    """ایندکس name بدون قفل نوشتن‌ها روی جدولی که ممکن است partitioned باشد (borrowings)
+
+    CREATE INDEX CONCURRENTLY روی جدول partitioned ممکن نیست: ایندکس خالی ON ONLY روی جدول اصلی، CONCURRENTLY
+    روی هر partition و بعد ATTACH؛ partition های بعدی (archive.ensure_partitions) ایندکس را خودکار می‌گیرند.
+    """
+    def create(cur):
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass;", (table,))
+        if cur.fetchone()[0] != "p":
+            statement = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}"
+            _drop_invalid_index(cur, statement)
+            cur.execute(statement)
+            return
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} {definition};")
+        # partition هایی که هنوز ایندکسی زیر name ندارند
+        cur.execute("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass AND NOT EXISTS (
+                SELECT 1 FROM pg_inherits ii JOIN pg_index x ON x.indexrelid = ii.inhrelid
+                WHERE ii.inhparent = %s::regclass AND x.indrelid = c.oid)
+            ORDER BY c.relname;
+        """, (table, name))
+        for (partition,) in cur.fetchall():
+            statement = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}_{partition} ON {partition} {definition}"
+            _drop_invalid_index(cur, statement)
+            cur.execute(statement)
+            cur.execute(f"ALTER INDEX {name} ATTACH PARTITION {name}_{partition};")
+
+    create.__doc__ = (f"CREATE INDEX {name} ON ONLY {table} {definition}، "
+                      f"CREATE INDEX CONCURRENTLY روی هر partition و ATTACH")
+    return create
+
+
+# (نسخه، نام، دستورها) به ترتیب نسخه؛ migration اجراشده هیچ‌وقت عوض نمی‌شود. دستوری که به داده‌ها بستگی
+# دارد به جای SQL یک تابع (cur) است که خودش idempotent است و در dry-run توضیح آن چاپ می‌شود.
+# کل schema (از جدول‌های پایه در migration 0) همین‌جاست و main چیزی جز run_migrations اجرا نمی‌کند.
+MIGRATIONS = (
+    (0, "base tables", (
+        # فعال‌سازی UUID (اختیاری)
+        'CREATE EXTENSION IF NOT EXISTS "uuid-ossp"',
+        """
+        CREATE TABLE IF NOT EXISTS genres (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL UNIQUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS publishers (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(150) NOT NULL,
+            address TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS authors (
+            id SERIAL PRIMARY KEY,
+            first_name VARCHAR(100) NOT NULL,
+            last_name VARCHAR(100) NOT NULL,
+            start_of_activity DATE,
+            language VARCHAR(50)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS books (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(200) NOT NULL,
+            publish_date DATE,
+            description TEXT,
+            number_of_books INTEGER DEFAULT 1,
+            language VARCHAR(50)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS people (
+            id SERIAL PRIMARY KEY,
+            first_name VARCHAR(100) NOT NULL,
+            last_name VARCHAR(100) NOT NULL,
+            email VARCHAR(150),
+            phone VARCHAR(20),
+            address TEXT,
+            is_staff BOOLEAN DEFAULT FALSE,
+            is_active BOOLEAN DEFAULT TRUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS book_authors (
+            id SERIAL PRIMARY KEY,
+            book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+            author_id INTEGER NOT NULL REFERENCES authors(id) ON DELETE CASCADE,
+            UNIQUE(book_id, author_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS book_genres (
+            id SERIAL PRIMARY KEY,
+            book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+            genre_id INTEGER NOT NULL REFERENCES genres(id) ON DELETE CASCADE,
+            UNIQUE(book_id, genre_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS book_publishers (
+            id SERIAL PRIMARY KEY,
+            book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+            publisher_id INTEGER NOT NULL REFERENCES publishers(id) ON DELETE CASCADE,
+            UNIQUE(book_id, publisher_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS borrowings (
+            id SERIAL PRIMARY KEY,
+            book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+            person_id INTEGER NOT NULL REFERENCES people(id) ON DELETE CASCADE,
+            borrow_date DATE NOT NULL DEFAULT CURRENT_DATE,
+            return_date DATE,
+            status VARCHAR(50) NOT NULL DEFAULT 'borrowed'
+        )
+        """,
+    )),
+    (1, "foreign key indexes", (
+        # ستون book_id جدول‌های رابطه ستون اول ایندکس UNIQUE آن‌هاست و ایندکس جدا لازم ندارد
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_book_authors_author_id ON book_authors (author_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_book_genres_genre_id ON book_genres (genre_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_book_publishers_publisher_id ON book_publishers (publisher_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_borrowings_book_id ON borrowings (book_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_borrowings_person_id ON borrowings (person_id)",
+    )),
+    (2, "borrowing status check", (
+        # تریگرهای available_copies فقط دقیقا 'borrowed' را امانت باز حساب می‌کنند
+        "UPDATE borrowings SET status = lower(trim(status)) WHERE status <> lower(trim(status))",
+        _reject_unknown_statuses,
+        _add_constraint("borrowings", "borrowings_status_check", f"CHECK (status IN ('{BORROWED}', '{RETURNED}'))"),
+        "ALTER TABLE borrowings VALIDATE CONSTRAINT borrowings_status_check",
+    )),
+    (3, "partition borrowings by year", (
+        _partition_borrowings,
+    )),
+    (4, "change log", (
+        # نسخه‌های محلی (offline.py) تغییرات را از change_log می‌خوانند؛ xid شماره تراکنش است و همه
+        # تراکنش‌های کمتر از txid_snapshot_xmin تمام شده‌اند، پس هیچ تغییری جا نمی‌ماند
+        """
+        CREATE TABLE IF NOT EXISTS change_log (
+            xid BIGINT NOT NULL DEFAULT txid_current(),
+            table_name TEXT NOT NULL,
+            op TEXT NOT NULL,
+            row_id INTEGER,
+            changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_change_log_xid ON change_log (xid)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_change_log_changed_at ON change_log (changed_at)",
+        # یک ردیف: change_log فقط بعد از اولین همگام‌سازی یک نسخه محلی نوشته می‌شود (enabled) و
+        # pruned_at زمان آخرین حذف تغییرات قدیمی در همگام‌سازی است
+        """
+        CREATE TABLE IF NOT EXISTS change_log_settings (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            enabled BOOLEAN NOT NULL DEFAULT FALSE,
+            pruned_at TIMESTAMPTZ
+        )
+        """,
+        "INSERT INTO change_log_settings DEFAULT VALUES ON CONFLICT (id) DO NOTHING",
+        _install_change_triggers,
+    )),
+    (5, "search indexes", (
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        # ستون‌های full-text (تریگر از روی بقیه ستون‌ها پرشان می‌کند) و ایندکس‌های GIN آن‌ها
+        _search_vector("books", ("name", "description", "language")),
+        _search_vector("authors", ("first_name", "last_name", "language")),
+        _search_vector("people", ("first_name", "last_name", "email")),
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_search ON books USING gin (search_vector)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_authors_search ON authors USING gin (search_vector)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_people_search ON people USING gin (search_vector)",
+        # ایندکس‌های trigram برای شباهت نام‌ها و ILIKE
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_name_trgm ON books USING gin (name gin_trgm_ops)",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_authors_full_name_trgm
+        ON authors USING gin ((first_name || ' ' || last_name) gin_trgm_ops)
+        """,
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_people_full_name_trgm
+        ON people USING gin ((first_name || ' ' || last_name) gin_trgm_ops)
+        """,
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_people_email_trgm ON people USING gin (email gin_trgm_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_people_phone_trgm ON people USING gin (phone gin_trgm_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_publishers_name_trgm ON publishers USING gin (name gin_trgm_ops)",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_publishers_address_trgm
+        ON publishers USING gin (address gin_trgm_ops)
+        """,
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_genres_name_trgm ON genres USING gin (name gin_trgm_ops)",
+        _partitioned_index("idx_borrowings_status", "borrowings", "(status)"),
+        # ایندکس‌های پیشوندی برای انتخاب کلید خارجی در فرم‌ها (LIKE 'abc%' و مرتب‌سازی با همان ایندکس)
+        *(f"""
+          CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_{table}_name_prefix_{i}
+          ON {table} ((lower({column})) COLLATE "C")
+          """
+          for table, columns in PREFIX_COLUMNS.items() for i, column in enumerate(columns, start=1)),
+        # ایندکس‌های (ستون، id) برای مرتب‌سازی با کلیک روی عنوان ستون‌ها و صفحه‌بندی keyset همان ترتیب
+        *(_partitioned_index(f"idx_{table}_{column}_sort", table, f"({column}, id)") if table == "borrowings"
+          else f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_{table}_{column}_sort ON {table} ({column}, id)"
+          for table, columns in SORT_COLUMNS.items() for column in columns),
+    )),
+    (6, "book availability", (
+        "ALTER TABLE books ADD COLUMN IF NOT EXISTS available_copies INTEGER",
+        # کتاب جدید: همه نسخه‌ها موجودند؛ تغییر number_of_books به همان اندازه موجودی را تغییر می‌دهد
+        """
+        CREATE OR REPLACE FUNCTION set_available_copies() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                NEW.available_copies := coalesce(NEW.number_of_books, 0);
+            ELSE
+                NEW.available_copies := OLD.available_copies
+                    + coalesce(NEW.number_of_books, 0) - coalesce(OLD.number_of_books, 0);
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        _replace_trigger("books", "books_set_available_copies", """
+            BEFORE INSERT OR UPDATE OF number_of_books ON books
+            FOR EACH ROW EXECUTE FUNCTION set_available_copies()
+        """),
+        # هر امانت باز یک نسخه کم و هر بازگشت (یا حذف امانت باز) یک نسخه اضافه می‌کند؛ تا پر شدن ستون،
+        # available_copies کتاب‌های قدیمی NULL می‌ماند و پر کردن پایین آن را از امانت‌های باز حساب می‌کند
+        f"""
+        CREATE OR REPLACE FUNCTION track_available_copies() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = '{BORROWED}' THEN
+                UPDATE books SET available_copies = available_copies + 1 WHERE id = OLD.book_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = '{BORROWED}' THEN
+                UPDATE books SET available_copies = available_copies - 1 WHERE id = NEW.book_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # شرط WHEN باعث می‌شود امانت‌های برگشت‌خورده (بیشتر ردیف‌ها) تابع را صدا نزنند
+        _replace_trigger("borrowings", "borrowings_track_copies_insert", f"""
+            AFTER INSERT ON borrowings
+            FOR EACH ROW WHEN (NEW.status = '{BORROWED}') EXECUTE FUNCTION track_available_copies()
+        """),
+        _replace_trigger("borrowings", "borrowings_track_copies_update", f"""
+            AFTER UPDATE OF status, book_id ON borrowings
+            FOR EACH ROW WHEN (OLD.status = '{BORROWED}' OR NEW.status = '{BORROWED}')
+            EXECUTE FUNCTION track_available_copies()
+        """),
+        _replace_trigger("borrowings", "borrowings_track_copies_delete", f"""
+            AFTER DELETE ON borrowings
+            FOR EACH ROW WHEN (OLD.status = '{BORROWED}') EXECUTE FUNCTION track_available_copies()
+        """),
+        _backfill("books", f"""available_copies = coalesce(number_of_books, 0) - (
+            SELECT count(*) FROM borrowings WHERE borrowings.book_id = books.id AND status = '{BORROWED}')""",
+                  "available_copies IS NULL"),
+        # امانت بیش از موجودی در دیتابیس هم رد می‌شود؛ NOT VALID: ردیف‌های قدیمی بررسی نمی‌شوند
+        _add_constraint("books", "books_available_copies_check", "CHECK (available_copies >= 0)"),
+    )),
+    (7, "reports", (
+        # امانت‌های باز/دیرکرد (status)؛ سابقه امانت هر عضو از ایندکس person_id در migration 1 می‌آید
+        _partitioned_index("idx_borrowings_status_return_date", "borrowings", "(status, return_date)"),
+        """
+        CREATE TABLE IF NOT EXISTS report_refreshes (
+            name VARCHAR(100) PRIMARY KEY,
+            refreshed_at TIMESTAMPTZ NOT NULL,
+            duration_ms REAL
+        )
+        """,
+        *(statement for name, (_, _, definition, key, order) in REPORTS.items() for statement in (
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view_name(name)} AS {definition} WITH DATA",
+            # REFRESH ... CONCURRENTLY فقط با یک ایندکس یکتا روی view ممکن است
+            f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {view_name(name)}_key ON {view_name(name)} ({key})",
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {view_name(name)}_order ON {view_name(name)} ({order})",
+            f"INSERT INTO report_refreshes (name, refreshed_at) VALUES ('{name}', now()) ON CONFLICT (name) DO NOTHING",
+        )),
+    )),
+)
+
+_CONCURRENT_INDEX = re.compile(r"CREATE (?:UNIQUE )?INDEX CONCURRENTLY IF NOT EXISTS (\w+)")
 
 def connect_to_database(db_name):
     """اتصال به یک دیتابیس مشخص"""
@@ -58,126 +561,139 @@ def create_database():
     conn.close()
     return True
 
-def create_tables(conn):
-    """ایجاد تمام جداول لازم در دیتابیس"""
-    cur = conn.cursor()
-
-    try:
-        # فعال‌سازی UUID (اختیاری)
-        cur.execute("CREATE EXTENSION IF NOT EXISTS \"uuid-ossp\";")
-
-        # جدول: genres
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS genres (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100) NOT NULL UNIQUE
-            );
-        """)
-
-        # جدول: publishers
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS publishers (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(150) NOT NULL,
-                address TEXT
-            );
-        """)
+def _drop_invalid_index(cur, statement):
+    """CREATE INDEX CONCURRENTLY قطع‌شده یک ایندکس INVALID باقی می‌گذارد که IF NOT EXISTS آن را رد می‌کند"""
+    match = _CONCURRENT_INDEX.search(statement)
+    if not match:
+        return
+    cur.execute("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid;
+    """, (match.group(1),))
+    if cur.fetchone():
+        print(f"   ♻️ Dropping invalid index {match.group(1)} left by an interrupted build")
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)};")
 
-        # جدول: authors
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS authors (
-                id SERIAL PRIMARY KEY,
-                first_name VARCHAR(100) NOT NULL,
-                last_name VARCHAR(100) NOT NULL,
-                start_of_activity DATE,
-                language VARCHAR(50)
-            );
-        """)
+def pending_migrations(cur):
+    """migration هایی که هنوز در schema_migrations ثبت نشده‌اند"""
+    cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        return list(MIGRATIONS)
+    cur.execute("SELECT version FROM schema_migrations;")
+    applied = {row[0] for row in cur.fetchall()}
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
 
-        # جدول: books
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS books (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(200) NOT NULL,
-                publish_date DATE,
-                description TEXT,
-                number_of_books INTEGER DEFAULT 1,
-                language VARCHAR(50)
-            );
-        """)
+def run_migrations(conn, dry_run=False):
+    """اجرای migration های اجرانشده به ترتیب نسخه؛ با dry_run فقط دستورها چاپ می‌شوند
 
-        # جدول: people
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS people (
-                id SERIAL PRIMARY KEY,
-                first_name VARCHAR(100) NOT NULL,
-                last_name VARCHAR(100) NOT NULL,
-                email VARCHAR(150),
-                phone VARCHAR(20),
-                address TEXT,
-                is_staff BOOLEAN DEFAULT FALSE,
-                is_active BOOLEAN DEFAULT TRUE
-            );
-        """)
+    conn باید autocommit باشد: CREATE INDEX CONCURRENTLY داخل تراکنش اجرا نمی‌شود و هر دستور
+    جدا commit می‌شود تا قفل‌ها کوتاه بمانند.
+    """
+    cur = conn.cursor()
+    version, name = None, None
 
-        # جدول: book_authors
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS book_authors (
-                id SERIAL PRIMARY KEY,
-                book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
-                author_id INTEGER NOT NULL REFERENCES authors(id) ON DELETE CASCADE,
-                UNIQUE(book_id, author_id)
-            );
-        """)
+    try:
+        pending = pending_migrations(cur)
+        if not pending:
+            print(f"🟢 Schema is up to date (version {MIGRATIONS[-1][0]}).")
+            return True
+        if dry_run:
+            for version, name, statements in pending:
+                print(f"📝 Migration {version}: {name}")
+                for statement in statements:
+                    if callable(statement):
+                        print("   " + " ".join(statement.__doc__.split()))
+                    else:
+                        print("   " + " ".join(statement.split()) + ";")
+            return True
 
-        # جدول: book_genres
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS book_genres (
-                id SERIAL PRIMARY KEY,
-                book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
-                genre_id INTEGER NOT NULL REFERENCES genres(id) ON DELETE CASCADE,
-                UNIQUE(book_id, genre_id)
-            );
-        """)
+        cur.execute("SELECT pg_try_advisory_lock(%s);", (MIGRATION_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            print("⏳ Another setup is already running the migrations.")
+            return False
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name VARCHAR(200) NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    duration_ms REAL
+                );
+            """)
+            cur.execute("SET lock_timeout = %s;", (MIGRATION_LOCK_TIMEOUT,))
+            # بعد از گرفتن قفل دوباره خوانده می‌شود؛ ممکن است setup دیگری همین الان تمام کرده باشد
+            for version, name, statements in pending_migrations(cur):
+                started = time.perf_counter()
+                for statement in statements:
+                    if callable(statement):
+                        statement(cur)
+                        continue
+                    _drop_invalid_index(cur, statement)
+                    cur.execute(statement)
+                duration = (time.perf_counter() - started) * 1000
+                cur.execute("INSERT INTO schema_migrations (version, name, duration_ms) VALUES (%s, %s, %s);",
+                            (version, name, duration))
+                print(f"✅ Migration {version} ({name}) applied in {duration:.0f} ms.")
+        finally:
+            cur.execute("RESET lock_timeout;")
+            cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
 
-        # جدول: book_publishers
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS book_publishers (
-                id SERIAL PRIMARY KEY,
-                book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
-                publisher_id INTEGER NOT NULL REFERENCES publishers(id) ON DELETE CASCADE,
-                UNIQUE(book_id, publisher_id)
-            );
-        """)
+    except Exception as e:
+        if version is None:
+            print(f"❌ Error running migrations: {e}")
+        else:
+            print(f"❌ Migration {version} ({name}) failed: {e}")
+            print("   Fix the cause and run setup_db.py again; it continues from this migration.")
+        return False
+    finally:
+        cur.close()
 
-        # جدول: borrowings
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS borrowings (
-                id SERIAL PRIMARY KEY,
-                book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
-                person_id INTEGER NOT NULL REFERENCES people(id) ON DELETE CASCADE,
-                borrow_date DATE NOT NULL DEFAULT CURRENT_DATE,
-                return_date DATE,
-                status VARCHAR(50) NOT NULL DEFAULT 'borrowed'
-            );
-        """)
+    return True
 
-        conn.commit()
-        print("✅ All tables are created or already exist.")
+def verify_search_plans(conn):
+    """بررسی اینکه کوئری‌های جستجو از ایندکس استفاده می‌کنند (نه Seq Scan)"""
+    cur = conn.cursor()
+    all_indexed = True
 
+    try:
+        # روی جدول‌های کوچک planner همیشه Seq Scan را انتخاب می‌کند؛
+        # با خاموش کردن آن فقط وقتی Seq Scan می‌بینیم که هیچ ایندکسی قابل استفاده نباشد
+        cur.execute("SET enable_seqscan = off;")
+        for table, build_search in SEARCHES.items():
+            for keyword in ("tolkien", "42"):
+                query, params = build_search(keyword)
+                cur.execute("EXPLAIN " + query, params)
+                plan = "\n".join(row[0] for row in cur.fetchall())
+                if "Seq Scan" in plan:
+                    all_indexed = False
+                    print(f"⚠️ Search on '{table}' for '{keyword}' uses a sequential scan:\n{plan}")
+                else:
+                    print(f"✅ Search on '{table}' for '{keyword}' uses an index.")
     except Exception as e:
-        print(f"❌ Error creating tables: {e}")
-        conn.rollback()
+        print(f"❌ Error checking search plans: {e}")
         return False
     finally:
+        cur.execute("RESET enable_seqscan;")
         cur.close()
 
-    return True
+    return all_indexed
 
 def main():
+    parser = argparse.ArgumentParser(description="Create or upgrade the library database.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only print the migrations that would run on the existing database")
+    args = parser.parse_args()
+
     print("🚀 Library Database Setup Script")
     print("-" * 40)
 
+    if args.dry_run:
+        conn = connect_to_database(DB_NAME)
+        if conn:
+            run_migrations(conn, dry_run=True)
+            conn.close()
+        return
+
     # مرحله ۱: ایجاد دیتابیس (اگر نیست)
     if not create_database():
         print("❌ Database creation failed. Exiting.")
@@ -189,8 +705,9 @@ def main():
         print("❌ Could not connect to the database. Check your credentials or PostgreSQL service.")
         return
 
-    # مرحله ۳: ایجاد جداول
-    if create_tables(conn):
+    # مرحله ۳: جدول‌ها، ایندکس‌ها، تریگرها و گزارش‌ها همه migration هستند (MIGRATIONS)؛ بعد بررسی پلن کوئری‌ها
+    if run_migrations(conn):
+        verify_search_plans(conn)
         print("🎉 Database setup completed successfully!")
     else:
         print("❌ Database setup failed.")